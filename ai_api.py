@@ -1,48 +1,41 @@
-import json
-import os
-import requests
+from modules import gemini_client, knowledge_base, providers
 
-# Constants
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
-
-# Load API key
+# Load API key (read once and kept on the shared client)
 def load_api_key():
-    if not os.path.exists(API_KEY_FILE):
+    api_key = gemini_client.get_client().api_key
+    if not api_key:
         print("Error: Gemini API key file not found.")
-        return None
-    with open(API_KEY_FILE, 'r') as file:
-        keys = json.load(file)
-    return keys.get("gemini_api_key")
+    return api_key
 
-# Generic Gemini API call function
-def query_gemini(prompt_text):
-    api_key = load_api_key()
-    if not api_key:
-        return "Error: Gemini API key is missing. Run installer first."
+# Generic Gemini API call function; pass error_text to try the offline knowledge base first
+def query_gemini(prompt_text, word_limit=None, error_text=None):
+    if error_text and knowledge_base.offline_enabled():
+        entry = knowledge_base.lookup(error_text)
+        if entry:
+            return knowledge_base.format_entry(entry)
 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt_text}
-                ]
-            }
-        ]
-    }
+    try:
+        return providers.get_provider().generate(prompt_text, word_limit=word_limit)
+    except gemini_client.GeminiError as e:
+        return f"Error: {e}"
+
+# Async variant for callers running an event loop: many queries can be awaited at once
+# without a thread each (see GeminiClient.agenerate)
+async def aquery_gemini(prompt_text, word_limit=None, error_text=None):
+    if error_text and knowledge_base.offline_enabled():
+        entry = knowledge_base.lookup(error_text)
+        if entry:
+            return knowledge_base.format_entry(entry)
 
     try:
-        response = requests.post(f"{url}?key={api_key}", headers=headers, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            return result['candidates'][0]['content']['parts'][0]['text']
-        else:
-            return f"API Error {response.status_code}: {response.text}"
+        return await providers.get_provider().agenerate(prompt_text, word_limit=word_limit)
+    except gemini_client.GeminiError as e:
+        return f"Error: {e}"
 
-    except Exception as e:
-        return f"Request failed: {e}"
+# Streaming variant: yields the answer in pieces as they arrive
+def query_gemini_stream(prompt_text, word_limit=None):
+    try:
+        for chunk in providers.get_provider().stream(prompt_text, word_limit=word_limit):
+            yield chunk
+    except gemini_client.GeminiError as e:
+        yield f"Error: {e}"
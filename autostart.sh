@@ -17,7 +17,7 @@ fi
 
 # Add alias for CLI MANAGER if not already added
 if ! grep -q "alias cli=" "$SHELL_CONFIG"; then
-    echo "alias cli='python3 $(pwd)/../cli_manager.py'" >> "$SHELL_CONFIG"
+    echo "alias cli='python3 $(pwd)/../cli_client.py'" >> "$SHELL_CONFIG"
     echo "alias settings='python3 $(pwd)/../cli_manager.py --settings'" >> "$SHELL_CONFIG"
     echo "[+] Aliases 'cli' and 'settings' added to $SHELL_CONFIG"
 else
@@ -0,0 +1,187 @@
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from . import gemini_client, providers, error_explainer, fix_suggester, syntax_corrector, command_explainer, error_signature, prompt_budget, semantic_cache
+
+# Constants
+MODES = {
+    "explain": error_explainer,
+    "fix": fix_suggester,
+    "syntax": syntax_corrector,
+    "usage": command_explainer
+}
+DEFAULT_WORKERS = 8
+
+
+# Parse one input line: plain text, or JSON with "text" and optional "mode"
+def parse_item(line, default_mode):
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith("{"):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return (default_mode, line)
+        text = record.get("text") or record.get("error") or record.get("command")
+        if not text:
+            return None
+        mode = record.get("mode", default_mode)
+        return (mode if mode in MODES else default_mode, str(text))
+    return (default_mode, line)
+
+# Read every item from a text stream
+def read_items(stream, default_mode="explain"):
+    items = []
+    for line in stream:
+        item = parse_item(line, default_mode)
+        if item is not None:
+            items.append(item)
+    return items
+
+# Key used to spot duplicate items; errors that differ only in paths, ports, PIDs etc. collapse
+def dedupe_key(mode, text):
+    if mode == "explain":
+        return (mode, error_signature.fingerprint(text))
+    return (mode, re.sub(r"\s+", " ", text).strip().lower())
+
+# Ask the mode's model route for one item; like the interactive commands, errors and fixes the
+# knowledge base or the similarity cache know, syntax checks that pass locally and commands the
+# local manual covers skip it. The shared client paces requests and retries rate limits and
+# server errors
+def answer_item(mode, text):
+    module = MODES[mode]
+    model = None
+    if mode in ("explain", "fix"):
+        ready = module.ready_answer(text)
+        if ready:
+            return {"output": ready[1]}
+    if mode == "explain":
+        text, _ = prompt_budget.compact(text)
+        model = providers.get_provider(mode).model
+        similar = error_explainer.similar_answer(text, model)
+        if similar:
+            return {"output": similar[1]}
+        prompt = error_explainer.build_prompt(text, compacted=True)
+    elif mode == "syntax":
+        answer, problems = syntax_corrector.precheck(text)
+        if answer:
+            return {"output": answer}
+        prompt = syntax_corrector.build_prompt(text, problems)
+    elif mode == "usage":
+        manual, complete = command_explainer.local_explanation(text)
+        if complete:
+            return {"output": manual}
+        prompt = command_explainer.build_prompt(text, manual)
+    else:
+        prompt = module.build_prompt(text)
+    word_limit = getattr(module, "WORD_LIMIT", None)
+    try:
+        answer = providers.get_provider(mode).generate(prompt, word_limit=word_limit)
+    except gemini_client.GeminiError as e:
+        return {"error": str(e).splitlines()[0]}
+    if model is not None:
+        semantic_cache.remember("error", text, answer, model)
+    return {"output": answer}
+
+# Answer all items concurrently and write one JSON line per input item
+def run_batch(items, workers=DEFAULT_WORKERS, rate=None, order="input", out=None):
+    out = out or sys.stdout
+    unique = {}
+    positions = {}
+    for index, (mode, text) in enumerate(items):
+        key = dedupe_key(mode, text)
+        if key not in unique:
+            unique[key] = (mode, text)
+            positions[key] = []
+        positions[key].append(index)
+
+    if rate is not None:
+        gemini_client.get_client().limiter.set_rate(rate)
+    results = {}
+    next_index = 0
+
+    def emit(index):
+        mode, text = items[index]
+        record = {"index": index, "mode": mode, "input": text}
+        record.update(results[index])
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {
+            pool.submit(answer_item, mode, text): key
+            for key, (mode, text) in unique.items()
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"error": str(e)}
+            for index in positions[key]:
+                results[index] = result
+                if order == "completion":
+                    emit(index)
+            if order != "completion":
+                while next_index in results:
+                    emit(next_index)
+                    next_index += 1
+
+    return {"items": len(items), "unique": len(unique), "errors": sum(1 for r in results.values() if "error" in r)}
+
+# CLI entry point: cli batch [file|-] [-mode M] [-workers N] [-rate N] [-order input|completion]
+def batch_command(args):
+    source = "-"
+    mode = "explain"
+    workers = DEFAULT_WORKERS
+    rate = None
+    order = "input"
+
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        value = args[i + 1] if i + 1 < len(args) else None
+        if arg in ("-mode", "-workers", "-rate", "-order") and value is None:
+            print(f"Missing value for {arg}")
+            return 1
+        if arg == "-mode":
+            if value not in MODES:
+                print(f"Invalid mode: {value}. Choose from {', '.join(MODES)}.")
+                return 1
+            mode = value
+            i += 2
+        elif arg in ("-workers", "-rate"):
+            try:
+                if arg == "-workers":
+                    workers = int(value)
+                else:
+                    rate = float(value)
+            except ValueError:
+                print(f"Invalid number for {arg}: {value}")
+                return 1
+            i += 2
+        elif arg == "-order":
+            if value not in ("input", "completion"):
+                print("Invalid order: use 'input' or 'completion'.")
+                return 1
+            order = value
+            i += 2
+        else:
+            source = arg
+            i += 1
+
+    if source == "-":
+        items = read_items(sys.stdin, mode)
+    else:
+        try:
+            with open(source, 'r') as file:
+                items = read_items(file, mode)
+        except OSError as e:
+            print(f"Error: cannot read {source}: {e.strerror}")
+            return 1
+
+    summary = run_batch(items, workers=workers, rate=rate, order=order)
+    print(f"[+] {summary['items']} item(s), {summary['unique']} unique, {summary['errors']} error(s)", file=sys.stderr)
+    return 1 if summary["errors"] else 0
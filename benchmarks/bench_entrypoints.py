@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of every entry point that reaches Gemini.
+Starts the mock Gemini server, then drives each entry point in fresh
+interpreters against a scratch copy of data/ (so the real cache and history
+are untouched) and prints a JSON report with, per entry point:
+
+  cold    first call in a new process (imports, connection set-up, cache miss)
+  warm    further calls with new prompts over the pooled connection
+  cached  repeated prompts answered from the response cache
+
+plus p50/p95/p99 latency, throughput, error count and peak RSS. Entry points
+that cannot be imported in this installation are reported as skipped.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_POINTS = (
+    "ai_api.query_gemini",
+    "error_explainer.explain_error",
+    "fix_suggester.suggest_fix",
+    "syntax_corrector.correct_command",
+    "command_explainer.explain_command",
+    "GeminiAPI.explain",
+    "CLIManager.run",
+)
+
+# Inputs are numbered so every warm call is a cache miss; none match the offline knowledge base
+INPUTS = {
+    "ai_api.query_gemini": "Summarize what the benchmark widget {n} does",
+    "error_explainer.explain_error": "widgetd: backend handshake rejected (case {n})",
+    "fix_suggester.suggest_fix": "widgetctl --sync --case {n}",
+    "syntax_corrector.correct_command": "widgetctl sync --case={n} --verbos",
+    "command_explainer.explain_command": "widgetctl-{n}",
+    "GeminiAPI.explain": "widgetctl sync --case {n}",
+    "CLIManager.run": "widgetctl sync --case {n}",
+}
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def summarize(timings_ms):
+    if not timings_ms:
+        return None
+    values = sorted(timings_ms)
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.mean(values), 2),
+        "p50_ms": round(percentile(values, 0.50), 2),
+        "p95_ms": round(percentile(values, 0.95), 2),
+        "p99_ms": round(percentile(values, 0.99), 2)
+    }
+
+
+# ---- child process: import one entry point and time calls to it ----
+
+def _capture(function, *args):
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer):
+        result = function(*args)
+    return result if isinstance(result, str) else buffer.getvalue()
+
+def load_entry(name):
+    """Return a callable(text) -> output for an entry point, importing it on the way"""
+    if name == "ai_api.query_gemini":
+        from api import ai_api
+        return lambda text: ai_api.query_gemini(text)
+    if name == "error_explainer.explain_error":
+        from modules import error_explainer
+        return lambda text: _capture(error_explainer.explain_error, text)
+    if name == "fix_suggester.suggest_fix":
+        from modules import fix_suggester
+        return lambda text: _capture(fix_suggester.suggest_fix, text)
+    if name == "syntax_corrector.correct_command":
+        from modules import syntax_corrector
+        return lambda text: _capture(syntax_corrector.correct_command, text)
+    if name == "command_explainer.explain_command":
+        from modules import command_explainer
+        return lambda text: _capture(command_explainer.explain_command, text)
+    if name == "GeminiAPI.explain":
+        from modules.config import Config
+        from modules.gemini_integration import GeminiAPI
+        api = GeminiAPI(Config())
+        return lambda text: api.explain(text)
+    if name == "CLIManager.run":
+        from modules.main import CLIManager
+        manager = CLIManager()
+        return lambda text: _capture(manager.run, ["explain"] + text.split())
+    raise ValueError(f"Unknown entry point: {name}")
+
+def run_child(name, root, iterations, run_id):
+    sys.path.insert(0, root)
+    result = {"entry_point": name}
+    start = time.perf_counter()
+    try:
+        call = load_entry(name)
+    except Exception as e:
+        result["skipped"] = f"{type(e).__name__}: {e}"
+        print(json.dumps(result))
+        return
+    imported = time.perf_counter()
+
+    template = INPUTS[name]
+    errors = 0
+
+    def timed(text):
+        nonlocal errors
+        t0 = time.perf_counter()
+        output = call(text)
+        elapsed = (time.perf_counter() - t0) * 1000
+        if not output or "Error" in output:
+            errors += 1
+        return elapsed
+
+    result["import_ms"] = round((imported - start) * 1000, 2)
+    result["first_call_ms"] = round(timed(template.format(n=f"{run_id}-0")), 2)
+
+    warm = [timed(template.format(n=f"{run_id}-{i}")) for i in range(1, iterations + 1)]
+    warm_total = sum(warm) / 1000
+    cached = [timed(template.format(n=f"{run_id}-{1 + i % max(iterations, 1)}")) for i in range(iterations)]
+
+    result["warm_ms"] = warm
+    result["warm_seconds"] = warm_total
+    result["cached_ms"] = cached
+    result["errors"] = errors
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(result))
+
+
+# ---- parent process: mock server, scratch data directory, aggregation ----
+
+def make_sandbox(stream_output):
+    """Scratch tree whose modules/ and api/ point at the real code and whose data/ is empty"""
+    root = tempfile.mkdtemp(prefix="cli-manager-bench-")
+    for name in ("modules", "api"):
+        source = os.path.join(BASE_DIR, name)
+        if os.path.isdir(source):
+            os.symlink(source, os.path.join(root, name))
+    os.makedirs(os.path.join(root, "data"))
+
+    settings = {}
+    settings_file = os.path.join(BASE_DIR, "data", "settings.json")
+    if os.path.exists(settings_file):
+        with open(settings_file, 'r') as file:
+            settings = json.load(file)
+    settings.update({"cache_enabled": True, "offline_kb": True, "stream_output": stream_output,
+                     "gemini_model": "gemini-2.0-flash", "api_rate_per_minute": 0})
+    with open(os.path.join(root, "data", "settings.json"), 'w') as file:
+        json.dump(settings, file, indent=4)
+    return root
+
+def _run_child(name, root, env, iterations, run_id):
+    t0 = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", name, "--root", root,
+         "--iterations", str(iterations), "--run-id", str(run_id)],
+        stdin=subprocess.DEVNULL, capture_output=True, text=True, env=env, cwd=root
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000
+    try:
+        return json.loads(completed.stdout.strip().splitlines()[-1]), wall_ms
+    except (IndexError, ValueError):
+        lines = completed.stderr.strip().splitlines()
+        return {"failed": lines[-1] if lines else "no output"}, wall_ms
+
+def run_entry_point(name, root, env, iterations, cold_runs):
+    # Cold runs only make the first call, so the process wall time is start-up plus one answer
+    cold, process_ms = [], []
+    errors, peak_rss_kb = 0, 0
+    for run_id in range(cold_runs):
+        child, wall_ms = _run_child(name, root, env, 0, run_id)
+        if "skipped" in child or "failed" in child:
+            return child
+        cold.append(child["import_ms"] + child["first_call_ms"])
+        process_ms.append(wall_ms)
+        errors += child["errors"]
+        peak_rss_kb = max(peak_rss_kb, child["peak_rss_kb"])
+
+    child, _ = _run_child(name, root, env, iterations, cold_runs)
+    if "skipped" in child or "failed" in child:
+        return child
+    warm, cached, warm_seconds = child["warm_ms"], child["cached_ms"], child["warm_seconds"]
+    errors += child["errors"]
+    peak_rss_kb = max(peak_rss_kb, child["peak_rss_kb"])
+
+    return {
+        "cold": summarize(cold),
+        "cold_process_ms": summarize(process_ms),
+        "warm": summarize(warm),
+        "cached": summarize(cached),
+        "throughput_per_s": round(len(warm) / warm_seconds, 1) if warm_seconds else None,
+        "errors": errors,
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Gemini entry points against a mock server")
+    parser.add_argument('--iterations', type=int, default=50, help='Warm and cached calls per entry point')
+    parser.add_argument('--cold-runs', type=int, default=5, help='Fresh processes per entry point')
+    parser.add_argument('--latency-ms', type=float, default=50, help='Mock server base latency')
+    parser.add_argument('--jitter-ms', type=float, default=10, help='Mock server latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock requests that fail')
+    parser.add_argument('--payload-bytes', type=int, default=400, help='Size of each mock answer')
+    parser.add_argument('--stream', action='store_true', help='Enable stream_output for the printing entry points')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the mock server')
+    parser.add_argument('--only', action='append', choices=ENTRY_POINTS, help='Benchmark only this entry point')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--root', help=argparse.SUPPRESS)
+    parser.add_argument('--run-id', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.root, args.iterations, args.run_id)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    from mock_gemini import MockGeminiServer
+
+    server = MockGeminiServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                              payload_bytes=args.payload_bytes, seed=args.seed).start()
+    root = make_sandbox(args.stream)
+    env = dict(os.environ, GEMINI_API_BASE=server.url, GEMINI_API_KEY="benchmark-key", CLI_MANAGER_NO_DAEMON="1")
+    env.pop("PYTHONPATH", None)
+
+    results = {}
+    try:
+        for name in args.only or ENTRY_POINTS:
+            results[name] = run_entry_point(name, root, env, args.iterations, args.cold_runs)
+    finally:
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "benchmark": "entry points",
+        "python": sys.version.split()[0],
+        "server": {
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "payload_bytes": args.payload_bytes,
+            "stream": args.stream,
+            "requests_served": server.requests_served,
+            "errors_served": server.errors_served
+        },
+        "entry_points": results
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for the semantic cache storage format.
+Stores the same answers as JSON lines (the format before record_store) and as
+compressed records, then prints a JSON report of file sizes and the time a
+fresh process needs to load each index.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from modules import semantic_cache, record_store
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stderr_samples.txt')
+
+# Sentences answers are assembled from, so the text repeats the way real explanations do
+SENTENCES = [
+    "This error means that the program could not open the file it was given.",
+    "The command failed because the file or resource it needed was not available.",
+    "Check the path, the permissions and whether the service is running, then retry.",
+    "Make sure you have the right permissions. Try running the command with sudo.",
+    "The package that provides this library is not installed on your system.",
+    "Install it with `sudo apt install` followed by the package name, or use your distribution's package manager.",
+    "Another process is already listening on this port; find it with `ss -ltnp` and stop it.",
+    "The disk is full. Free up space with `du -sh *` to find large directories.",
+    "Your user is not allowed to do this. Add yourself to the right group or ask an administrator.",
+    "The remote host refused the connection, so the service is probably not running.",
+    "**Fix:** run `systemctl status` on the service and read the log with `journalctl -xe`.",
+    "```bash\nsudo systemctl restart nginx\n```",
+]
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.rstrip("\n") for line in file if line.strip()]
+
+def make_answers(corpus, count, seed):
+    rng = random.Random(seed)
+    items = []
+    for number in range(count):
+        error = f"{corpus[number % len(corpus)]} ({number})"
+        answer = f"`{error[:40]}` " + " ".join(rng.sample(SENTENCES, rng.randint(3, 6)))
+        items.append((error, answer))
+    return items
+
+def write_jsonl(path, items, model):
+    with open(path, 'w') as file:
+        for error, answer in items:
+            vector = semantic_cache.vectorize("error", error)
+            record = {"kind": "error", "model": model, "text": error, "answer": answer,
+                      "vector": [[i, round(w, 6)] for i, w in vector.items()], "time": time.time()}
+            file.write(json.dumps(record) + "\n")
+
+def load_jsonl(path):
+    # What every process did before: parse every line, answers included
+    index = {}
+    with open(path, 'rb') as file:
+        for line in file.read().splitlines():
+            record = json.loads(line)
+            vector = {int(i): w for i, w in record["vector"]}
+            index.setdefault((record["kind"], record["model"]), semantic_cache.SemanticIndex()).add(
+                record["text"], record["answer"], vector)
+    return index
+
+def load_records(path):
+    semantic_cache.INDEX_FILE = path
+    semantic_cache._indexes, semantic_cache._offset, semantic_cache._file_id = {}, 0, None
+    semantic_cache._load_new_records()
+    return semantic_cache._indexes
+
+def best_of(function, path, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the semantic cache storage format")
+    parser.add_argument('--entries', type=int, default=2000, help='Stored answers')
+    parser.add_argument('--runs', type=int, default=5, help='Loads timed per format (best is reported)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated answers')
+    args = parser.parse_args()
+
+    items = make_answers(load_corpus(DEFAULT_CORPUS), args.entries, args.seed)
+    model = "gemini-2.0-flash"
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl = os.path.join(directory, "semantic_cache.jsonl")
+        records = os.path.join(directory, "semantic_cache.bin")
+        semantic_cache.LEGACY_FILE = os.path.join(directory, "absent.jsonl")
+        write_jsonl(jsonl, items, model)
+        record_store.append(records, [
+            semantic_cache._pack("error", model, error, answer, semantic_cache.vectorize("error", error))
+            for error, answer in items
+        ])
+        report = {
+            "benchmark": "semantic cache storage",
+            "entries": args.entries,
+            "jsonl_bytes": os.path.getsize(jsonl),
+            "record_bytes": os.path.getsize(records),
+            "jsonl_load_ms": round(best_of(load_jsonl, jsonl, args.runs) * 1000, 2),
+            "record_load_ms": round(best_of(load_records, records, args.runs) * 1000, 2),
+        }
+    report["size_ratio"] = round(report["record_bytes"] / report["jsonl_bytes"], 3)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for error fingerprinting over a corpus of real stderr lines.
+Prints a JSON report: per-call latency percentiles, throughput and how many
+distinct fingerprints the corpus collapses to.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from modules import error_signature
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stderr_samples.txt')
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.rstrip("\n") for line in file if line.strip()]
+
+def percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def run(corpus, iterations):
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for line in corpus:
+            t0 = time.perf_counter()
+            error_signature.fingerprint(line)
+            timings.append(time.perf_counter() - t0)
+    total = time.perf_counter() - start
+
+    timings.sort()
+    fingerprints = {error_signature.fingerprint(line) for line in corpus}
+    return {
+        "benchmark": "error_signature.fingerprint",
+        "samples": len(corpus),
+        "iterations": iterations,
+        "distinct_fingerprints": len(fingerprints),
+        "mean_us": round(statistics.mean(timings) * 1e6, 2),
+        "p50_us": round(percentile(timings, 0.50) * 1e6, 2),
+        "p95_us": round(percentile(timings, 0.95) * 1e6, 2),
+        "p99_us": round(percentile(timings, 0.99) * 1e6, 2),
+        "lines_per_second": round(len(timings) / total)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark error fingerprinting")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS, help='File with one stderr line per row')
+    parser.add_argument('--iterations', type=int, default=200, help='Passes over the corpus')
+    parser.add_argument('--show', action='store_true', help='Print each line with its normalized template')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if args.show:
+        for line in corpus:
+            template, _ = error_signature.normalize_error(line)
+            print(f"{error_signature.fingerprint(line)}  {template}")
+        return
+    print(json.dumps(run(corpus, args.iterations), indent=2))
+
+if __name__ == "__main__":
+    main()
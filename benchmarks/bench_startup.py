@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Startup regression benchmark for cli_manager.py.
+Starts the usage screen in fresh interpreters and fails (exit status 1) when a
+run does not complete normally, when the median cold start goes above a fixed
+budget or when a heavy module such as requests is imported before a subcommand
+needs it.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from modules import startup_profiler
+
+DEFAULT_BUDGET_MS = 150
+# Modules the usage screen must not load; they belong to the commands that use them
+FORBIDDEN_IMPORTS = ("requests", "urllib3", "sqlite3", "modules.gemini_client")
+# The usage screen prints this and exits with status 1
+USAGE_MARKER = "Usage:"
+USAGE_STATUS = 1
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+# Why a run did not complete normally, or None: a missing script or a crash must not
+# pass as a fast start
+def check_run(result, argv):
+    if "Traceback (most recent call last)" in result.stderr:
+        return f"crashed: {result.stderr.strip().splitlines()[-1]}"
+    if not argv:
+        if result.returncode != USAGE_STATUS or USAGE_MARKER not in result.stdout:
+            detail = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "no usage screen"
+            return f"exit status {result.returncode}: {detail}"
+    elif result.returncode != 0:
+        return f"exit status {result.returncode}"
+    return None
+
+# Sorted start times in milliseconds, and the first failed run's error (timing stops there)
+def time_startup(script, argv, runs):
+    env = dict(os.environ, CLI_MANAGER_NO_DAEMON="1")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, script] + argv, stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True, env=env)
+        timings.append((time.perf_counter() - start) * 1000)
+        error = check_run(result, argv)
+        if error:
+            return sorted(timings), error
+    return sorted(timings), None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cli_manager.py cold start")
+    parser.add_argument('--runs', type=int, default=20, help='Number of fresh interpreters to start')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Maximum median start time')
+    parser.add_argument('--script', default=startup_profiler.CLI_MANAGER_SCRIPT, help='Path to cli_manager.py')
+    parser.add_argument('args', nargs='*', help='Arguments passed to cli_manager.py (default: usage screen)')
+    args = parser.parse_args()
+
+    timings, error = time_startup(args.script, args.args, args.runs)
+    profile = startup_profiler.profile_startup(args.args, args.script)
+    imported = set(profile["loaded_modules"])
+    forbidden = sorted(name for name in FORBIDDEN_IMPORTS if name in imported) if not args.args else []
+
+    median = statistics.median(timings)
+    report = {
+        "benchmark": "cli_manager startup",
+        "argv": args.args,
+        "runs": args.runs,
+        "budget_ms": args.budget_ms,
+        "min_ms": round(timings[0], 1),
+        "p50_ms": round(median, 1),
+        "p95_ms": round(percentile(timings, 0.95), 1),
+        "import_ms": profile["import_ms"],
+        "modules_imported": profile["modules_imported"],
+        "slowest_imports": [name for name, _, _, _ in profile["imports"][:5]],
+        "forbidden_imports": forbidden,
+        "error": error,
+        "passed": error is None and median <= args.budget_ms and not forbidden
+    }
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["passed"] else 1)
+
+if __name__ == "__main__":
+    main()
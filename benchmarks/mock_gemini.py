@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the Gemini generateContent endpoint.
+Answers generateContent and streamGenerateContent (server-sent events) with
+configurable latency, jitter, error rate and payload size, so benchmarks can
+exercise the real HTTP path without network access or an API key.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = ("The command failed because the file or resource it needed was not available. "
+          "Check the path, the permissions and whether the service is running, then retry. ")
+STREAM_CHUNKS = 4
+
+
+class MockGeminiServer:
+    """Threaded HTTP server imitating generativelanguage.googleapis.com"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0, jitter_ms=0, error_rate=0.0,
+                 payload_bytes=400, error_status=503, retry_after=None, seed=None):
+        """Bind the server; port 0 picks a free port"""
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.payload_bytes = payload_bytes
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.requests_served = 0
+        self.errors_served = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        """Base URL to export as GEMINI_API_BASE"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1beta"
+
+    def start(self):
+        """Serve requests on a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down and release the port"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def next_response(self):
+        """Pick the delay and outcome for one request"""
+        with self._lock:
+            self.requests_served += 1
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors_served += 1
+        return max(self.latency_ms + jitter, 0) / 1000, failed
+
+    def answer_text(self, prompt):
+        """Build an answer of roughly payload_bytes characters"""
+        text = f"Answer to: {prompt[:60]}\n"
+        while len(text) < self.payload_bytes:
+            text += FILLER
+        return text[:max(self.payload_bytes, 1)]
+
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True  # headers and body are written separately
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status, body, headers=None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+                prompt = body["contents"][0]["parts"][0]["text"]
+            except (ValueError, KeyError, IndexError):
+                self.send_json(400, {"error": {"code": 400, "message": "Invalid JSON payload", "status": "INVALID_ARGUMENT"}})
+                return
+            if "key=" not in self.path:
+                self.send_json(403, {"error": {"code": 403, "message": "API key missing", "status": "PERMISSION_DENIED"}})
+                return
+
+            delay, failed = server.next_response()
+            if delay:
+                time.sleep(delay)
+            if failed:
+                headers = {"Retry-After": str(server.retry_after)} if server.retry_after is not None else None
+                self.send_json(server.error_status, {
+                    "error": {"code": server.error_status, "message": "The model is overloaded.", "status": "UNAVAILABLE"}
+                }, headers)
+                return
+
+            text = server.answer_text(prompt)
+            if ":streamGenerateContent" in self.path:
+                self.send_stream(text)
+            elif ":generateContent" in self.path:
+                self.send_json(200, _candidate(text))
+            else:
+                self.send_json(404, {"error": {"code": 404, "message": "Unknown method", "status": "NOT_FOUND"}})
+
+        def send_stream(self, text):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            size = max(len(text) // STREAM_CHUNKS, 1)
+            for start in range(0, len(text), size):
+                event = f"data: {json.dumps(_candidate(text[start:start + size]))}\r\n\r\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def _candidate(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mock Gemini API server")
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Base response delay')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random +/- variation of the delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with an error')
+    parser.add_argument('--error-status', type=int, default=503, help='HTTP status used for errors')
+    parser.add_argument('--retry-after', type=int, help='Retry-After seconds sent with errors')
+    parser.add_argument('--payload-bytes', type=int, default=400, help='Size of each answer')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible jitter and errors')
+    args = parser.parse_args()
+
+    server = MockGeminiServer(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              error_rate=args.error_rate, payload_bytes=args.payload_bytes,
+                              error_status=args.error_status, retry_after=args.retry_after, seed=args.seed)
+    print(f"Mock Gemini API listening; export GEMINI_API_BASE={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
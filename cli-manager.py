@@ -8,24 +8,39 @@ A smart AI-powered Linux terminal companion
 
 import sys
 import os
-from modules import error_explainer, fix_suggester, syntax_corrector, command_explainer, history_manager, settings_manager
+import importlib
+import threading
+from modules import timings
 
 # Constants
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
-SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+
+# Feature modules are imported by the subcommand that needs them, so the usage
+# screen and cheap commands start without loading the HTTP stack. The daemon
+# preloads all of them once.
+COMMAND_MODULES = {
+    "explain": "error_explainer",
+    "fix": "fix_suggester",
+    "syntax": "syntax_corrector",
+    "usage": "command_explainer",
+    "batch": "batch_runner",
+    "pending": "error_spool",
+    "history": "history_manager",
+    "cache": "response_cache",
+    "providers": "providers",
+    "settings": "settings_manager"
+}
 
 # Load settings
 def load_settings():
-    import json
-    with open(SETTINGS_FILE, 'r') as file:
-        return json.load(file)
-
-settings = load_settings()
+    from modules import settings_manager
+    return settings_manager.snapshot()
 
 # Print header with personalization
 def print_header():
+    settings = load_settings()
     name = settings.get("cli_name", "CLI MANAGER")
     color = settings.get("text_color", "green")
 
@@ -40,49 +55,159 @@ def print_header():
 
     print(f"{color_code}=== {name} ===\033[0m")
 
+# Run a command, timing its stages when --timings is given or metrics export is configured
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    show_timings = "--timings" in argv
+    if show_timings:
+        argv = [arg for arg in argv if arg != "--timings"]
+    if argv and argv[0] == "--daemon":
+        return dispatch(argv)
+
+    metrics_file, metrics_format = timings.load_metrics_settings()
+    if not show_timings and not metrics_file:
+        return dispatch(argv)
+
+    # Startup is only meaningful for a fresh process, not a daemon request thread
+    timings.start(include_startup=threading.current_thread() is threading.main_thread())
+    command = argv[0] if argv and argv[0] in COMMAND_MODULES else "other"
+    try:
+        if command in COMMAND_MODULES:
+            with timings.span("import"):
+                importlib.import_module(f"modules.{COMMAND_MODULES[command]}")
+        return dispatch(argv)
+    finally:
+        spans, total = timings.stop()
+        if show_timings:
+            timings.print_breakdown(spans, total)
+        if metrics_file:
+            timings.export_metrics(command, spans, total, metrics_file, metrics_format)
+
 # CLI command dispatcher
-def main():
-    if len(sys.argv) < 2:
+def dispatch(argv):
+    if not argv:
         print_header()
         print("Usage:")
-        print("  cli explain [error_message]")
+        print("  cli explain [error_message] | -group")
         print("  cli fix [command]")
         print("  cli syntax [command]")
-        print("  cli usage [command]")
+        print("  cli usage [command] | -ai [command] | -search [words] | -reindex")
+        print("  cli batch [file|-] [-mode explain|fix|syntax|usage] [-workers N] [-order input|completion]")
+        print("  cli pending")
+        print("  cli history [-n N] [-top] [-days N] [-compact]")
+        print("  cli cache -stats | -prune | -clear")
+        print("  cli providers")
+        print("  cli --profile-startup [command]")
+        print("  cli [command] --timings")
         print("  settings -list")
         sys.exit(1)
 
-    command = sys.argv[1]
+    command = argv[0]
 
     if command == "explain":
-        if len(sys.argv) < 3:
-            print("Usage: cli explain [error_message]")
+        if len(argv) < 2:
+            print("Usage: cli explain [error_message] | -group")
+        elif argv[1:] == ["-group"]:
+            from modules import error_groups
+            error_groups.explain_recent_group()
         else:
-            error_message = " ".join(sys.argv[2:])
+            error_message = " ".join(argv[1:])
+            from modules import error_explainer
             error_explainer.explain_error(error_message)
 
     elif command == "fix":
-        if len(sys.argv) < 3:
+        if len(argv) < 2:
             print("Usage: cli fix [command]")
         else:
-            command_text = " ".join(sys.argv[2:])
+            command_text = " ".join(argv[1:])
+            from modules import fix_suggester
             fix_suggester.suggest_fix(command_text)
 
     elif command == "syntax":
-        if len(sys.argv) < 3:
+        if len(argv) < 2:
             print("Usage: cli syntax [command]")
         else:
-            command_text = " ".join(sys.argv[2:])
+            command_text = " ".join(argv[1:])
+            from modules import syntax_corrector
             syntax_corrector.correct_command(command_text)
 
     elif command == "usage":
-        if len(sys.argv) < 3:
-            print("Usage: cli usage [command]")
+        option = argv[1] if len(argv) > 1 else None
+        if option is None or (option in ("-ai", "-search") and len(argv) < 3):
+            print("Usage: cli usage [command] | -ai [command] | -search [words] | -reindex")
+        elif option == "-search":
+            from modules import man_index
+            man_index.show_search(" ".join(argv[2:]))
+        elif option == "-reindex":
+            from modules import man_index
+            indexed, removed = man_index.refresh()
+            print(f"Indexed {indexed} manual page(s), removed {removed}.")
         else:
-            command_text = sys.argv[2]
-            command_explainer.explain_command(command_text)
-
-    elif command == "--settings" or (command == "settings" and len(sys.argv) > 2 and sys.argv[2] == "-list"):
+            from modules import command_explainer
+            if option == "-ai":
+                command_explainer.explain_command(argv[2], summarize=True)
+            else:
+                command_explainer.explain_command(option)
+
+    elif command == "batch":
+        from modules import batch_runner
+        sys.exit(batch_runner.batch_command(argv[1:]))
+
+    elif command == "pending":
+        from modules import error_spool
+        error_spool.show_pending()
+
+    elif command == "history":
+        options = argv[1:]
+        try:
+            limit = int(options[options.index("-n") + 1]) if "-n" in options else 5
+            days = int(options[options.index("-days") + 1]) if "-days" in options else 7
+        except (IndexError, ValueError):
+            print("Usage: cli history [-n N] [-top] [-days N] [-compact]")
+            return
+        from modules import history_manager
+        if "-compact" in options:
+            removed = history_manager.compact_history()
+            print(f"Removed {removed} old error record(s).")
+        elif "-top" in options:
+            history_manager.view_top_errors(days)
+        else:
+            history_manager.view_error_logs(limit)
+
+    elif command == "cache":
+        option = argv[1] if len(argv) > 1 else "-stats"
+        from modules import response_cache, semantic_cache
+        if option == "-stats":
+            response_cache.show_cache_stats()
+            semantic_cache.show_cache_stats()
+        elif option == "-prune":
+            removed = response_cache.prune_cache()
+            print(f"Pruned {removed} cached response(s).")
+        elif option == "-clear":
+            response_cache.clear_cache()
+            semantic_cache.clear_cache()
+            print("Response cache cleared.")
+        else:
+            print("Usage: cli cache -stats | -prune | -clear")
+
+    elif command == "providers":
+        from modules import providers
+        providers.show_providers()
+
+    elif command == "--daemon":
+        for name in COMMAND_MODULES.values():
+            importlib.import_module(f"modules.{name}")
+        from modules import cli_daemon, error_spool, man_index
+        error_spool.start_worker_thread()
+        threading.Thread(target=man_index.refresh, daemon=True).start()
+        sys.exit(cli_daemon.serve(main))
+
+    elif command == "--profile-startup":
+        from modules import startup_profiler
+        startup_profiler.show_startup_profile(argv[1:])
+
+    elif command == "--settings" or (command == "settings" and len(argv) > 1 and argv[1] == "-list"):
+        from modules import settings_manager
         settings_manager.settings_menu()
 
     else:
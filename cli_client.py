@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+CLI MANAGER - Thin client
+Forwards the command line to a running CLI MANAGER daemon and falls back
+to running cli_manager.py in-process when no daemon is listening.
+"""
+
+import os
+import runpy
+import sys
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI_MANAGER_SCRIPT = os.path.join(BASE_DIR, 'cli_manager.py')
+
+sys.path.insert(0, BASE_DIR)
+
+from modules import cli_daemon
+
+
+def main():
+    code = cli_daemon.forward(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+
+    # No daemon available: run the full CLI in this interpreter
+    sys.argv[0] = CLI_MANAGER_SCRIPT
+    runpy.run_path(CLI_MANAGER_SCRIPT, run_name="__main__")
+
+if __name__ == "__main__":
+    main()
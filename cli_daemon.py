@@ -0,0 +1,237 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+SOCKET_FILE = os.environ.get("CLI_MANAGER_SOCKET", os.path.join(DATA_DIR, 'cli-manager.sock'))
+CONNECT_TIMEOUT = 0.25
+
+# Commands that need the user's terminal (prompts, stdin) or measure a fresh process always run in-process
+LOCAL_COMMANDS = ("settings", "--settings", "--daemon", "batch", "--profile-startup")
+
+# Commands that resolve programs and relative paths the way the user's shell would; they run
+# in the client's directory with its PATH and MANPATH
+PATH_COMMANDS = ("syntax", "usage")
+PATH_ENV = ("PATH", "MANPATH")
+# A client whose values differ from the daemon's runs its command itself
+CLIENT_ENV = ("GEMINI_API_KEY", "GEMINI_API_BASE")
+# Passed along for client_env(): the shell the command was typed in
+REQUEST_ENV = ("CLI_MANAGER_SHELL_PID",)
+
+_local = threading.local()
+_context_lock = threading.Lock()   # the working directory and environment are per process
+
+
+# sys.stdout replacement that routes each request thread's output to its own client
+class _RequestStdout:
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        send = getattr(_local, "send", None)
+        if send is None:
+            return self.fallback.write(text)
+        if text:
+            send({"out": text})
+        return len(text)
+
+    def flush(self):
+        if getattr(_local, "send", None) is None:
+            self.fallback.flush()
+
+    def isatty(self):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+
+# Run a request in the client's working directory and with its PATH and MANPATH; requests
+# that need this wait for each other
+@contextmanager
+def _client_context(cwd, env):
+    with _context_lock:
+        saved_cwd = os.getcwd()
+        saved_env = {name: os.environ.get(name) for name in PATH_ENV}
+        os.chdir(cwd)
+        try:
+            for name in PATH_ENV:
+                _set_env(name, env.get(name))
+            yield
+        finally:
+            for name, value in saved_env.items():
+                _set_env(name, value)
+            os.chdir(saved_cwd)
+
+# An environment variable of the client the current command came from (of this process
+# when it is not a daemon request)
+def client_env(name):
+    env = getattr(_local, "env", None)
+    return os.environ.get(name) if env is None else env.get(name)
+
+# The uid of the user the current command came from: this process's own when it is not a
+# daemon request, None when the daemon cannot tell
+def client_uid():
+    if getattr(_local, "env", None) is None:
+        return os.getuid()
+    return getattr(_local, "uid", None)
+
+# The uid of the process at the other end of a Unix socket, where the platform reports it
+def _peer_uid(sock):
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return None
+    try:
+        _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, option, struct.calcsize("3i")))
+    except OSError:
+        return None
+    return uid
+
+def _set_env(name, value):
+    if value is None:
+        os.environ.pop(name, None)
+    else:
+        os.environ[name] = value
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode("utf-8") or "{}")
+        except ValueError:
+            return
+        argv = [str(arg) for arg in request.get("argv", [])]
+        cwd = request.get("cwd")
+        env = request.get("env") or {}
+
+        def send(message):
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+        # Another API key or endpoint, or a directory the daemon cannot enter: the client runs it
+        path_sensitive = bool(argv) and argv[0] in PATH_COMMANDS
+        if (any(env.get(name) != os.environ.get(name) for name in CLIENT_ENV)
+                or (path_sensitive and not (cwd and os.path.isdir(cwd)))):
+            try:
+                send({"local": True})
+            except OSError:
+                pass
+            return
+
+        _local.send = send
+        _local.env = env
+        _local.uid = _peer_uid(self.connection)
+        code = 0
+        try:
+            if path_sensitive:
+                with _client_context(cwd, env):
+                    self.server.dispatch(argv)
+            else:
+                self.server.dispatch(argv)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            send({"out": f"Error: {e}\n"})
+            code = 1
+        finally:
+            _local.send = None
+            _local.env = None
+            _local.uid = None
+        try:
+            send({"exit": code})
+        except OSError:
+            pass
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, dispatch):
+        self.dispatch = dispatch
+        super().__init__(path, _RequestHandler)
+
+
+# Check whether a daemon is already listening on the socket
+def is_running():
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(SOCKET_FILE)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+# Run the resident server, dispatch(argv) is the in-process command handler
+def serve(dispatch):
+    os.makedirs(os.path.dirname(SOCKET_FILE), exist_ok=True)
+    if os.path.exists(SOCKET_FILE):
+        if is_running():
+            print(f"Error: CLI MANAGER daemon already running on {SOCKET_FILE}")
+            return 1
+        os.unlink(SOCKET_FILE)
+
+    sys.stdout = _RequestStdout(sys.stdout)
+    server = _DaemonServer(SOCKET_FILE, dispatch)
+    os.chmod(SOCKET_FILE, 0o600)
+    print(f"[+] CLI MANAGER daemon listening on {SOCKET_FILE}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(SOCKET_FILE):
+            os.unlink(SOCKET_FILE)
+    return 0
+
+# Forward argv, the working directory and the environment that matters to the daemon and
+# stream its output; returns None if it is unavailable or the command must run here
+def forward(argv, out=None):
+    out = out or sys.stdout
+    if os.environ.get("CLI_MANAGER_NO_DAEMON") or (argv and argv[0] in LOCAL_COMMANDS):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(SOCKET_FILE)
+    except OSError:
+        sock.close()
+        return None
+
+    sock.settimeout(None)
+    received_output = False
+    try:
+        env = {name: os.environ[name] for name in PATH_ENV + CLIENT_ENV + REQUEST_ENV if name in os.environ}
+        request = {"argv": list(argv), "cwd": os.getcwd(), "env": env}
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                message = json.loads(line.decode("utf-8"))
+                if "out" in message:
+                    received_output = True
+                    out.write(message["out"])
+                    out.flush()
+                elif "exit" in message:
+                    return message["exit"]
+                elif message.get("local"):
+                    return None
+    except (OSError, ValueError):
+        pass
+    finally:
+        sock.close()
+
+    # The daemon went away mid-request; only retry in-process if nothing was shown yet
+    return 1 if received_output else None
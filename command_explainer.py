@@ -1,54 +1,134 @@
-import json
-import os
-import requests
+import re
+import textwrap
+from . import providers, semantic_cache, syntax_checker, man_index
 
 # Constants
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
+WORD_LIMIT = 80
+ITEM_SENTENCES = 2
+SYNOPSIS_CHARS = 160
 
-# Load Gemini API key
-def load_api_key():
-    with open(API_KEY_FILE, 'r') as file:
-        keys = json.load(file)
-    return keys.get("gemini_api_key")
+# Build the Gemini prompt; an excerpt from the local manual grounds the answer when there is one
+def build_prompt(command_text, manual=None):
+    prompt = f"As a Linux terminal instructor, explain in simple terms what this command does: '{command_text}'. Keep it under {WORD_LIMIT} words."
+    if manual:
+        prompt += f" Base your answer on this excerpt from the local manual:\n{manual}"
+    return prompt
 
-API_KEY = load_api_key()
+def _first_sentences(text):
+    return " ".join(re.split(r"(?<=[.;])\s+(?=[A-Z(])", text)[:ITEM_SENTENCES])
 
-# Command explanation function
-def explain_command(command_text):
+def _find_item(items, option):
+    for tag, text in items:
+        if option in man_index.tag_options(tag):
+            return tag, text
+    return None
+
+# The page items describing each option used; None marks an option the page does not list
+def _option_items(name, args, items):
+    found = []
+    for position, arg in enumerate(args):
+        if arg == "--":
+            break
+        if position == 0 and name in semantic_cache.BUNDLED_FLAG_COMMANDS and arg.isalpha():
+            arg = "-" + arg  # "tar xzf" means "tar -xzf"
+        if not arg.startswith("-") or arg == "-":
+            continue
+        option = arg.split("=", 1)[0]
+        item = _find_item(items, option)
+        if item or option.startswith("--") or len(option) == 2:
+            found.append((option, item))
+            continue
+        # A bundle of short options: "-xzvf"; a value-taking option ends it ("-n5")
+        for letter in option[1:]:
+            item = _find_item(items, "-" + letter)
+            found.append(("-" + letter, item))
+            if item and man_index.tag_takes_value(item[0]):
+                break
+    return found
+
+# Describe one simple command from the manual index: (text, complete). complete is False
+# when the command or one of its options or subcommands is not documented locally.
+def _describe(words, probe_help):
+    name, args = syntax_checker.command_name(words)
+    if name is None or name in syntax_checker.SHELL_KEYWORDS:
+        return None, False
+    executable = name if "/" in name else syntax_checker.path_index().get(name)
+    name = name.rsplit("/", 1)[-1]
+    page = man_index.page(name, executable, probe_help)
+    if page is None:
+        return None, False
+
+    lines = []
+    complete = True
+    positionals = [arg for arg in args if not arg.startswith("-")]
+    subcommand = positionals[0] if positionals and re.fullmatch(r"[a-z][\w-]*", positionals[0]) else None
+    if subcommand:
+        # "git commit" has a page of its own; "systemctl status" is an item of the main page
+        subpage = man_index.page(f"{name}-{subcommand}")
+        if subpage:
+            page, name = subpage, f"{name} {subcommand}"
+            args = args[args.index(subcommand) + 1:]
+        else:
+            item = next(((tag, text) for tag, text in page["items"] if tag.split()[0] == subcommand), None)
+            if item:
+                lines.append(f"  {item[0]}\n      {_first_sentences(item[1])}")
+            elif re.search(r"\bCOMMAND\b|<command>", page["synopsis"]):
+                complete = False  # an undocumented (or misspelled) subcommand
+
+    header = f"{name} - {page['summary']}" if page["summary"] else name
+    lines.insert(0, header)
+    if page["synopsis"]:
+        lines.insert(1, "Usage: " + textwrap.shorten(page["synopsis"], SYNOPSIS_CHARS, placeholder=" ..."))
+    options = _option_items(name.split()[0], args, page["items"])
+    if not options and len(lines) <= 2 and page["description"]:
+        lines.append("")
+        lines.append(page["description"])
+    for option, item in options:
+        if item is None:
+            complete = False
+            continue
+        tag, text = item
+        lines.append(f"  {tag}\n      {_first_sentences(text)}")
+    return "\n".join(lines), complete
+
+# Explanation of a command from the local manual: (text, complete). Pipelines and lists are
+# never complete: the manual describes each program, not what they do together.
+def local_explanation(command_text):
+    enabled, probe_help = man_index.load_manual_settings()
+    if not enabled:
+        return None, False
+    try:
+        tokens = syntax_checker.tokenize(command_text)
+    except ValueError:
+        return None, False
+    commands = syntax_checker.split_commands(tokens, syntax_checker.CheckResult())
+    parts = []
+    complete = len(commands) == 1
+    for words in commands:
+        text, described = _describe(words, probe_help)
+        if text:
+            parts.append(text)
+        complete = complete and described
+    return ("\n\n".join(parts) or None), complete and bool(parts)
+
+# Command explanation function; summarize asks Gemini even when the manual covers the command
+def explain_command(command_text, summarize=False):
     print("[+] Explaining command...")
 
-    if not API_KEY:
-        print("Error: Gemini API key not found. Run installer first.")
+    manual, complete = local_explanation(command_text)
+    if manual and complete and not summarize:
+        print("\nCommand Explanation (local manual):\n")
+        print(manual)
+        return
+
+    model = providers.get_provider("usage").model
+    similar = semantic_cache.lookup("command", command_text, model)
+    if similar and not summarize:
+        answer, _, original = similar
+        print(f"\nCommand Explanation (similar to '{original[:60]}'):\n")
+        print(answer)
         return
 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": f"As a Linux terminal instructor, explain in simple terms what this command does: '{command_text}'. Keep it under 80 words."
-                    }
-                ]
-            }
-        ]
-    }
-
-    response = requests.post(f"{url}?key={API_KEY}", headers=headers, json=payload)
-
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            explanation = result['candidates'][0]['content']['parts'][0]['text']
-            print("\nCommand Explanation:\n")
-            print(explanation)
-        except (KeyError, IndexError):
-            print("Error: Unexpected API response format.")
-    else:
-        print(f"Error: API request failed — Status Code {response.status_code}")
-        print(response.text)
+    prompt = build_prompt(command_text, manual)
+    answer = providers.print_answer(prompt, "Command Explanation", "usage", word_limit=WORD_LIMIT)
+    semantic_cache.remember("command", command_text, answer, model)
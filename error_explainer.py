@@ -1,55 +1,56 @@
-import json
-import os
-import requests
-
-# Constants
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
-
-# Load Gemini API key
-def load_api_key():
-    with open(API_KEY_FILE, 'r') as file:
-        keys = json.load(file)
-    return keys.get("gemini_api_key")
-
-API_KEY = load_api_key()
+from . import providers, knowledge_base, semantic_cache, prefetch, prompt_budget
+
+# Build the Gemini prompt; long error text is shortened to the prompt budget unless the
+# caller has already done so
+def build_prompt(error_message, compacted=False):
+    if not compacted:
+        error_message, _ = prompt_budget.compact(error_message)
+    return f"You are an expert Linux system admin. Explain this Linux terminal error message in simple terms: {error_message}"
+
+# An explanation that needs no request, as (source, answer), or None: well-known errors
+# from the offline knowledge base, or one fetched in the background when the shell
+# reported the failure
+def ready_answer(error_message):
+    if knowledge_base.offline_enabled():
+        entry = knowledge_base.lookup(error_message)
+        if entry:
+            return "offline", knowledge_base.format_entry(entry)
+    answer = prefetch.lookup("explain", error_message)
+    if answer:
+        return "prefetched", answer
+    return None
+
+# The explanation of a near-identical error (e.g. only a library version differs), as
+# (source, answer), or None; error_message is the compacted text
+def similar_answer(error_message, model):
+    similar = semantic_cache.lookup("error", error_message, model)
+    if not similar:
+        return None
+    answer, _, original = similar
+    return f"similar error seen before: {original[:60]}", answer
 
 # Explain error function
 def explain_error(error_message):
     print("[+] Explaining your error...")
 
-    if not API_KEY:
-        print("Error: Gemini API key not found. Run installer first.")
+    ready = ready_answer(error_message)
+    if ready:
+        print(f"\nExplanation ({ready[0]}):\n")
+        print(ready[1])
+        return
+
+    # Pages of build output or a deep stack trace: only what matters is sent
+    error_message, report = prompt_budget.compact(error_message)
+    if report:
+        print(prompt_budget.describe(report))
+
+    model = providers.get_provider("explain").model
+    similar = similar_answer(error_message, model)
+    if similar:
+        print(f"\nExplanation ({similar[0]}):\n")
+        print(similar[1])
         return
 
-    # Gemini API call setup
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": f"You are an expert Linux system admin. Explain this Linux terminal error message in simple terms: {error_message}"
-                    }
-                ]
-            }
-        ]
-    }
-
-    response = requests.post(f"{url}?key={API_KEY}", headers=headers, json=payload)
-
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            explanation = result['candidates'][0]['content']['parts'][0]['text']
-            print("\nExplanation:\n")
-            print(explanation)
-        except (KeyError, IndexError):
-            print("Error: Unexpected API response format.")
-    else:
-        print(f"Error: API request failed — Status Code {response.status_code}")
-        print(response.text)
+    prompt = build_prompt(error_message, compacted=True)
+    answer = providers.print_answer(prompt, "Explanation", "explain")
+    semantic_cache.remember("error", error_message, answer, model)
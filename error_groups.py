@@ -0,0 +1,118 @@
+import re
+from . import gemini_client, providers, knowledge_base, history_manager, error_signature, prompt_budget
+
+# Constants
+GROUP_WINDOW = 120    # seconds between two errors that still belong to the same failure
+MAX_GROUP = 8         # errors sent in one request; older ones in a larger group are dropped
+WORD_LIMIT = 60       # per error
+RECENT_SECONDS = 3600 # how far back 'cli explain -group' looks
+
+# "[2]" or "[root cause]" at the start of a line, with any Markdown the model wraps it in
+_SECTION = re.compile(r"^[ \t#*_>-]*\[(\d+|root cause)\][*_:]*[ \t]*", re.IGNORECASE | re.MULTILINE)
+
+
+# Split errors (oldest first, each a dict with "timestamp", "command" and "error") into
+# groups: an error joins the previous group when it came soon after it or from the same command
+def group_errors(errors, window=GROUP_WINDOW):
+    groups = []
+    for error in errors:
+        previous = groups[-1][-1] if groups else None
+        if previous and (error["timestamp"] - previous["timestamp"] <= window
+                         or (error.get("command") and error.get("command") == previous.get("command"))):
+            groups[-1].append(error)
+        else:
+            groups.append([error])
+    return [_distinct(group) for group in groups]
+
+def _distinct(group):
+    # A repeated error adds nothing to the prompt; keep its latest occurrence
+    latest = {}
+    for error in group:
+        latest[error_signature.fingerprint(error["error"])] = error
+    return sorted(latest.values(), key=lambda e: e["timestamp"])[-MAX_GROUP:]
+
+# One prompt for several related errors: the instructions are sent once, and the reply is
+# numbered so it can be split back into one answer per error. The errors share the
+# prompt budget.
+def build_prompt(errors):
+    budget = max(prompt_budget.load_budget_settings() // max(len(errors), 1), prompt_budget.MIN_TOKEN_BUDGET)
+    lines = [
+        "You are an expert Linux system admin. These terminal errors happened together, most likely from one underlying problem.",
+        f"For each error, explain in simple terms what it means (under {WORD_LIMIT} words each).",
+        "Start each explanation on its own line with the error's number in brackets, like [1].",
+        "Finish with a line starting with [root cause] that names the most likely common cause and how to fix it.",
+        ""
+    ]
+    for number, error in enumerate(errors, 1):
+        lines.append(f"[{number}] " + (f"(command: {error['command']}) " if error.get("command") else "") + prompt_budget.compact(error["error"], budget)[0])
+    return "\n".join(lines)
+
+# Split a reply to build_prompt into (root cause, [answer per error]); an answer the
+# model left out is None
+def parse_reply(reply, count):
+    answers = [None] * count
+    root_cause = None
+    matches = list(_SECTION.finditer(reply or ""))
+    for position, match in enumerate(matches):
+        end = matches[position + 1].start() if position + 1 < len(matches) else len(reply)
+        text = reply[match.end():end].strip()
+        if not text:
+            continue
+        label = match.group(1).lower()
+        if label == "root cause":
+            root_cause = text
+        elif 1 <= int(label) <= count:
+            answers[int(label) - 1] = text
+    return root_cause, answers
+
+# Explain related errors with a single request: (root cause, [answer per error]). Known
+# errors are answered from the knowledge base and left out of the prompt.
+def explain_errors(errors, client=None, model=None):
+    answers = [None] * len(errors)
+    if knowledge_base.offline_enabled():
+        for position, error in enumerate(errors):
+            entry = knowledge_base.lookup(error["error"])
+            if entry:
+                answers[position] = knowledge_base.format_entry(entry)
+
+    pending = [position for position, answer in enumerate(answers) if answer is None]
+    if not pending:
+        return None, answers
+    client = client or providers.get_provider("explain")
+    asked = [errors[position] for position in pending]
+    reply = client.generate(build_prompt(asked), model=model, word_limit=WORD_LIMIT * len(asked))
+    root_cause, replies = parse_reply(reply, len(asked))
+    if not any(replies):
+        # The model ignored the numbering; its whole reply is the best answer there is
+        return reply.strip(), answers
+    # Not remembered for 'cli explain': each answer is short and leans on the rest of the group
+    for position, text in zip(pending, replies):
+        answers[position] = text
+    return root_cause, answers
+
+# Render a group's answers as one block of text; without any separate answers the
+# root cause is the model's whole reply
+def format_answers(errors, root_cause, answers):
+    parts = []
+    for number, (error, answer) in enumerate(zip(errors, answers), 1):
+        parts.append(f"[{number}] {error['error'][:100]}" + (f"\n{answer}" if answer else ""))
+    if root_cause:
+        label = "Root cause" if any(answers) else "Explanation"
+        parts.append(f"{label}:\n{root_cause}")
+    return "\n\n".join(parts)
+
+# Explain the most recent group of related errors from the history
+def explain_recent_group(seconds=RECENT_SECONDS):
+    print("[+] Explaining your recent errors together...")
+    errors = history_manager.recent_errors(seconds)
+    if not errors:
+        print("No recent errors to explain.")
+        return
+    group = group_errors(errors)[-1]
+    try:
+        root_cause, answers = explain_errors(group)
+    except gemini_client.GeminiError as e:
+        print(f"Error: {e}")
+        return
+    print(f"\nExplanation of {len(group)} related error(s):\n")
+    print(format_answers(group, root_cause, answers))
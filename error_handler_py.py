@@ -1,6 +1,8 @@
-import os
-import re
-import subprocess
+import shlex
+import textwrap
+from . import error_spool, prefetch
+from .shell_capture import read_latest_error
+from .history_manager import add_error_log
 from .utils.logger import setup_logger
 
 logger = setup_logger()
@@ -13,104 +15,159 @@ class ErrorHandler:
         self.gemini = gemini_api
         
     def explain_last_error(self):
-        """Explain the most recent error from shell history"""
-        # Get last command that resulted in an error
-        last_error = self._find_last_error()
+        """Explain the most recent error captured by the shell hook"""
+        last_error = read_latest_error()
         if not last_error:
             print("No recent errors found.")
             return
             
-        command, error = last_error
+        command = last_error["command"]
+        error = last_error["stderr"] or f"Command exited with status {last_error['exit_code']}"
         print(f"Last error command: {command}")
+        print(f"Exit code: {last_error['exit_code']} (after {last_error['duration_ms']} ms)")
         print(f"Error message: {error}")
         print("\nExplanation:")
         explanation = self.gemini.explain_error(error, command)
         print(explanation)
         
-    def _find_last_error(self):
-        """Find the most recent command that resulted in an error"""
-        try:
-            # Try to get the last command with non-zero exit code
-            result = subprocess.run(
-                ["fc", "-ln", "-1"],
-                capture_output=True, 
-                text=True
-            )
-            last_command = result.stdout.strip()
-            
-            # Run the command again to get its error
-            result = subprocess.run(
-                last_command,
-                shell=True,
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                return (last_command, result.stderr.strip())
-                
-            # If no error from last command, try to parse history
-            return self._parse_history_for_error()
-            
-        except Exception as e:
-            logger.error(f"Error finding last error: {e}")
-            return self._parse_history_for_error()
-            
-    def _parse_history_for_error(self):
-        """Parse shell history to find recent errors"""
-        try:
-            # Attempt to find errors in shell history
-            history_file = os.environ.get("HISTFILE", os.path.expanduser("~/.bash_history"))
-            
-            if not os.path.exists(history_file):
-                logger.error(f"History file not found: {history_file}")
-                return None
-                
-            with open(history_file, 'r') as f:
-                lines = f.readlines()
-                
-            # Start from the end and look for patterns that suggest errors
-            for line in reversed(lines):
-                line = line.strip()
-                
-                # Skip empty lines and common commands
-                if not line or line.startswith("#") or line in ["ls", "cd", "pwd"]:
-                    continue
-                    
-                # Test if this command results in an error
-                result = subprocess.run(
-                    line,
-                    shell=True,
-                    capture_output=True,
-                    text=True
-                )
-                
-                if result.returncode != 0:
-                    return (line, result.stderr.strip())
-                    
-        except Exception as e:
-            logger.error(f"Error parsing history: {e}")
-            
-        return None
-        
     def intercept_errors(self, command, error):
         """Intercept and explain errors in real-time"""
+        add_error_log(error, command)
         explanation = self.gemini.explain_error(error, command)
         return explanation
         
     def setup_trap(self):
-        """Generate shell code to trap errors"""
+        """Generate shell code that queues failed commands for background explanation"""
+        # With trap_capture_stderr, stderr is mirrored to a per-shell file that is emptied before
+        # each command line, so it only ever holds the output of the command that just ran (plus
+        # the line editor's echo, removed by the worker). Commands then no longer see a terminal
+        # on stderr, so colors and progress output that depend on one are lost; by default the
+        # shell's stderr is left alone and failures are reported by command and exit status.
+        # mktemp creates the file mode 0600 under a name nobody can guess, so a planted symlink
+        # is never written through.
+        capture_code = """
+        if [ -z "$__cli_manager_capture" ] || [ ! -f "$__cli_manager_capture" ]; then
+            __cli_manager_capture=$(mktemp "${XDG_RUNTIME_DIR:-${TMPDIR:-/tmp}}/cli-manager.XXXXXXXX" 2>/dev/null)
+        fi
+        if [ -t 2 ] && [ -n "$__cli_manager_capture" ] && [ -z "$__cli_manager_mirrored" ]; then
+            exec 2> >(tee -a "$__cli_manager_capture" >&2)
+            __cli_manager_mirrored=1
+        fi
+        """ if error_spool.capture_enabled() else ""
         trap_code = """
-        # CLI Manager error trap
+        # CLI Manager error capture
+        %(capture)s
+        __cli_manager_incoming=%(incoming)s
+        __cli_manager_ready=%(ready)s/$$
+        __cli_manager_worker_pid=%(worker_pid)s
+        mkdir -p "$__cli_manager_incoming" %(ready)s
+        __cli_manager_prefetched=%(prefetch)s/$$.json
+        # Lets 'cli explain' and 'cli fix' find what was prefetched for this shell
+        export CLI_MANAGER_SHELL_PID=$$
+        # "history 1" (unlike "fc -l -1" in a trap) is the command that just ran: "  42  make"
+        __cli_manager_entry='^[[:space:]]*[0-9]+[*]?[[:space:]]+(.*)$'
+        
+        # Traps the shell already had keep running after ours (kept once, so sourcing this
+        # again does not chain our own traps to themselves). "trap -p" is not called from a
+        # function: command substitutions there do not see the DEBUG and ERR traps.
+        __cli_manager_trap_command() {
+            local name=$1
+            if [ -n "${!name}" ]; then eval "set -- ${!name#trap -- }"; else set -- ""; fi
+            printf -v "$name" '%%s' "$1"
+        }
+        __cli_manager_return() {
+            return "$1"
+        }
+        if [ -z "$__cli_manager_chained" ]; then
+            __cli_manager_prev_exit=$(trap -p EXIT)
+            __cli_manager_prev_debug=$(trap -p DEBUG)
+            __cli_manager_prev_err=$(trap -p ERR)
+            __cli_manager_trap_command __cli_manager_prev_exit
+            __cli_manager_trap_command __cli_manager_prev_debug
+            __cli_manager_trap_command __cli_manager_prev_err
+            __cli_manager_chained=1
+        fi
+        trap 'rm -f ${__cli_manager_capture:+"$__cli_manager_capture"} "$__cli_manager_ready" "$__cli_manager_prefetched"
+              eval "$__cli_manager_prev_exit"' EXIT
+        
+        __cli_manager_preexec() {
+            [ -n "$__cli_manager_armed" ] || return 0
+            __cli_manager_armed=
+            __cli_manager_start=${EPOCHREALTIME/./}
+            [ -n "$__cli_manager_capture" ] && : > "$__cli_manager_capture"
+        }
+        
+        # Show explanations prepared in the background since the last prompt
+        __cli_manager_precmd() {
+            __cli_manager_armed=1
+            # A new command ran without failing since the last failure: tell the worker, which
+            # drops answers it prefetched for that failure
+            if [ -n "$__cli_manager_failed" ] && [ -z "$__cli_manager_reported" ]; then
+                local entry cmd=
+                entry=$(history 1)
+                if [ "$entry" != "$__cli_manager_failed" ]; then
+                    __cli_manager_failed=
+                    [[ $entry =~ $__cli_manager_entry ]] && cmd=${BASH_REMATCH[1]}
+                    printf '0\\n0\\n%%s\\n%%s\\n\\036' "$$" "${cmd//$'\\n'/ }" \\
+                        > "$__cli_manager_incoming/$$-${EPOCHREALTIME/./}.evt" 2>/dev/null
+                fi
+            fi
+            __cli_manager_reported=
+            if [ -s "$__cli_manager_ready" ]; then
+                local line
+                while IFS= read -r line || [ -n "$line" ]; do
+                    printf '%%s\\n' "$line"
+                done < "$__cli_manager_ready"
+                : > "$__cli_manager_ready"
+            fi
+        }
+        
+        __cli_manager_start_worker() {
+            local pid=
+            [ -r "$__cli_manager_worker_pid" ] && read -r pid < "$__cli_manager_worker_pid"
+            if [ -z "$pid" ] || ! kill -0 "$pid" 2>/dev/null; then
+                (cd %(base_dir)s && exec python3 -m %(worker_module)s >/dev/null 2>&1 &)
+            fi
+        }
+        
+        # Queue the failure and return at once; a background worker explains it
         __cli_manager_error_handler() {
             local exit_code=$?
-            if [ $exit_code -ne 0 ]; then
-                local cmd=$(fc -ln -1)
-                cli-manager --explain-error "$cmd" "$exit_code"
+            if [ $exit_code -ne 0 ] && [ -z "$__cli_manager_reported" ]; then
+                __cli_manager_reported=1
+                local cmd= err= duration
+                __cli_manager_failed=$(history 1)
+                [[ $__cli_manager_failed =~ $__cli_manager_entry ]] && cmd=${BASH_REMATCH[1]}
+                duration=$(( (${EPOCHREALTIME/./} - ${__cli_manager_start:-0}) / 1000 ))
+                [ -n "$__cli_manager_capture" ] && [ -r "$__cli_manager_capture" ] && IFS= read -r -d '' -N 65536 err < "$__cli_manager_capture"
+                [ ${#err} -gt 3000 ] && err=${err: -3000}
+                printf '%%s\\n%%s\\n%%s\\n%%s\\n%%s\\036' "$exit_code" "$duration" "$$" "${cmd//$'\\n'/ }" "$err" \\
+                    > "$__cli_manager_incoming/$$-${EPOCHREALTIME/./}.evt" 2>/dev/null
+                __cli_manager_start_worker
             fi
             return $exit_code
         }
         
-        trap '__cli_manager_error_handler' ERR
-        """
-        return trap_code.strip()
+        # The previous DEBUG trap sees the $? it would have seen on its own, and its status
+        # stays the trap's status (with extdebug, non-zero skips the command)
+        trap '__cli_manager_status=$?
+              __cli_manager_preexec
+              [ -z "$__cli_manager_prev_debug" ] || { __cli_manager_return $__cli_manager_status; eval "$__cli_manager_prev_debug"; }' DEBUG
+        # The handler returns the failed command's status, so the previous ERR trap sees it too
+        trap '__cli_manager_error_handler
+              __cli_manager_status=$?
+              [ -z "$__cli_manager_prev_err" ] || { __cli_manager_return $__cli_manager_status; eval "$__cli_manager_prev_err"; }' ERR
+        case ";$PROMPT_COMMAND;" in
+            *__cli_manager_precmd*) ;;
+            *) PROMPT_COMMAND="${PROMPT_COMMAND:+$PROMPT_COMMAND; }__cli_manager_precmd" ;;
+        esac
+        """ % {
+            "capture": capture_code.strip(),
+            "incoming": shlex.quote(error_spool.INCOMING_DIR),
+            "ready": shlex.quote(error_spool.READY_DIR),
+            "worker_pid": shlex.quote(error_spool.WORKER_PID_FILE),
+            "prefetch": shlex.quote(prefetch.PREFETCH_DIR),
+            "base_dir": shlex.quote(error_spool.BASE_DIR),
+            "worker_module": error_spool.__name__
+        }
+        return textwrap.dedent(trap_code).strip()
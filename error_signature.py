@@ -0,0 +1,65 @@
+import getpass
+import hashlib
+import os
+import re
+
+# Volatile parts of error messages, in priority order. Everything is compiled into a
+# single alternation so normalizing an error is one regex pass.
+MASKS = [
+    ("ansi", r"\x1b\[[0-9;]*[A-Za-z]"),
+    ("timestamp", r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+                  r"|\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) +\d{1,2} \d{2}:\d{2}:\d{2}\b"
+                  r"|\b\d{2}:\d{2}:\d{2}(?:\.\d+)?\b"),
+    ("uuid", r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b"),
+    ("url", r"\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s'\"<>]+"),
+    ("email", r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b"),
+    ("ip", r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b|\[[0-9a-fA-F:]*:[0-9a-fA-F:]+\](?::\d+)?"),
+    ("hex", r"\b0x[0-9a-fA-F]+\b|\b[0-9a-fA-F]{12,}\b"),
+    ("path", r"(?<![\w/])(?:~|\.{1,2})?/[\w.@%+=~-]*(?:/[\w.@%+=~-]*)*"),
+    ("quoted", r"'[^'\n]{1,200}'|\"[^\"\n]{1,200}\"|`[^`\n]{1,200}`|‘[^’\n]{1,200}’"),
+    ("number", r"(?<![\w.])[-+]?\d+(?:\.\d+)*(?:[kKmMgG]i?[bB]|ms|us|s)?(?![\w.])"),
+]
+
+_PATTERN = re.compile("|".join(f"(?P<{name}>{regex})" for name, regex in MASKS))
+_SPACES = re.compile(r"\s+")
+
+
+def _current_users():
+    users = set()
+    for name in (os.environ.get("USER"), os.environ.get("LOGNAME")):
+        if name:
+            users.add(name)
+    try:
+        users.add(getpass.getuser())
+    except Exception:
+        pass
+    users.discard("root")
+    return users
+
+_USER_PATTERN = None
+_users = _current_users()
+if _users:
+    _USER_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(u) for u in sorted(_users)) + r")\b")
+
+
+# Turn raw stderr into a stable template plus the values that were masked out.
+# Returns (template, params) where params is a list of (kind, value).
+def normalize_error(error_text):
+    params = []
+
+    def replace(match):
+        kind = match.lastgroup
+        if kind == "ansi":
+            return ""
+        params.append((kind, match.group(0)))
+        return f"<{kind}>"
+
+    text = _PATTERN.sub(replace, error_text)
+    if _USER_PATTERN is not None:
+        text = _USER_PATTERN.sub(lambda m: params.append(("user", m.group(0))) or "<user>", text)
+    return _SPACES.sub(" ", text).strip().lower(), params
+
+# Short hex fingerprint identifying the kind of error regardless of paths, PIDs, ports, etc.
+def fingerprint(error_text):
+    template, _ = normalize_error(error_text)
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
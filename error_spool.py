@@ -0,0 +1,262 @@
+import fcntl
+import json
+import os
+import re
+import sys
+import threading
+import time
+from . import settings_manager, shell_capture, history_manager, error_signature, knowledge_base, gemini_client, providers, error_explainer, error_groups, fix_suggester, prefetch
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+SPOOL_DIR = os.path.join(DATA_DIR, 'spool')
+INCOMING_DIR = os.path.join(SPOOL_DIR, 'incoming')
+READY_DIR = os.path.join(SPOOL_DIR, 'ready')
+STATE_FILE = os.path.join(SPOOL_DIR, 'state.json')
+WORKER_PID_FILE = os.path.join(SPOOL_DIR, 'worker.pid')
+LAST_EXPLANATION_FILE = os.path.join(SPOOL_DIR, 'last_explanation.txt')
+
+EVENT_END = "\x1e"          # written last by the shell hook, marks a complete event
+POLL_INTERVAL = 0.2
+IDLE_EXIT = 60              # seconds without events before a standalone worker exits
+DEFAULT_DEBOUNCE = 300      # seconds before the same error is explained again
+DEFAULT_MAX_PER_MINUTE = 6
+# Terminal control sequences the line editor writes to the mirrored stderr (e.g. "\x1b[?2004l")
+TERMINAL_ESCAPES = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-_]|\r")
+
+
+# Read trap settings
+def load_spool_settings():
+    settings = settings_manager.snapshot()
+    try:
+        debounce = float(settings.get("trap_debounce_seconds", DEFAULT_DEBOUNCE))
+    except (TypeError, ValueError):
+        debounce = DEFAULT_DEBOUNCE
+    try:
+        max_per_minute = int(settings.get("trap_max_per_minute", DEFAULT_MAX_PER_MINUTE))
+    except (TypeError, ValueError):
+        max_per_minute = DEFAULT_MAX_PER_MINUTE
+    display = settings.get("trap_display", "prompt")
+    return debounce, max_per_minute, display
+
+# Whether the shell hook mirrors stderr to a file (trap_capture_stderr); commands then see a
+# pipe instead of the terminal on stderr
+def capture_enabled():
+    value = settings_manager.snapshot().get("trap_capture_stderr", False)
+    return str(value).lower() not in ("false", "0", "no", "off")
+
+# Remove what the interactive shell itself wrote to the mirrored stderr: control sequences
+# and the echo of the command line
+def clean_stderr(text, command):
+    lines = TERMINAL_ESCAPES.sub("", text).split("\n")
+    while lines and lines[0].strip() in ("", command):
+        lines.pop(0)
+    return "\n".join(lines).strip()
+
+def _ensure_dirs():
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    os.makedirs(READY_DIR, exist_ok=True)
+
+# Parse an event file: exit code, duration, shell pid, command, then stderr tail.
+# The file's owner is the user who ran the command.
+def read_event(path):
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as file:
+            raw = file.read()
+            uid = os.fstat(file.fileno()).st_uid
+    except OSError:
+        return None
+    if not raw.endswith(EVENT_END):
+        return None
+    parts = raw[:-len(EVENT_END)].split("\n", 4)
+    if len(parts) < 4:
+        return {}
+    try:
+        exit_code = int(parts[0])
+        duration_ms = int(parts[1] or 0)
+    except ValueError:
+        return {}
+    return {
+        "exit_code": exit_code,
+        "duration_ms": duration_ms,
+        "shell_pid": parts[2],
+        "command": parts[3].strip(),
+        "stderr": clean_stderr(parts[4], parts[3].strip()) if len(parts) > 4 else "",
+        "uid": uid
+    }
+
+def _load_state():
+    try:
+        with open(STATE_FILE, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"explained": {}, "window": []}
+
+def _save_state(state):
+    tmp = STATE_FILE + ".tmp"
+    with open(tmp, 'w') as file:
+        json.dump(state, file)
+    os.replace(tmp, STATE_FILE)
+
+# Decide whether an error should be explained now (debounce + per-minute rate limit)
+def should_explain(state, fingerprint, now, debounce, max_per_minute):
+    last = state["explained"].get(fingerprint)
+    if last is not None and now - last < debounce:
+        return False
+    state["window"] = [t for t in state["window"] if now - t < 60]
+    if len(state["window"]) >= max_per_minute:
+        return False
+    state["window"].append(now)
+    state["explained"][fingerprint] = now
+    # Forget old fingerprints so the state file stays small
+    state["explained"] = {k: v for k, v in state["explained"].items() if now - v < max(debounce, 60)}
+    return True
+
+# The explain prompt for an event; prefetching sends the same one, so explaining the event
+# afterwards is answered from the response cache (or joins the request in flight)
+def event_prompt(event):
+    error = event["stderr"] or f"Command exited with status {event['exit_code']}"
+    return error_explainer.build_prompt(f"{error}\n(command: {event['command']})")
+
+# Prepare the explanation text for an event (offline knowledge base first, then Gemini)
+def explain_event(event):
+    error = event["stderr"] or f"Command exited with status {event['exit_code']}"
+    if knowledge_base.offline_enabled():
+        entry = knowledge_base.lookup(error)
+        if entry:
+            return knowledge_base.format_entry(entry)
+    return providers.get_provider("explain").generate(event_prompt(event))
+
+# Prepare one explanation for several failures from the same shell (e.g. a build and the
+# commands that ran after it), sent to Gemini as a single request
+def explain_events(events):
+    errors = [
+        {"command": event["command"], "error": event["stderr"] or f"Command exited with status {event['exit_code']}"}
+        for event in events
+    ]
+    root_cause, answers = error_groups.explain_errors(errors)
+    return error_groups.format_answers(errors, root_cause, answers)
+
+def _publish(event, text, display):
+    header = f"[cli-manager] {event['command']} (exit {event['exit_code']})"
+    body = f"{header}\n{text.strip()}\n"
+    tmp = LAST_EXPLANATION_FILE + ".tmp"
+    with open(tmp, 'w') as file:
+        file.write(body)
+    os.replace(tmp, LAST_EXPLANATION_FILE)
+    if display == "prompt" and event["shell_pid"].isdigit():
+        with open(os.path.join(READY_DIR, event["shell_pid"]), 'a') as file:
+            file.write(body)
+
+# Handle every complete event currently in the spool, returns number processed
+def drain_once():
+    _ensure_dirs()
+    try:
+        names = sorted(n for n in os.listdir(INCOMING_DIR) if n.endswith(".evt"))
+    except OSError:
+        return 0
+    if not names:
+        return 0
+
+    debounce, max_per_minute, display = load_spool_settings()
+    state = _load_state()
+    processed = 0
+    waiting = {}  # shell pid -> events to explain, in order
+    for name in names:
+        path = os.path.join(INCOMING_DIR, name)
+        event = read_event(path)
+        if event is None:
+            # Still being written; stale partial files are removed after a minute
+            try:
+                if time.time() - os.path.getmtime(path) > 60:
+                    os.unlink(path)
+            except OSError:
+                pass
+            continue
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        processed += 1
+        if not event:
+            continue
+        if event["exit_code"] == 0:
+            # The shell reports the first success after a failure
+            prefetch.cancel(event["shell_pid"], event["command"])
+            continue
+
+        try:
+            shell_capture.record_error(event["command"], event["exit_code"], event["duration_ms"], event["stderr"])
+        except OSError:
+            pass
+        error = event["stderr"] or f"exit status {event['exit_code']}"
+        history_manager.add_error_log(error, event["command"], event["exit_code"])
+
+        fingerprint = error_signature.fingerprint(f"{event['command']}\n{error}")
+        if not should_explain(state, fingerprint, time.time(), debounce, max_per_minute):
+            continue
+        # The likely follow-up 'cli explain' and 'cli fix' answers, fetched before they are asked for
+        prefetch.schedule(event, error, {
+            "explain": event_prompt(event),
+            "fix": fix_suggester.build_prompt(event["command"])
+        }, state)
+        waiting.setdefault(event["shell_pid"], []).append(event)
+
+    # Failures from one shell that arrived together are related; explain them in one request
+    for events in waiting.values():
+        try:
+            text = explain_event(events[0]) if len(events) == 1 else explain_events(events)
+        except gemini_client.GeminiError as e:
+            text = f"Error: {e}"
+        _publish(events[-1], text, display)
+
+    _save_state(state)
+    return processed
+
+# Worker loop; only one worker runs at a time (guarded by a lock on the pid file)
+def run_worker(idle_exit=IDLE_EXIT, stop_event=None):
+    _ensure_dirs()
+    lock_file = open(WORKER_PID_FILE, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return 0
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+
+    idle_since = time.monotonic()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if drain_once():
+                idle_since = time.monotonic()
+            elif idle_exit and time.monotonic() - idle_since > idle_exit:
+                break
+            time.sleep(POLL_INTERVAL)
+    finally:
+        lock_file.seek(0)
+        lock_file.truncate()
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+    return 0
+
+# Run the worker inside a long-lived process (the daemon) without an idle timeout
+def start_worker_thread():
+    stop_event = threading.Event()
+    thread = threading.Thread(target=run_worker, kwargs={"idle_exit": 0, "stop_event": stop_event}, daemon=True)
+    thread.start()
+    return stop_event
+
+# Show the most recent prepared explanation
+def show_pending():
+    if not os.path.exists(LAST_EXPLANATION_FILE):
+        print("No explanation prepared yet.")
+        return
+    with open(LAST_EXPLANATION_FILE, 'r') as file:
+        print(file.read().rstrip())
+
+if __name__ == "__main__":
+    sys.exit(run_worker())
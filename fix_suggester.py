@@ -1,55 +1,31 @@
-import json
-import os
-import requests
-
-# Constants
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
-
-# Load Gemini API key
-def load_api_key():
-    with open(API_KEY_FILE, 'r') as file:
-        keys = json.load(file)
-    return keys.get("gemini_api_key")
-
-API_KEY = load_api_key()
+from . import providers, knowledge_base, prefetch, prompt_budget
+
+# Build the Gemini prompt; a pasted error log is shortened to the prompt budget
+def build_prompt(command_text):
+    command_text, _ = prompt_budget.compact(command_text)
+    return f"You are a senior Linux system engineer. The user ran this command or encountered this issue: '{command_text}'. Suggest a simple, safe fix command or solution for it in a brief way."
+
+# A fix that needs no request, as (source, answer), or None: the offline knowledge base,
+# or one fetched in the background when the shell reported the failure
+def ready_answer(command_text):
+    if knowledge_base.offline_enabled():
+        entry = knowledge_base.lookup(command_text)
+        if entry and entry.get("fix"):
+            return "offline", entry["fix"]
+    answer = prefetch.lookup("fix", command_text)
+    if answer:
+        return "prefetched", answer
+    return None
 
 # Suggest fix function
 def suggest_fix(command_text):
     print("[+] Suggesting a fix...")
 
-    if not API_KEY:
-        print("Error: Gemini API key not found. Run installer first.")
+    ready = ready_answer(command_text)
+    if ready:
+        print(f"\nFix Suggestion ({ready[0]}):\n")
+        print(ready[1])
         return
 
-    # Gemini API call setup
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": f"You are a senior Linux system engineer. The user ran this command or encountered this issue: '{command_text}'. Suggest a simple, safe fix command or solution for it in a brief way."
-                    }
-                ]
-            }
-        ]
-    }
-
-    response = requests.post(f"{url}?key={API_KEY}", headers=headers, json=payload)
-
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            suggestion = result['candidates'][0]['content']['parts'][0]['text']
-            print("\nFix Suggestion:\n")
-            print(suggestion)
-        except (KeyError, IndexError):
-            print("Error: Unexpected API response format.")
-    else:
-        print(f"Error: API request failed — Status Code {response.status_code}")
-        print(response.text)
+    prompt = build_prompt(command_text)
+    providers.print_answer(prompt, "Fix Suggestion", "fix")
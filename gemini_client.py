@@ -0,0 +1,596 @@
+import json
+import os
+import threading
+import time
+import weakref
+from . import response_cache, settings_manager, timings, knowledge_base
+from .resilience import TokenBucket, CircuitBreaker, DeadlineExceeded, backoff_delay, parse_retry_after
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
+
+API_BASE = os.environ.get("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+DEFAULT_MODEL = "gemini-2.0-flash"
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 60
+POOL_SIZE = 10
+ASYNC_POOL_SIZE = 100      # connections per event loop; async callers are cheap, so allow many
+DEFAULT_DEADLINE = 60      # seconds for a whole request, retries and rate limiting included
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RATE = 60          # requests per minute per process, 0 for no limit
+BREAKER_THRESHOLD = 5      # consecutive transient failures before failing fast
+BREAKER_RESET = 30         # seconds before the API is probed again
+CANCEL_POLL_INTERVAL = 0.05  # how often a waiting caller checks its cancel event
+
+
+class GeminiError(Exception):
+    """Raised when a Gemini request cannot produce an answer"""
+
+    def __init__(self, message, status_code=None, retry_after=None, transient=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        # Transient errors (rate limits, server errors, network trouble) are worth retrying
+        if transient is None:
+            transient = status_code == 429 or (status_code or 0) >= 500
+        self.transient = transient
+
+
+# Load Gemini API key (environment variable wins over the key file)
+def load_api_key():
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if api_key:
+        return api_key
+    if not os.path.exists(API_KEY_FILE):
+        return None
+    try:
+        with open(API_KEY_FILE, 'r') as file:
+            keys = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return keys.get("gemini_api_key")
+
+# Read the deadline, retry and rate limit settings
+def load_resilience_settings():
+    settings = settings_manager.snapshot()
+    try:
+        deadline = float(settings.get("api_deadline_seconds", DEFAULT_DEADLINE))
+    except (TypeError, ValueError):
+        deadline = DEFAULT_DEADLINE
+    try:
+        max_retries = int(settings.get("api_max_retries", DEFAULT_MAX_RETRIES))
+    except (TypeError, ValueError):
+        max_retries = DEFAULT_MAX_RETRIES
+    try:
+        rate = float(settings.get("api_rate_per_minute", DEFAULT_RATE))
+    except (TypeError, ValueError):
+        rate = DEFAULT_RATE
+    return deadline, max_retries, rate
+
+# Read the model name from settings
+def load_model_name():
+    return settings_manager.snapshot().get("gemini_model", DEFAULT_MODEL)
+
+
+_aiohttp_module = False
+
+def _aiohttp():
+    # aiohttp is optional; without it the async API runs the blocking client in threads
+    global _aiohttp_module
+    if _aiohttp_module is False:
+        try:
+            import aiohttp
+        except ImportError:
+            aiohttp = None
+        _aiohttp_module = aiohttp
+    return _aiohttp_module
+
+
+class _Flight:
+    """An upstream request that identical concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncFlight:
+    """An async request that identical callers on the same event loop await together"""
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class GeminiClient:
+    """Pooled HTTP client for the Gemini generateContent endpoint"""
+
+    name = "gemini"
+
+    def __init__(self, api_key=None, model=None):
+        """Load the key and model once and open a keep-alive session"""
+        # requests is imported here rather than at module load so that commands
+        # which never reach the network do not pay for it at startup
+        with timings.span("import_requests"):
+            import requests
+            from requests.adapters import HTTPAdapter
+
+        with timings.span("load_key"):
+            self.api_key = api_key if api_key is not None else load_api_key()
+            self.model = model or load_model_name()
+        self.deadline, self.max_retries, rate = load_resilience_settings()
+        self.limiter = TokenBucket(rate)
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_RESET)
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.coalesced_requests = 0
+        self._loops = weakref.WeakKeyDictionary()  # event loop -> (aiohttp session, flights)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def healthy(self):
+        """Whether a request may be sent: a key is configured and the circuit is closed"""
+        return bool(self.api_key) and self.breaker.retry_in() == 0
+
+    def endpoint(self, model, method="generateContent"):
+        """Build the REST URL for a model method"""
+        return f"{API_BASE}/models/{model}:{method}"
+
+    def build_payload(self, prompt):
+        """Build the request body for a single-turn prompt"""
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {"text": prompt}
+                    ]
+                }
+            ]
+        }
+
+    def generate(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None, deadline=None):
+        """Return the model's answer to prompt, served from the response cache when possible.
+
+        Identical requests already in flight (same prompt, model and word limit) are not
+        sent again: the caller waits for the first one and receives its answer or error.
+        Setting the threading.Event cancel stops a waiting caller with a GeminiError.
+        deadline (seconds) shortens api_deadline_seconds for this request, retries included.
+        """
+        model = model or self.model
+        if use_cache:
+            with timings.span("cache_lookup"):
+                cached = response_cache.get_response(prompt, model, word_limit)
+            if cached is not None:
+                return cached
+
+        if not self.api_key:
+            raise GeminiError("Gemini API key not found. Run installer first.")
+
+        key = response_cache.make_key(prompt, model, word_limit)
+        flight, leader = self._join_flight(key)
+        while not leader:
+            text = self._wait_for_flight(flight, cancel)
+            if text is not None:
+                return text
+            # The first caller gave up without an answer, so send the request ourselves
+            flight, leader = self._join_flight(key)
+
+        try:
+            try:
+                text = self._call(lambda timeout: self._fetch(prompt, model, timeout), deadline)
+            except GeminiError as e:
+                text = self._fallback(prompt, model, word_limit, use_cache) if e.transient else None
+                if text is None:
+                    raise
+            else:
+                if use_cache:
+                    with timings.span("cache_store"):
+                        response_cache.store_response(prompt, model, text, word_limit)
+            flight.result = text
+        except GeminiError as e:
+            flight.error = e
+            raise
+        finally:
+            self._leave_flight(key, flight)
+        return text
+
+    def _call(self, send, deadline=None):
+        """Run send(timeout) under the rate limiter, retry policy and circuit breaker.
+
+        Transient failures are retried with jittered exponential backoff (honouring
+        Retry-After) until max_retries or the request deadline is reached. While the
+        circuit is open the call fails at once instead of waiting on a sick upstream.
+        """
+        deadline = time.monotonic() + (self.deadline if deadline is None else min(deadline, self.deadline))
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise GeminiError(
+                    f"Gemini API is unavailable; not retrying for {self.breaker.retry_in():.0f}s.",
+                    transient=True
+                )
+            try:
+                with timings.span("rate_limit"):
+                    self.limiter.acquire(deadline)
+            except DeadlineExceeded as e:
+                raise GeminiError(f"Request deadline exceeded: {e}.", transient=True)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GeminiError("Request deadline exceeded.", transient=True)
+
+            try:
+                try:
+                    result = send((min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining)))
+                finally:
+                    self.breaker.release()
+            except GeminiError as e:
+                if e.status_code == 429:
+                    self.limiter.penalize(e.retry_after)
+                elif e.transient:
+                    self.breaker.record_failure()
+                delay = max(backoff_delay(attempt), e.retry_after or 0)
+                if not e.transient or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                with timings.span("retry_backoff"):
+                    time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.limiter.reward()
+            return result
+
+    def _fallback(self, prompt, model, word_limit, use_cache):
+        """An expired cached answer or an offline one for when Gemini cannot be reached"""
+        if use_cache:
+            stale = response_cache.get_response(prompt, model, word_limit, allow_stale=True)
+            if stale is not None:
+                return f"{stale}\n\n(Cached answer: Gemini is unavailable right now.)"
+        if knowledge_base.offline_enabled():
+            entry = knowledge_base.lookup(prompt)
+            if entry:
+                return f"{knowledge_base.format_entry(entry)}\n\n(Offline answer: Gemini is unavailable right now.)"
+        return None
+
+    def _post(self, url, params, prompt, timeout, stream=False):
+        """POST a prompt and check the status, raising GeminiError on any failure"""
+        import requests
+        try:
+            with timings.span("http"):
+                connections = self._open_connections(url)
+                response = self.session.post(
+                    url,
+                    params=params,
+                    json=self.build_payload(prompt),
+                    timeout=timeout,
+                    stream=stream
+                )
+                self._record_request_timings(response, url, connections)
+        except requests.Timeout as e:
+            raise GeminiError(f"Request timed out: {e}", transient=True)
+        except requests.RequestException as e:
+            raise GeminiError(f"Request failed: {e}", transient=True)
+
+        if response.status_code != 200:
+            with response:
+                raise GeminiError(
+                    f"API request failed — Status Code {response.status_code}\n{response.text}",
+                    response.status_code,
+                    retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                )
+        return response
+
+    def _fetch(self, prompt, model, timeout):
+        """Send one generateContent request and return the answer text"""
+        response = self._post(self.endpoint(model), {"key": self.api_key}, prompt, timeout)
+
+        try:
+            with timings.span("json_decode"):
+                text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, ValueError):
+            raise GeminiError("Unexpected API response format.")
+        return text
+
+    def _join_flight(self, key):
+        """Return (flight, True) when the caller must send the request, else the flight to wait on"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                return flight, True
+            self.coalesced_requests += 1
+            return flight, False
+
+    def _leave_flight(self, key, flight):
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.done.set()
+
+    def _wait_for_flight(self, flight, cancel=None):
+        """Wait for another caller's request; returns None if it ended without an answer"""
+        with timings.span("coalesced_wait"):
+            if cancel is None:
+                flight.done.wait()
+            else:
+                while not flight.done.wait(CANCEL_POLL_INTERVAL):
+                    if cancel.is_set():
+                        raise GeminiError("Request cancelled.")
+        if flight.error is not None:
+            # A fresh exception per waiter; the leader's own traceback stays with the leader
+            error = flight.error
+            raise GeminiError(str(error), error.status_code, error.retry_after, error.transient)
+        return flight.result
+
+    def _connections_opened(self, url):
+        pools = self.session.get_adapter(url).poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def _open_connections(self, url):
+        """Number of connections the adapter has opened so far (only while timing)"""
+        if not timings.enabled():
+            return None
+        return self._connections_opened(url)
+
+    def _record_request_timings(self, response, url, connections):
+        """Record the time until the response headers arrived"""
+        # requests measures 'elapsed' from sending until the headers are parsed; when a
+        # new connection was opened this also includes DNS, TCP and TLS set-up
+        if connections is None:
+            return
+        reused = self._connections_opened(url) == connections
+        waited = response.elapsed.total_seconds()
+        timings.record("server (reused connection)" if reused else "connect + server", waited)
+
+    def stream(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None):
+        """Yield the answer in pieces as the server sends them (server-sent events).
+
+        A caller that joins an identical request already in flight receives the whole
+        answer as a single piece once it is complete.
+        """
+        model = model or self.model
+        if use_cache:
+            with timings.span("cache_lookup"):
+                cached = response_cache.get_response(prompt, model, word_limit)
+            if cached is not None:
+                yield cached
+                return
+
+        if not self.api_key:
+            raise GeminiError("Gemini API key not found. Run installer first.")
+
+        key = response_cache.make_key(prompt, model, word_limit)
+        flight, leader = self._join_flight(key)
+        while not leader:
+            text = self._wait_for_flight(flight, cancel)
+            if text is not None:
+                yield text
+                return
+            flight, leader = self._join_flight(key)
+
+        pieces = []
+        try:
+            # Only opening the stream is retried; once text has been shown it cannot be taken back
+            try:
+                response = self._call(lambda timeout: self._post(
+                    self.endpoint(model, "streamGenerateContent"),
+                    {"key": self.api_key, "alt": "sse"}, prompt, timeout, stream=True
+                ))
+            except GeminiError as e:
+                fallback = self._fallback(prompt, model, word_limit, use_cache) if e.transient else None
+                if fallback is None:
+                    raise
+                flight.result = fallback
+                yield fallback
+                return
+
+            for text in self._read_stream(response):
+                pieces.append(text)
+                yield text
+            answer = "".join(pieces)
+            if use_cache:
+                with timings.span("cache_store"):
+                    response_cache.store_response(prompt, model, answer, word_limit)
+            flight.result = answer
+        except GeminiError as e:
+            flight.error = e
+            raise
+        finally:
+            # Also runs when the caller stops reading early; waiters then retry themselves
+            self._leave_flight(key, flight)
+
+    def _read_stream(self, response):
+        """Yield the text pieces of an open streamGenerateContent response"""
+        import requests
+        with response:
+            pieces = []
+            body_start = time.perf_counter()
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:].strip())
+                    for part in event['candidates'][0]['content'].get('parts', []):
+                        text = part.get('text')
+                        if text:
+                            pieces.append(text)
+                            yield text
+            except requests.RequestException as e:
+                raise GeminiError(f"Request failed: {e}", transient=True)
+            except (KeyError, IndexError, ValueError):
+                raise GeminiError("Unexpected API response format.")
+            # Includes the time the caller spent handling each piece (usually printing it)
+            timings.record("stream_body", time.perf_counter() - body_start)
+
+        if not pieces:
+            raise GeminiError("Unexpected API response format.")
+
+    async def agenerate(self, prompt, model=None, word_limit=None, use_cache=True):
+        """Async generate(): the same cache, rate limit, retries and circuit breaker, without
+        blocking the event loop.
+
+        Requests go through one aiohttp connection pool per event loop when aiohttp is
+        installed, otherwise through generate() in a worker thread. Identical requests from
+        the same loop are sent once. Cancelling the awaiting task abandons the request
+        once no other caller is waiting for it.
+        """
+        import asyncio
+        if _aiohttp() is None:
+            return await asyncio.to_thread(self.generate, prompt, model, word_limit, use_cache)
+
+        model = model or self.model
+        if use_cache:
+            cached = response_cache.get_response(prompt, model, word_limit)
+            if cached is not None:
+                return cached
+
+        if not self.api_key:
+            raise GeminiError("Gemini API key not found. Run installer first.")
+
+        key = response_cache.make_key(prompt, model, word_limit)
+        _, flights = self._loop_state()
+        flight = flights.get(key)
+        if flight is None:
+            flight = _AsyncFlight(asyncio.ensure_future(self._agenerate(prompt, model, word_limit, use_cache)))
+            flights[key] = flight
+            flight.task.add_done_callback(lambda _: flights.pop(key, None) if flights.get(key) is flight else None)
+        else:
+            self.coalesced_requests += 1
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    async def _agenerate(self, prompt, model, word_limit, use_cache):
+        session, _ = self._loop_state()
+        try:
+            text = await self._acall(lambda timeout: self._afetch(session, prompt, model, timeout))
+        except GeminiError as e:
+            text = self._fallback(prompt, model, word_limit, use_cache) if e.transient else None
+            if text is None:
+                raise
+            return text
+        if use_cache:
+            response_cache.store_response(prompt, model, text, word_limit)
+        return text
+
+    async def _acall(self, send):
+        """Async _call(): waits for the rate limiter and between retries without blocking"""
+        import asyncio
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise GeminiError(
+                    f"Gemini API is unavailable; not retrying for {self.breaker.retry_in():.0f}s.",
+                    transient=True
+                )
+            try:
+                wait = self.limiter.reserve(deadline)
+            except DeadlineExceeded as e:
+                raise GeminiError(f"Request deadline exceeded: {e}.", transient=True)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise GeminiError("Request deadline exceeded.", transient=True)
+
+            try:
+                try:
+                    result = await send((min(CONNECT_TIMEOUT, remaining), min(READ_TIMEOUT, remaining)))
+                finally:
+                    self.breaker.release()
+            except GeminiError as e:
+                if e.status_code == 429:
+                    self.limiter.penalize(e.retry_after)
+                elif e.transient:
+                    self.breaker.record_failure()
+                delay = max(backoff_delay(attempt), e.retry_after or 0)
+                if not e.transient or attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self.limiter.reward()
+            return result
+
+    async def _afetch(self, session, prompt, model, timeout):
+        """Send one generateContent request with aiohttp and return the answer text"""
+        import asyncio
+        aiohttp = _aiohttp()
+        connect, read = timeout
+        try:
+            async with session.post(
+                self.endpoint(model),
+                params={"key": self.api_key},
+                json=self.build_payload(prompt),
+                timeout=aiohttp.ClientTimeout(total=connect + read, sock_connect=connect, sock_read=read)
+            ) as response:
+                if response.status != 200:
+                    raise GeminiError(
+                        f"API request failed — Status Code {response.status}\n{await response.text()}",
+                        response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                body = await response.json(content_type=None)
+        except asyncio.TimeoutError as e:
+            raise GeminiError(f"Request timed out: {e}", transient=True)
+        except aiohttp.ClientError as e:
+            raise GeminiError(f"Request failed: {e}", transient=True)
+        except ValueError:
+            raise GeminiError("Unexpected API response format.")
+
+        try:
+            return body['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, TypeError):
+            raise GeminiError("Unexpected API response format.")
+
+    def _loop_state(self):
+        """The aiohttp session and in-flight requests of the running event loop"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        state = self._loops.get(loop)
+        if state is None or state[0].closed:
+            aiohttp = _aiohttp()
+            connector = aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE)
+            session = aiohttp.ClientSession(connector=connector, headers={"Content-Type": "application/json"})
+            state = self._loops[loop] = (session, {})
+        return state
+
+    async def aclose(self):
+        """Close the running event loop's connection pool (call before the loop ends)"""
+        import asyncio
+        state = self._loops.pop(asyncio.get_running_loop(), None)
+        if state is not None:
+            await state[0].close()
+
+
+# Check whether answers should be streamed to the terminal as they arrive
+def streaming_enabled():
+    value = settings_manager.snapshot().get("stream_output", True)
+    return str(value).lower() not in ("false", "0", "no", "off")
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Shared client per API key, so every caller reuses the same connection pool
+def get_client(api_key=None):
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = GeminiClient(api_key=api_key)
+            _clients[api_key] = client
+        return client
@@ -1,5 +1,8 @@
 import os
-import google.generativeai as genai
+from . import timings, semantic_cache, error_groups, prompt_budget
+from .gemini_client import GeminiError
+from .providers import get_provider
+from .knowledge_base import lookup as lookup_known_error, format_entry, offline_enabled
 from .utils.logger import setup_logger
 from .utils.text_formatter import format_text
 
@@ -14,49 +17,170 @@ class GeminiAPI:
         self.setup_client()
         
     def setup_client(self):
-        """Set up the Gemini API client with API key"""
+        """Set up the model provider route; without a Gemini key requests go to the local model
+        and the offline answers"""
         api_key = self.config.api_key
         if not api_key:
             logger.warning("No Gemini API key found. Set GEMINI_API_KEY environment variable or update config.")
-            return
             
-        try:
-            self.client = genai.Client(api_key=api_key)
-            logger.info("Gemini API client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini API client: {e}")
-            self.client = None
+        self.client = get_provider("explain", api_key)
+        logger.info(f"Model providers initialized: {' -> '.join(self.client.names)}")
             
     def explain(self, query, context=None):
         """Get explanation from Gemini API for a query"""
         if not self.client:
             return "Error: Gemini API client not initialized. Check API key."
             
-        model_name = self.config.get("gemini_model", "gemini-2.0-flash")
+        gemini_model = self.config.get("gemini_model")
+        model_name = gemini_model or self.client.model
         word_limit = self.config.get("word_limit", 150)
         
-        prompt = self._build_prompt(query, context, word_limit)
+        # Answers to near-identical questions are reused without a request
+        question = f"{query}\n{context}" if context else query
+        similar = semantic_cache.lookup("query", question, model_name)
+        if similar:
+            with timings.span("format_text"):
+                return format_text(similar[0], self.config)
+            
+        with timings.span("build_prompt"):
+            prompt = self._build_prompt(query, context, word_limit)
         
         try:
-            response = self.client.models.generate_content(
-                model=model_name,
-                contents=prompt
-            )
+            text = self.client.generate(prompt, model=gemini_model, word_limit=word_limit)
             
-            if response.text:
-                return format_text(response.text, self.config)
+            if text:
+                semantic_cache.remember("query", question, text, model_name)
+                with timings.span("format_text"):
+                    return format_text(text, self.config)
             else:
                 return "No explanation available."
                 
-        except Exception as e:
+        except GeminiError as e:
+            logger.error(f"Error in Gemini API request: {e}")
+            return f"Error: Failed to get explanation from Gemini API ({str(e)})"
+            
+    def explain_stream(self, query, context=None):
+        """Yield a formatted explanation line by line as the API streams it"""
+        if not self.client:
+            yield "Error: Gemini API client not initialized. Check API key."
+            return
+            
+        gemini_model = self.config.get("gemini_model")
+        model_name = gemini_model or self.client.model
+        word_limit = self.config.get("word_limit", 150)
+        
+        # Answers to near-identical questions are reused without a request
+        question = f"{query}\n{context}" if context else query
+        similar = semantic_cache.lookup("query", question, model_name)
+        if similar:
+            with timings.span("format_text"):
+                yield format_text(similar[0], self.config)
+            return
+            
+        with timings.span("build_prompt"):
+            prompt = self._build_prompt(query, context, word_limit)
+        
+        # format_text works on whole lines, so only complete lines are emitted
+        pending = ""
+        pieces = []
+        try:
+            for chunk in self.client.stream(prompt, model=gemini_model, word_limit=word_limit):
+                pieces.append(chunk)
+                pending += chunk
+                if "\n" in pending:
+                    complete, pending = pending.rsplit("\n", 1)
+                    yield format_text(complete, self.config) + "\n"
+                    
+            if pending:
+                yield format_text(pending, self.config)
+            elif not pieces:
+                yield "No explanation available."
+            if pieces:
+                semantic_cache.remember("query", question, "".join(pieces), model_name)
+                
+        except GeminiError as e:
+            logger.error(f"Error in Gemini API request: {e}")
+            yield f"Error: Failed to get explanation from Gemini API ({str(e)})"
+            
+    async def aexplain(self, query, context=None):
+        """Async explain(): awaits the API without blocking the event loop"""
+        if not self.client:
+            return "Error: Gemini API client not initialized. Check API key."
+            
+        gemini_model = self.config.get("gemini_model")
+        model_name = gemini_model or self.client.model
+        word_limit = self.config.get("word_limit", 150)
+        
+        question = f"{query}\n{context}" if context else query
+        similar = semantic_cache.lookup("query", question, model_name)
+        if similar:
+            return format_text(similar[0], self.config)
+            
+        prompt = self._build_prompt(query, context, word_limit)
+        
+        try:
+            text = await self.client.agenerate(prompt, model=gemini_model, word_limit=word_limit)
+        except GeminiError as e:
             logger.error(f"Error in Gemini API request: {e}")
             return f"Error: Failed to get explanation from Gemini API ({str(e)})"
             
+        if not text:
+            return "No explanation available."
+        semantic_cache.remember("query", question, text, model_name)
+        return format_text(text, self.config)
+            
     def explain_error(self, error_message, command=None):
         """Get explanation for a specific error message"""
+        known = self._known_error(error_message)
+        if known:
+            return known
+        return self.explain("Explain this error and how to fix it", self._error_context(error_message, command))
+        
+    async def aexplain_error(self, error_message, command=None):
+        """Async explain_error()"""
+        known = self._known_error(error_message)
+        if known:
+            return known
+        return await self.aexplain("Explain this error and how to fix it", self._error_context(error_message, command))
+        
+    def _known_error(self, error_message):
+        """Offline answer for a well-known error, or None"""
+        if offline_enabled():
+            entry = lookup_known_error(error_message)
+            if entry:
+                return format_text(format_entry(entry), self.config)
+        return None
+        
+    def _error_context(self, error_message, command=None):
+        error_message, report = prompt_budget.compact(error_message)
+        if report:
+            logger.info(prompt_budget.describe(report))
         context = f"Command: {command}\n" if command else ""
-        context += f"Error: {error_message}"
-        return self.explain("Explain this error and how to fix it", context)
+        return context + f"Error: {error_message}"
+        
+    def explain_errors(self, errors):
+        """Explain related errors in one request; errors are (error_message, command) pairs.
+        
+        Returns (root_cause, explanations) with one explanation per error.
+        """
+        if not self.client:
+            message = "Error: Gemini API client not initialized. Check API key."
+            return None, [message] * len(errors)
+            
+        group = [{"error": error_message, "command": command} for error_message, command in errors]
+        gemini_model = self.config.get("gemini_model")
+        try:
+            root_cause, answers = error_groups.explain_errors(group, self.client, gemini_model)
+        except GeminiError as e:
+            logger.error(f"Error in Gemini API request: {e}")
+            message = f"Error: Failed to get explanation from Gemini API ({str(e)})"
+            return None, [message] * len(errors)
+            
+        with timings.span("format_text"):
+            answers = [format_text(answer, self.config) if answer else "No explanation available." for answer in answers]
+            if root_cause:
+                root_cause = format_text(root_cause, self.config)
+        return root_cause, answers
         
     def _build_prompt(self, query, context=None, word_limit=150):
         """Build a prompt for the Gemini API"""
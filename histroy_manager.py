@@ -1,43 +1,225 @@
 import json
 import os
+import socket
+import sqlite3
+import time
 from datetime import datetime
+from . import error_signature, record_store, settings_manager, timings
 
 # Constants
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 LOG_FILE = os.path.join(DATA_DIR, 'error_logs.json')
+HISTORY_FILE = os.path.join(DATA_DIR, 'error_history.db')
 
-# Load log data
-def load_logs():
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_MAX_RECORDS = 200000
+COMPACT_EVERY = 1000  # inserts between automatic compactions
+
+# Read retention limits from settings
+def load_history_settings():
+    settings = settings_manager.snapshot()
+    try:
+        retention_days = float(settings.get("history_retention_days", DEFAULT_RETENTION_DAYS))
+    except (TypeError, ValueError):
+        retention_days = DEFAULT_RETENTION_DAYS
+    try:
+        max_records = int(settings.get("history_max_records", DEFAULT_MAX_RECORDS))
+    except (TypeError, ValueError):
+        max_records = DEFAULT_MAX_RECORDS
+    return retention_days, max_records
+
+# Open the history database (WAL mode: many shells append while others read)
+def connect():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(HISTORY_FILE, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS errors ("
+        " id INTEGER PRIMARY KEY,"
+        " timestamp REAL NOT NULL,"
+        " command TEXT,"
+        " error TEXT NOT NULL,"
+        " exit_code INTEGER,"
+        " signature TEXT NOT NULL,"
+        " host TEXT);"
+        "CREATE INDEX IF NOT EXISTS errors_timestamp ON errors (timestamp);"
+        "CREATE INDEX IF NOT EXISTS errors_command ON errors (command, timestamp);"
+        "CREATE INDEX IF NOT EXISTS errors_signature ON errors (signature, timestamp);"
+        # Per-day counters keep 'top errors' queries independent of the number of records
+        "CREATE TABLE IF NOT EXISTS daily_counts ("
+        " day TEXT NOT NULL,"
+        " signature TEXT NOT NULL,"
+        " count INTEGER NOT NULL,"
+        " sample TEXT NOT NULL,"
+        " last_seen REAL NOT NULL,"
+        " PRIMARY KEY (day, signature));"
+    )
+    _migrate_json_logs(conn)
+    return conn
+
+# Import the old error_logs.json once, then move it out of the way
+def _migrate_json_logs(conn):
     if not os.path.exists(LOG_FILE):
-        return []
-    with open(LOG_FILE, 'r') as file:
-        return json.load(file)
+        return
+    try:
+        with open(LOG_FILE, 'r') as file:
+            logs = json.load(file)
+    except (OSError, ValueError):
+        logs = []
+    for log in logs:
+        try:
+            timestamp = datetime.strptime(log["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+        except (KeyError, ValueError):
+            timestamp = time.time()
+        _insert(conn, log.get("error", ""), None, None, timestamp)
+    conn.commit()
+    os.replace(LOG_FILE, LOG_FILE + ".migrated")
 
-# Save log data
-def save_logs(logs):
-    with open(LOG_FILE, 'w') as file:
-        json.dump(logs, file, indent=4)
+def _insert(conn, error_text, command, exit_code, timestamp):
+    signature = error_signature.fingerprint(error_text)
+    cursor = conn.execute(
+        "INSERT INTO errors (timestamp, command, error, exit_code, signature, host) VALUES (?, ?, ?, ?, ?, ?)",
+        (timestamp, command, record_store.pack_text(error_text), exit_code, signature, socket.gethostname())
+    )
+    day = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d")
+    conn.execute(
+        "INSERT INTO daily_counts (day, signature, count, sample, last_seen) VALUES (?, ?, 1, ?, ?)"
+        " ON CONFLICT (day, signature) DO UPDATE SET count = count + 1, sample = excluded.sample,"
+        " last_seen = MAX(last_seen, excluded.last_seen)",
+        (day, signature, error_text[:500], timestamp)
+    )
+    return cursor.lastrowid
 
 # Add a new error log
-def add_error_log(error_text):
-    logs = load_logs()
-    new_log = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "error": error_text
-    }
-    logs.append(new_log)
-    if len(logs) > 5:
-        logs = logs[-5:]  # Keep only last 5
-    save_logs(logs)
+def add_error_log(error_text, command=None, exit_code=None):
+    with timings.span("history_write"):
+        _add_error_log(error_text, command, exit_code)
+
+def _add_error_log(error_text, command, exit_code):
+    try:
+        conn = connect()
+    except sqlite3.Error:
+        return
+    try:
+        with conn:
+            row_id = _insert(conn, error_text, command, exit_code, time.time())
+        if row_id % COMPACT_EVERY == 0:
+            _compact(conn)
+    except sqlite3.Error:
+        pass
+    finally:
+        conn.close()
+
+# Load the most recent logs, newest last
+def load_logs(limit=5, command=None):
+    if not os.path.exists(HISTORY_FILE) and not os.path.exists(LOG_FILE):
+        return []
+    conn = connect()
+    try:
+        if command:
+            rows = conn.execute(
+                "SELECT timestamp, command, error, exit_code FROM errors WHERE command = ?"
+                " ORDER BY timestamp DESC LIMIT ?", (command, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT timestamp, command, error, exit_code FROM errors ORDER BY timestamp DESC LIMIT ?", (limit,)
+            ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {
+            "timestamp": datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+            "command": cmd,
+            "error": record_store.unpack_text(error),
+            "exit_code": exit_code
+        }
+        for timestamp, cmd, error, exit_code in reversed(rows)
+    ]
+
+# Errors logged in the last few seconds, oldest first, with raw timestamps
+def recent_errors(seconds, limit=100):
+    if not os.path.exists(HISTORY_FILE):
+        return []
+    conn = connect()
+    try:
+        rows = conn.execute(
+            "SELECT timestamp, command, error, exit_code FROM errors WHERE timestamp >= ?"
+            " ORDER BY timestamp DESC LIMIT ?", (time.time() - seconds, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"timestamp": timestamp, "command": cmd, "error": record_store.unpack_text(error), "exit_code": exit_code}
+        for timestamp, cmd, error, exit_code in reversed(rows)
+    ]
+
+# Most frequent error signatures over the last few days
+def top_errors(days=7, limit=10):
+    if not os.path.exists(HISTORY_FILE):
+        return []
+    since = datetime.fromtimestamp(time.time() - days * 86400).strftime("%Y-%m-%d")
+    conn = connect()
+    try:
+        rows = conn.execute(
+            "SELECT signature, SUM(count) AS total, MAX(last_seen),"
+            " (SELECT sample FROM daily_counts d2 WHERE d2.signature = d.signature ORDER BY day DESC LIMIT 1)"
+            " FROM daily_counts d WHERE day >= ? GROUP BY signature ORDER BY total DESC LIMIT ?",
+            (since, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"signature": sig, "count": total, "last_seen": last_seen, "sample": sample}
+        for sig, total, last_seen, sample in rows
+    ]
+
+def _compact(conn):
+    retention_days, max_records = load_history_settings()
+    cutoff = time.time() - retention_days * 86400
+    cutoff_day = datetime.fromtimestamp(cutoff).strftime("%Y-%m-%d")
+    with conn:
+        removed = conn.execute("DELETE FROM errors WHERE timestamp < ?", (cutoff,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM errors WHERE id IN (SELECT id FROM errors ORDER BY timestamp DESC LIMIT -1 OFFSET ?)",
+            (max(max_records, 0),)
+        ).rowcount
+        conn.execute("DELETE FROM daily_counts WHERE day < ?", (cutoff_day,))
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return removed
+
+# Apply retention limits and reclaim space, returns number of records removed
+def compact_history():
+    conn = connect()
+    try:
+        removed = _compact(conn)
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return removed
 
 # Display logs
-def view_error_logs():
-    logs = load_logs()
+def view_error_logs(limit=5):
+    logs = load_logs(limit)
     if not logs:
         print("No errors logged yet.")
         return
 
-    print("\n[Last 5 Error Logs]:\n")
+    print(f"\n[Last {limit} Error Logs]:\n")
     for log in logs:
-        print(f"[{log['timestamp']}] {log['error']}")
+        command = f" ({log['command']})" if log["command"] else ""
+        print(f"[{log['timestamp']}]{command} {log['error']}")
+
+# Display the most frequent errors
+def view_top_errors(days=7, limit=10):
+    errors = top_errors(days, limit)
+    if not errors:
+        print("No errors logged yet.")
+        return
+
+    print(f"\n[Top Errors, last {days} days]:\n")
+    for entry in errors:
+        sample = entry["sample"].splitlines()[0] if entry["sample"] else ""
+        print(f"{entry['count']:>6}x  {sample}")
@@ -35,11 +35,6 @@ if [ ! -f "../data/settings.json" ]; then
 EOL
 fi
 
-# Create empty error_logs.json if not exists
-if [ ! -f "../data/error_logs.json" ]; then
-    echo "[]" > ../data/error_logs.json
-fi
-
 # Prompt for Gemini API Key
 echo ""
 read -p "Enter your Google Gemini API key: " GEMINI_API_KEY
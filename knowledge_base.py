@@ -0,0 +1,336 @@
+import json
+import os
+import re
+import threading
+from . import settings_manager, timings
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+USER_KB_FILE = os.path.join(DATA_DIR, 'knowledge_base.json')
+TAIL_LINES = 3          # only the last lines of an error message are matched
+
+# Bundled answers for the most common Linux terminal errors. When two patterns
+# match at the same position the earlier entry wins, so specific entries go first.
+# Extra entries with the same shape can be added to data/knowledge_base.json.
+BUILTIN_ENTRIES = [
+    {
+        "id": "git-auth",
+        "patterns": [r"Permission denied \(publickey\)", r"Authentication failed for", r"could not read Username"],
+        "explanation": "The remote rejected your credentials: no SSH key is loaded or registered, or the HTTPS token/password is wrong.",
+        "fix": "Test SSH with `ssh -T git@<host>`, add your key with `ssh-add`, or use a personal access token for HTTPS remotes."
+    },
+    {
+        "id": "docker-socket",
+        "patterns": [r"permission denied while trying to connect to the Docker daemon socket", r"Cannot connect to the Docker daemon"],
+        "explanation": "Either the Docker daemon is not running or your user is not allowed to use its socket.",
+        "fix": "Start it with `sudo systemctl start docker`, and add yourself to the docker group with `sudo usermod -aG docker $USER` (log out and back in)."
+    },
+    {
+        "id": "command-not-found",
+        "patterns": [r"command not found", r"No such file or directory.*\bexec\b", r"not found in \$PATH"],
+        "explanation": "The shell could not find a program with that name in any directory listed in $PATH. The command is misspelled, the package providing it is not installed, or it lives in a directory that is not on your PATH.",
+        "fix": "Check the spelling, install the package (e.g. `sudo apt install <package>` or `sudo dnf install <package>`), or run it with its full path. `command -v <name>` shows what the shell would run."
+    },
+    {
+        "id": "permission-denied",
+        "patterns": [r"Permission denied", r"\bEACCES\b"],
+        "explanation": "Your user does not have the rights needed for this file or directory: read for opening, write for changing, execute for running a program or entering a directory.",
+        "fix": "Inspect permissions with `ls -l <path>`. Make a script executable with `chmod +x <file>`, fix ownership with `sudo chown $USER <path>`, or run the command with `sudo` if it really needs root."
+    },
+    {
+        "id": "operation-not-permitted",
+        "patterns": [r"Operation not permitted", r"\bEPERM\b"],
+        "explanation": "The kernel refused the operation for this process regardless of file permissions, typically because it needs root, the file is immutable, or a security policy (SELinux, AppArmor, container limits) blocks it.",
+        "fix": "Retry with `sudo`, check immutable attributes with `lsattr <file>`, and look at `dmesg` or the audit log for policy denials."
+    },
+    {
+        "id": "no-such-file",
+        "patterns": [r"No such file or directory", r"\bENOENT\b", r"cannot access .*: No such file"],
+        "explanation": "The path you gave does not exist, relative to the current directory if it does not start with `/`.",
+        "fix": "Check the path with `ls`, confirm the current directory with `pwd`, and use tab completion to avoid typos."
+    },
+    {
+        "id": "disk-full",
+        "patterns": [r"No space left on device", r"\bENOSPC\b"],
+        "explanation": "The filesystem you are writing to is full, or it has run out of inodes (too many small files).",
+        "fix": "Find the full filesystem with `df -h` (and `df -i` for inodes), then free space: `du -sh * | sort -h` to find large directories, `sudo journalctl --vacuum-size=200M`, `sudo apt clean`."
+    },
+    {
+        "id": "address-in-use",
+        "patterns": [r"Address already in use", r"\bEADDRINUSE\b", r"bind\(\) .* failed"],
+        "explanation": "Another process is already listening on the port your program tried to bind, or a socket from a previous run is still in TIME_WAIT.",
+        "fix": "Find the owner with `sudo ss -ltnp | grep :<port>` or `sudo lsof -i :<port>`, stop it, or start your program on a different port."
+    },
+    {
+        "id": "connection-refused",
+        "patterns": [r"Connection refused", r"\bECONNREFUSED\b"],
+        "explanation": "The host was reachable but nothing is listening on that port, or a firewall actively rejected the connection.",
+        "fix": "Check the service is running (`systemctl status <service>`), listening on the expected address and port (`ss -ltn`), and that the firewall allows it."
+    },
+    {
+        "id": "connection-timed-out",
+        "patterns": [r"Connection timed out", r"\bETIMEDOUT\b", r"Operation timed out"],
+        "explanation": "No reply arrived from the remote host. It is down, unreachable from this network, or a firewall is silently dropping the traffic.",
+        "fix": "Test reachability with `ping <host>` and `traceroute <host>`, check the port with `nc -vz <host> <port>`, and review firewall or security group rules."
+    },
+    {
+        "id": "name-resolution",
+        "patterns": [r"Could not resolve host", r"Temporary failure in name resolution", r"Name or service not known", r"getaddrinfo.*failed"],
+        "explanation": "The hostname could not be turned into an IP address: DNS is unreachable or misconfigured, or the name is wrong.",
+        "fix": "Check the name for typos, test DNS with `getent hosts <host>` or `dig <host>`, and inspect `/etc/resolv.conf` and your network connection."
+    },
+    {
+        "id": "network-unreachable",
+        "patterns": [r"Network is unreachable", r"\bENETUNREACH\b", r"No route to host"],
+        "explanation": "The system has no route to the destination network; the interface is down, there is no default gateway, or a firewall rejects the traffic.",
+        "fix": "Check interfaces with `ip addr`, routes with `ip route`, and try `ping` to your gateway."
+    },
+    {
+        "id": "is-a-directory",
+        "patterns": [r"Is a directory", r"\bEISDIR\b"],
+        "explanation": "A command that expects a file was given a directory.",
+        "fix": "Point the command at a file inside the directory, or use the recursive option (`cp -r`, `rm -r`) when you mean the whole directory."
+    },
+    {
+        "id": "not-a-directory",
+        "patterns": [r"Not a directory", r"\bENOTDIR\b"],
+        "explanation": "Part of the path that should be a directory is actually a regular file.",
+        "fix": "Check each component of the path with `ls -ld`, and remove the trailing `/` if you meant a file."
+    },
+    {
+        "id": "directory-not-empty",
+        "patterns": [r"Directory not empty", r"\bENOTEMPTY\b"],
+        "explanation": "`rmdir` (or a rename) only works on empty directories, and this one still has files in it.",
+        "fix": "List the contents with `ls -A`, then remove them first or use `rm -r <dir>` if you are sure."
+    },
+    {
+        "id": "file-exists",
+        "patterns": [r"File exists", r"\bEEXIST\b"],
+        "explanation": "The file or directory you are trying to create already exists.",
+        "fix": "Use `mkdir -p` for directories, `ln -sf` to replace a link, or choose another name."
+    },
+    {
+        "id": "read-only-fs",
+        "patterns": [r"Read-only file system", r"\bEROFS\b"],
+        "explanation": "The filesystem is mounted read-only, either on purpose or because the kernel remounted it after detecting errors.",
+        "fix": "Check with `mount | grep <mountpoint>` and `dmesg` for disk errors; remount with `sudo mount -o remount,rw <mountpoint>` only if the disk is healthy."
+    },
+    {
+        "id": "too-many-open-files",
+        "patterns": [r"Too many open files", r"\bEMFILE\b", r"\bENFILE\b"],
+        "explanation": "The process hit its limit on open file descriptors (or the system-wide limit).",
+        "fix": "Check the limit with `ulimit -n`, raise it for the session with `ulimit -n 65535`, or permanently in `/etc/security/limits.conf` or the service's `LimitNOFILE`."
+    },
+    {
+        "id": "text-file-busy",
+        "patterns": [r"Text file busy", r"\bETXTBSY\b"],
+        "explanation": "You are trying to overwrite or modify an executable that is currently running.",
+        "fix": "Stop the running program (`pgrep -a <name>`), or write the new version to a temporary file and `mv` it into place."
+    },
+    {
+        "id": "device-busy",
+        "patterns": [r"Device or resource busy", r"\bEBUSY\b", r"target is busy"],
+        "explanation": "The device or mount point is in use, usually by a process with open files or a shell whose current directory is inside it.",
+        "fix": "Find users with `sudo lsof +D <mountpoint>` or `fuser -vm <mountpoint>`, close them (and `cd` out), then retry."
+    },
+    {
+        "id": "killed-oom",
+        "patterns": [r"\bKilled\b$", r"Out of memory", r"oom-kill", r"Cannot allocate memory", r"\bENOMEM\b"],
+        "explanation": "The system ran out of memory and the kernel's OOM killer terminated the process, or an allocation failed.",
+        "fix": "Confirm with `dmesg | grep -i oom`, check usage with `free -h`, and reduce memory use, add swap, or raise the container/cgroup memory limit."
+    },
+    {
+        "id": "segfault",
+        "patterns": [r"Segmentation fault", r"\bSIGSEGV\b", r"core dumped"],
+        "explanation": "The program accessed memory it was not allowed to and crashed. This is a bug in the program or one of its libraries, or a mismatched library version.",
+        "fix": "Update or reinstall the program, check library versions with `ldd <binary>`, and inspect the crash with `coredumpctl info` or `gdb`."
+    },
+    {
+        "id": "shared-library",
+        "patterns": [r"error while loading shared libraries", r"cannot open shared object file"],
+        "explanation": "The program needs a shared library (.so) that the dynamic linker cannot find, usually because it is not installed or is a different version.",
+        "fix": "Install the package that provides the library (`apt-file search <lib>` or `dnf provides '*/<lib>'`), or add its directory to `/etc/ld.so.conf.d/` and run `sudo ldconfig`."
+    },
+    {
+        "id": "exec-format",
+        "patterns": [r"Exec format error", r"\bENOEXEC\b", r"cannot execute binary file"],
+        "explanation": "The file is not a program this machine can run: it was built for another CPU architecture, or it is a script without a `#!` line.",
+        "fix": "Check it with `file <binary>` and `uname -m`, download the build for your architecture, or add a shebang such as `#!/bin/bash` to scripts."
+    },
+    {
+        "id": "bad-interpreter",
+        "patterns": [r"bad interpreter", r"/bin/bash\^M"],
+        "explanation": "The interpreter in the script's `#!` line does not exist, often because the file has Windows (CRLF) line endings.",
+        "fix": "Convert line endings with `dos2unix <script>` or `sed -i 's/\\r$//' <script>`, and make sure the interpreter path in the shebang exists."
+    },
+    {
+        "id": "sudoers",
+        "patterns": [r"is not in the sudoers file", r"not allowed to execute .* as root"],
+        "explanation": "Your account is not allowed to use `sudo` on this machine.",
+        "fix": "Ask an administrator to add you, e.g. `usermod -aG sudo <user>` (Debian/Ubuntu) or `usermod -aG wheel <user>` (RHEL/Fedora), then log in again."
+    },
+    {
+        "id": "dpkg-lock",
+        "patterns": [r"Could not get lock /var/lib/dpkg", r"Unable to acquire the dpkg frontend lock", r"/var/lib/apt/lists/lock"],
+        "explanation": "Another package manager process (apt, dpkg or unattended-upgrades) is running and holding the lock.",
+        "fix": "Wait for it to finish (`ps aux | grep -E 'apt|dpkg'`). If nothing is running after a crash, run `sudo dpkg --configure -a`."
+    },
+    {
+        "id": "apt-unable-to-locate",
+        "patterns": [r"Unable to locate package", r"No match for argument", r"has no installation candidate"],
+        "explanation": "The package manager does not know a package by that name in the enabled repositories.",
+        "fix": "Refresh the package lists (`sudo apt update` or `sudo dnf makecache`), check the exact name with `apt search` or `dnf search`, and enable the needed repository."
+    },
+    {
+        "id": "git-not-repo",
+        "patterns": [r"not a git repository"],
+        "explanation": "You ran a git command outside a git working tree.",
+        "fix": "`cd` into the repository, or create one with `git init` / `git clone <url>`."
+    },
+    {
+        "id": "git-push-rejected",
+        "patterns": [r"\[rejected\].*\(fetch first\)", r"\[rejected\].*non-fast-forward", r"Updates were rejected because"],
+        "explanation": "The remote branch has commits you do not have locally, so pushing would overwrite them.",
+        "fix": "Run `git pull --rebase` (or `git fetch` and merge), resolve any conflicts, then push again."
+    },
+    {
+        "id": "ssh-host-key",
+        "patterns": [r"REMOTE HOST IDENTIFICATION HAS CHANGED", r"Host key verification failed"],
+        "explanation": "The server's SSH host key does not match the one saved in `~/.ssh/known_hosts`. The server may have been reinstalled, or the connection may be intercepted.",
+        "fix": "Confirm the new key with the server's administrator, then remove the old one with `ssh-keygen -R <host>` and reconnect."
+    },
+    {
+        "id": "python-module",
+        "patterns": [r"ModuleNotFoundError: No module named", r"ImportError: No module named"],
+        "explanation": "Python cannot find the module in the interpreter or virtual environment you are using.",
+        "fix": "Install it with `python3 -m pip install <package>` using the same interpreter, or activate the right virtual environment first."
+    },
+    {
+        "id": "pip-externally-managed",
+        "patterns": [r"externally-managed-environment"],
+        "explanation": "Your distribution protects the system Python, so pip will not install packages into it.",
+        "fix": "Create a virtual environment (`python3 -m venv .venv && . .venv/bin/activate`), use `pipx` for tools, or install the distro package (`apt install python3-<name>`)."
+    },
+    {
+        "id": "systemd-unit",
+        "patterns": [r"Unit .* not found", r"Failed to start .*\.service", r"Job for .* failed because"],
+        "explanation": "systemd could not find or start the service.",
+        "fix": "Check the exact unit name with `systemctl list-unit-files | grep <name>`, and read the failure reason with `systemctl status <unit>` and `journalctl -xeu <unit>`."
+    },
+    {
+        "id": "argument-list-too-long",
+        "patterns": [r"Argument list too long", r"\bE2BIG\b"],
+        "explanation": "A wildcard expanded to more arguments than the kernel allows for a single command.",
+        "fix": "Process the files in chunks, e.g. `find . -name '*.log' -print0 | xargs -0 rm` or `find . -name '*.log' -delete`."
+    },
+    {
+        "id": "broken-pipe",
+        "patterns": [r"Broken pipe", r"\bEPIPE\b"],
+        "explanation": "The program wrote to a pipe or socket whose reader had already exited (for example after `| head`). In pipelines this is usually harmless.",
+        "fix": "Ignore it for interactive pipelines; for network programs check why the other side closed the connection."
+    },
+    {
+        "id": "syntax-error-token",
+        "patterns": [r"syntax error near unexpected token", r"unexpected EOF while looking for matching"],
+        "explanation": "The shell could not parse the command line: an unmatched quote or parenthesis, or a special character such as `(`, `&` or `;` that needs quoting.",
+        "fix": "Quote arguments containing special characters, check that every quote and bracket is closed, and run `bash -n <script>` to check scripts."
+    },
+    {
+        "id": "ssl-certificate",
+        "patterns": [r"certificate verify failed", r"SSL certificate problem", r"x509: certificate"],
+        "explanation": "The TLS certificate presented by the server could not be verified: it is expired, self-signed, issued for another name, or your CA bundle is outdated.",
+        "fix": "Check the system clock, update CA certificates (`sudo update-ca-certificates` or `sudo update-ca-trust`), and inspect the certificate with `openssl s_client -connect <host>:443`."
+    }
+]
+
+
+# Load extra entries from data/knowledge_base.json, if present
+def load_user_entries():
+    if not os.path.exists(USER_KB_FILE):
+        return []
+    try:
+        with open(USER_KB_FILE, 'r') as file:
+            entries = json.load(file)
+    except (OSError, ValueError):
+        return []
+    return [e for e in entries if isinstance(e, dict) and e.get("patterns") and e.get("explanation")]
+
+# Compile every pattern into one alternation, so a lookup is a single regex scan.
+# User entries come first so they can override bundled answers.
+def build_index(entries):
+    groups = []
+    owners = {}
+    for entry_index, entry in enumerate(entries):
+        for pattern in entry["patterns"]:
+            try:
+                re.compile(pattern)
+            except re.error:
+                continue
+            name = f"k{len(groups)}"
+            groups.append(f"(?P<{name}>{pattern})")
+            owners[name] = entry_index
+    if not groups:
+        return None, owners
+    return re.compile("|".join(groups), re.IGNORECASE | re.MULTILINE), owners
+
+# Compile user patterns one by one: their own groups and backreferences would break the
+# combined alternation. Returns (compiled pattern, entry index) pairs; invalid ones are skipped.
+def compile_user_patterns(entries):
+    compiled = []
+    for entry_index, entry in enumerate(entries):
+        for pattern in entry["patterns"]:
+            try:
+                compiled.append((re.compile(pattern, re.IGNORECASE | re.MULTILINE), entry_index))
+            except (re.error, TypeError):
+                continue
+    return compiled
+
+# The last lines of an error message: where the actual error is, rather than a phrase such
+# as "No such file or directory" somewhere in pages of log output
+def error_tail(error_text):
+    lines = [line for line in error_text.strip().splitlines() if line.strip()]
+    return "\n".join(lines[-TAIL_LINES:])
+
+
+_index = None
+_index_mtime = None
+_index_lock = threading.Lock()
+
+def _get_index():
+    global _index, _index_mtime
+    mtime = os.path.getmtime(USER_KB_FILE) if os.path.exists(USER_KB_FILE) else None
+    with _index_lock:
+        if _index is None or mtime != _index_mtime:
+            user_entries = load_user_entries()
+            pattern, owners = build_index(BUILTIN_ENTRIES)
+            _index = (compile_user_patterns(user_entries), user_entries, pattern, owners)
+            _index_mtime = mtime
+        return _index
+
+# Find the knowledge base entry for an error message (matched on its last lines), or None
+def lookup(error_text):
+    if not error_text:
+        return None
+    with timings.span("kb_lookup"):
+        user_patterns, user_entries, pattern, owners = _get_index()
+        tail = error_tail(error_text)
+        for user_pattern, entry_index in user_patterns:
+            if user_pattern.search(tail):
+                return user_entries[entry_index]
+        match = pattern.search(tail) if pattern is not None else None
+    if not match:
+        return None
+    return BUILTIN_ENTRIES[owners[match.lastgroup]]
+
+# Render an entry as a short answer
+def format_entry(entry, include_fix=True):
+    text = entry["explanation"]
+    if include_fix and entry.get("fix"):
+        text += f"\n\nFix: {entry['fix']}"
+    return text
+
+# Check whether offline answers are enabled in settings
+def offline_enabled():
+    value = settings_manager.snapshot().get("offline_kb", True)
+    return str(value).lower() not in ("false", "0", "no", "off")
@@ -128,8 +128,9 @@ class CLIManager:
             return
             
         query_text = " ".join(query)
-        result = self.gemini.explain(query_text)
-        print(result)
+        for chunk in self.gemini.explain_stream(query_text):
+            print(chunk, end="", flush=True)
+        print()
         
 def main():
     """Entry point for the CLI Manager"""
@@ -0,0 +1,553 @@
+import gzip
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+from . import settings_manager, timings
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+INDEX_FILE = os.path.join(DATA_DIR, 'man_index.db')
+
+# Searched in this order, like man(1): a page in /usr/local shadows the system one
+MAN_DIRS = ("/usr/local/share/man", "/usr/local/man", "/usr/share/man")
+MAN_SECTIONS = ("1", "8")
+HELP_TIMEOUT = 1.0          # seconds allowed for one `<command> --help`
+HELP_MAX_BYTES = 256 * 1024
+SYNOPSIS_CHARS = 400
+DESCRIPTION_CHARS = 400
+ITEM_CHARS = 600
+INDEX_VERSION = 2           # bumped when parsing changes, so pages indexed before are parsed again
+
+# Only programs installed here are ever run with --help; a script typed as a path or found
+# in a user's own PATH directory may do its job whatever its arguments
+SYSTEM_BIN_DIRS = ("/usr/bin", "/bin", "/usr/sbin", "/sbin", "/usr/local/bin", "/usr/local/sbin")
+# Never run these with --help: some ignore unknown flags and do their job instead
+HELP_PROBE_SKIP = {"reboot", "shutdown", "halt", "poweroff", "init", "telinit", "kexec", "login",
+                   "su", "sudo", "passwd", "kill", "killall", "pkill", "xdg-open", "startx"}
+
+# roff requests and mdoc macros that carry no text worth indexing
+IGNORED_MACROS = {"TH", "Dd", "Dt", "Os", "RS", "RE", "sp", "br", "nf", "fi", "ad", "na", "hy", "nh",
+                  "ne", "in", "ti", "PD", "UR", "UE", "MT", "ME", "ft", "ie", "el", "if", "ds", "de",
+                  "so", "ll", "ps", "vs", "ta", "bp", "ns", "rs", "Bl", "Bd", "Ed", "Sm", "Bk", "Ek",
+                  "EX", "EE", "cs", "ss", "mso", "tr", "nr", "rr", "rm", "ig", ".", "Ex", "Rv", "An",
+                  "Lb", "In", "Fd"}
+MDOC_MACROS = {"Ar", "Fl", "Op", "Oo", "Oc", "Cm", "Pa", "Ns", "No", "Xo", "Xc", "Ic", "Li", "Em",
+               "Sy", "Dq", "Do", "Dc", "Ql", "Qq", "Qo", "Qc", "Sq", "So", "Sc", "Pq", "Po", "Pc",
+               "Ev", "Va", "Nm", "Xr", "Aq", "Ao", "Ac", "Bq", "Bo", "Bc", "Brq", "Ta", "Dv", "Er",
+               "Fn", "Fa", "Ft", "Tn", "Ux", "At", "Bx", "Nx", "Fx", "Ox", "Dl", "D1", "Lk", "Mt"}
+ALTERNATING_MACROS = {"BR", "RB", "BI", "IB", "IR", "RI"}
+SPECIAL_CHARACTERS = {"em": "-", "en": "-", "hy": "-", "mi": "-", "aq": "'", "oq": "'", "cq": "'",
+                      "lq": '"', "rq": '"', "dq": '"', "bu": "*", "co": "(c)", "ti": "~", "ha": "^",
+                      "rs": "\\", "ga": "`", "at": "@", "sh": "#", "Do": "$", "pc": "."}
+
+_ARGUMENT = re.compile(r'"((?:[^"]|"")*)"?|(\S+)')
+_FONT = re.compile(r"\\f(\[[^\]]*\]|\(..|.)")
+_SPECIAL = re.compile(r"\\\((..)|\\\[([^\]]+)\]")
+_STRING = re.compile(r"\\[*n](\(..|\[[^\]]*\]|.)")
+_MOTION = re.compile(r"\\[hvwlLxbDoZ]'[^']*'|\\s[+-]?\d")
+_OPTION_NAME = re.compile(r"(?<![\w-])--?[A-Za-z0-9?][\w.+-]*")
+_SENTENCE_END = re.compile(r"(?<=[.;:])\s+(?=[A-Z(`'\"])")
+_HELP_ITEM = re.compile(r"^(\s{0,8})(-\S.*?|[a-z][\w-]*)(?:\s{2,}|\s+-\s+|\t)(\S.*)$")
+
+
+# Read the local manual settings
+def load_manual_settings():
+    settings = settings_manager.snapshot()
+    enabled = str(settings.get("local_manual", True)).lower() not in ("false", "0", "no", "off")
+    probe_help = str(settings.get("help_probe", True)).lower() not in ("false", "0", "no", "off")
+    return enabled, probe_help
+
+
+# ---- reading man pages and --help output ----
+
+def man_dirs():
+    return [d for d in os.environ.get("MANPATH", "").split(":") if d] or list(MAN_DIRS)
+
+def section_dirs():
+    return [os.path.join(d, f"man{section}") for d in man_dirs() for section in MAN_SECTIONS]
+
+# Installed man page for a command, in man(1) search order
+def man_page_path(name):
+    for directory in section_dirs():
+        section = directory.rsplit("man", 1)[1]
+        for suffix in (".gz", ""):
+            candidate = os.path.join(directory, f"{name}.{section}{suffix}")
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+def _page_name(filename):
+    base = filename[:-3] if filename.endswith(".gz") else filename
+    name, _, section = base.rpartition(".")
+    return (name, section) if name and section[:1].isdigit() else (None, None)
+
+# roff source of a page, following '.so' redirections (one page aliasing another)
+def read_source(path):
+    for _ in range(3):
+        try:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, 'rt', encoding='utf-8', errors='replace') as file:
+                source = file.read()
+        except (OSError, EOFError):
+            return ""
+        match = re.match(r"\.so\s+(\S+)", source)
+        if not match:
+            return source
+        target = os.path.join(os.path.dirname(os.path.dirname(path)), match.group(1))
+        path = target if os.path.isfile(target) else target + ".gz"
+    return ""
+
+# Whether `<path> --help` may be run to document a command: only for a root-owned program
+# in a system bin directory that has no man page to read instead
+def may_probe_help(name, path):
+    if not path or name in HELP_PROBE_SKIP:
+        return False
+    if os.path.dirname(os.path.abspath(path)) not in SYSTEM_BIN_DIRS:
+        return False
+    try:
+        if os.stat(path).st_uid != 0:
+            return False
+    except OSError:
+        return False
+    return man_page_path(name) is None
+
+# Output of `<path> --help`, or "" when it could not be run; callers check may_probe_help first
+def help_text(name, path):
+    try:
+        completed = subprocess.run(
+            [path, "--help"], stdin=subprocess.DEVNULL, capture_output=True, timeout=HELP_TIMEOUT,
+            env=dict(os.environ, LC_ALL="C", PAGER="cat", MANPAGER="cat")
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    output = (completed.stdout + completed.stderr)[:HELP_MAX_BYTES]
+    return output.decode("utf-8", errors="replace")
+
+
+# ---- parsing ----
+
+# Plain text of one line of roff: fonts, special characters and escapes removed
+def render(text):
+    text = _FONT.sub("", text)
+    text = _SPECIAL.sub(lambda m: SPECIAL_CHARACTERS.get(m.group(1) or m.group(2), ""), text)
+    text = _STRING.sub("", text)
+    text = _MOTION.sub("", text)
+    for escape, plain in (("\\-", "-"), ("\\ ", " "), ("\\~", " "), ("\\&", ""), ("\\c", ""), ("\\%", ""),
+                          ("\\/", ""), ("\\,", ""), ("\\|", ""), ("\\^", ""), ("\\e", "\\")):
+        text = text.replace(escape, plain)
+    return text.strip()
+
+def _arguments(text):
+    return [m.group(1).replace('""', '"') if m.group(1) is not None else m.group(2) for m in _ARGUMENT.finditer(text)]
+
+def _render_macro(macro, arguments, mdoc):
+    if mdoc:
+        words = []
+        tokens = [macro] + arguments
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token == "Fl":
+                following = tokens[i + 1] if i + 1 < len(tokens) and tokens[i + 1] not in MDOC_MACROS else ""
+                words.append("-" + following)
+                i += 2 if following else 1
+                continue
+            if token not in MDOC_MACROS and token != "It":
+                words.append(token)
+            i += 1
+        return render(" ".join(words))
+    separator = "" if macro in ALTERNATING_MACROS else " "
+    return render(separator.join(arguments))
+
+def _excerpt(text, limit, sentences=None):
+    text = re.sub(r"\s+", " ", text).strip()
+    if sentences:
+        text = " ".join(_SENTENCE_END.split(text)[:sentences])
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + " ..."
+
+# Summary, synopsis, description and tagged items (options, subcommands) of a man page
+def parse_man_source(source):
+    mdoc = source.startswith(".Dd") or "\n.Dd" in source
+    sections = {}
+    items = []
+    section = ""
+    summary = ""
+    item = None          # [tag, body lines, .RS depth that closes it or None]
+    expect_tag = False
+    pending = None       # first line of a paragraph: a tag if an indented block follows
+    after_paragraph = False
+    depth = 0
+
+    def close_item():
+        nonlocal item
+        if item and item[0]:
+            items.append((item[0], _excerpt(" ".join(item[1]), ITEM_CHARS)))
+        item = None
+
+    def flush_pending():
+        nonlocal pending
+        if pending is not None:
+            sections.setdefault(section, []).append(pending)
+            pending = None
+
+    def add_text(text):
+        nonlocal item, expect_tag, pending, after_paragraph
+        if not text:
+            return
+        if expect_tag:
+            item = [text, [], None]
+            expect_tag = False
+        elif item:
+            item[1].append(text)
+        elif after_paragraph and pending is None and len(text) < 100:
+            pending = text
+        else:
+            flush_pending()
+            sections.setdefault(section, []).append(text)
+        after_paragraph = False
+
+    for line in source.splitlines():
+        if line.startswith(('.\\"', "'\\\"", '\\"')):
+            continue
+        if not line.startswith((".", "'")):
+            add_text(render(line))
+            continue
+        macro, _, rest = line[1:].strip().partition(" ")
+        arguments = _arguments(rest)
+        if macro in ("SH", "Sh", "SS", "Ss"):
+            close_item()
+            flush_pending()
+            if macro in ("SH", "Sh"):
+                section = render(" ".join(arguments)).upper()
+            after_paragraph = True
+        elif macro in ("TP", "HP"):
+            # help2man writes each option as ".HP", the tag line, then ".IP" and its text
+            close_item()
+            flush_pending()
+            expect_tag = True
+        elif macro == "IP" and not render(arguments[0] if arguments else ""):
+            # A bare .IP continues the current item (or starts a plain paragraph)
+            if item is None:
+                flush_pending()
+                after_paragraph = True
+        elif macro in ("IP", "It", "TQ"):
+            close_item()
+            flush_pending()
+            tag = _render_macro(macro, arguments, True) if macro == "It" else render(arguments[0] if arguments else "")
+            if tag:
+                item = [tag, [], None]
+            elif macro == "TQ":
+                expect_tag = True
+        elif macro in ("PP", "P", "LP", "Pp"):
+            if item and item[2] is None:
+                close_item()
+            flush_pending()
+            after_paragraph = True
+        elif macro == "RS":
+            depth += 1
+            if pending is not None and item is None:
+                item = [pending, [], depth]
+                pending = None
+        elif macro == "RE":
+            if item and item[2] == depth:
+                close_item()
+            depth = max(depth - 1, 0)
+        elif macro == "El":
+            close_item()
+        elif macro == "Nd":
+            summary = render(" ".join(arguments))
+        elif macro in IGNORED_MACROS or not macro:
+            continue
+        else:
+            add_text(_render_macro(macro, arguments, mdoc))
+    close_item()
+    flush_pending()
+
+    name_line = " ".join(sections.get("NAME", []))
+    if not summary and " - " in name_line:
+        summary = name_line.split(" - ", 1)[1]
+    return {
+        "summary": _excerpt(summary, 200),
+        "synopsis": _excerpt(" ".join(sections.get("SYNOPSIS", [])), SYNOPSIS_CHARS),
+        "description": _excerpt(" ".join(sections.get("DESCRIPTION", [])), DESCRIPTION_CHARS, sentences=3),
+        "items": items
+    }
+
+# The same fields from `--help` output
+def parse_help_text(text):
+    synopsis, items, summary = [], [], ""
+    in_usage = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.lower().startswith("usage:"):
+            synopsis.append(stripped[6:].strip())
+            in_usage = True
+            continue
+        if in_usage and line.startswith((" ", "\t")) and stripped and not stripped.startswith("-"):
+            synopsis.append(stripped)
+            continue
+        in_usage = False
+        match = _HELP_ITEM.match(line)
+        if match and (match.group(2).startswith("-") or match.group(1)):
+            items.append([match.group(2).strip(), match.group(3).strip()])
+        elif stripped.startswith("-"):
+            items.append([stripped, ""])
+        elif items and stripped and line[:1].isspace() and len(line) - len(line.lstrip()) > 8:
+            items[-1][1] = (items[-1][1] + " " + stripped).strip()  # wrapped description
+        elif stripped and not summary and not items:
+            summary = stripped
+    return {
+        "summary": _excerpt(summary, 200),
+        "synopsis": _excerpt(" ".join(synopsis), SYNOPSIS_CHARS),
+        "description": _excerpt(summary, DESCRIPTION_CHARS, sentences=3),
+        "items": [(tag, _excerpt(body, ITEM_CHARS)) for tag, body in items]
+    }
+
+
+# ---- the index ----
+
+# Open the index database; FTS5 adds full-text search where SQLite was built with it
+def connect():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(INDEX_FILE, timeout=5)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS pages ("
+        " id INTEGER PRIMARY KEY,"
+        " name TEXT NOT NULL UNIQUE,"
+        " section TEXT NOT NULL,"
+        " source TEXT NOT NULL,"
+        " path TEXT NOT NULL,"
+        " mtime REAL NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " summary TEXT NOT NULL,"
+        " synopsis TEXT NOT NULL,"
+        " description TEXT NOT NULL)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS items (page_id INTEGER NOT NULL, tag TEXT NOT NULL, text TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS items_page ON items (page_id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime REAL NOT NULL)")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(name, summary, body)")
+    except sqlite3.OperationalError:
+        pass  # searched with LIKE instead
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        with conn:
+            for table in ("pages", "items", "dirs") + (("pages_fts",) if _has_fts(conn) else ()):
+                conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+    return conn
+
+def _has_fts(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'pages_fts'").fetchone() is not None
+
+def _delete_page(conn, page_id):
+    conn.execute("DELETE FROM pages WHERE id = ?", (page_id,))
+    conn.execute("DELETE FROM items WHERE page_id = ?", (page_id,))
+    if _has_fts(conn):
+        conn.execute("DELETE FROM pages_fts WHERE rowid = ?", (page_id,))
+
+def _store_page(conn, name, section, source, path, stat, page):
+    row = conn.execute("SELECT id FROM pages WHERE name = ?", (name,)).fetchone()
+    if row:
+        _delete_page(conn, row[0])
+    cursor = conn.execute(
+        "INSERT INTO pages (name, section, source, path, mtime, size, summary, synopsis, description)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (name, section, source, path, stat.st_mtime, stat.st_size,
+         page["summary"], page["synopsis"], page["description"])
+    )
+    page_id = cursor.lastrowid
+    conn.executemany("INSERT INTO items (page_id, tag, text) VALUES (?, ?, ?)",
+                     [(page_id, tag, text) for tag, text in page["items"]])
+    if _has_fts(conn):
+        # Option text is left out of the search body: long pages would match every query
+        body = page["description"] + "\n" + " ".join(tag for tag, _ in page["items"])
+        conn.execute("INSERT INTO pages_fts (rowid, name, summary, body) VALUES (?, ?, ?, ?)",
+                     (page_id, name, page["summary"], body))
+
+def _index_man_file(conn, path, stat=None):
+    name, section = _page_name(os.path.basename(path))
+    if name is None:
+        return False
+    stat = stat or os.stat(path)
+    _store_page(conn, name, section, "man", path, stat, parse_man_source(read_source(path)))
+    return True
+
+# Bring the index up to date with the installed man pages. Only section directories whose
+# mtime changed are listed again (installing, upgrading or removing a package renames files
+# in them), and only pages whose mtime or size changed are parsed again.
+def refresh(full=False):
+    conn = connect()
+    indexed, removed = 0, 0
+    try:
+        with conn:
+            known_dirs = dict(conn.execute("SELECT path, mtime FROM dirs"))
+            rows = {}
+            for page_id, name, path, mtime, size in conn.execute(
+                    "SELECT id, name, path, mtime, size FROM pages WHERE source = 'man'"):
+                rows[name] = (page_id, path, mtime, size)
+            claimed = set()
+            for directory in section_dirs():
+                try:
+                    dir_mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+                if not full and known_dirs.get(directory) == dir_mtime:
+                    claimed.update(name for name, row in rows.items() if os.path.dirname(row[1]) == directory)
+                    continue
+                present = set()
+                for filename in os.listdir(directory):
+                    name, _ = _page_name(filename)
+                    if name is None or name in claimed:
+                        continue
+                    claimed.add(name)
+                    path = os.path.join(directory, filename)
+                    present.add(path)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    row = rows.get(name)
+                    if not full and row and row[1:] == (path, stat.st_mtime, stat.st_size):
+                        continue
+                    if _index_man_file(conn, path, stat):
+                        indexed += 1
+                for name, row in rows.items():
+                    if os.path.dirname(row[1]) == directory and row[1] not in present:
+                        _delete_page(conn, row[0])
+                        removed += 1
+                conn.execute("INSERT OR REPLACE INTO dirs (path, mtime) VALUES (?, ?)", (directory, dir_mtime))
+    except sqlite3.Error as e:
+        print(f"Error: could not update the manual index: {e}")
+    finally:
+        conn.close()
+    return indexed, removed
+
+def _load_page(conn, row):
+    page_id, name, section, source, path, summary, synopsis, description = row
+    items = conn.execute("SELECT tag, text FROM items WHERE page_id = ? ORDER BY rowid", (page_id,)).fetchall()
+    return {"name": name, "section": section, "source": source, "path": path, "summary": summary,
+            "synopsis": synopsis, "description": description, "items": items}
+
+def _lookup(conn, name, executable, probe_help):
+    row = conn.execute("SELECT id, name, section, source, path, mtime, size, summary, synopsis, description"
+                       " FROM pages WHERE name = ?", (name,)).fetchone()
+    if row:
+        try:
+            stat = os.stat(row[4])
+            fresh = (stat.st_mtime, stat.st_size) == (row[5], row[6])
+        except OSError:
+            fresh = False
+        if fresh:
+            return _load_page(conn, row[:5] + row[7:])
+        _delete_page(conn, row[0])
+
+    # Not indexed yet (or changed since): index just this page now
+    path = man_page_path(name)
+    if path:
+        _index_man_file(conn, path)
+    elif probe_help and may_probe_help(name, executable):
+        text = help_text(name, executable)
+        if not text.strip():
+            return None
+        _store_page(conn, name, "", "help", executable, os.stat(executable), parse_help_text(text))
+    else:
+        return None
+    row = conn.execute("SELECT id, name, section, source, path, summary, synopsis, description"
+                       " FROM pages WHERE name = ?", (name,)).fetchone()
+    return _load_page(conn, row) if row else None
+
+# Indexed page of a command, or None. A missing or outdated entry is indexed on the spot,
+# from its man page or else (with probe_help, for a system program) from --help output.
+def page(name, executable=None, probe_help=False):
+    with timings.span("man_lookup"):
+        try:
+            conn = connect()
+        except sqlite3.Error:
+            return None
+        try:
+            with conn:
+                return _lookup(conn, name, executable, probe_help)
+        except (sqlite3.Error, OSError):
+            return None
+        finally:
+            conn.close()
+
+# Option tags of a command's man page ("-a, --all", "-p port"), or None without a man page
+def option_tags(name):
+    found = page(name)
+    if not found or found["source"] != "man":
+        return None
+    return [tag for tag, _ in found["items"] if tag.startswith("-")]
+
+# Options named in an item tag: "-f, --file=ARCHIVE" -> {"-f", "--file"}
+def tag_options(tag):
+    return set(_OPTION_NAME.findall(tag.split("  ")[0]))
+
+# Whether an item tag says its option takes a value ("-f, --file=ARCHIVE", "-p port")
+def tag_takes_value(tag):
+    return bool(re.search(r"[=\[]|--?[\w?][\w.+-]* [<A-Za-z]", tag))
+
+# Full-text search over names, summaries and option text: [(name, section, summary)]
+def search(query, limit=10):
+    words = re.findall(r"\w+", query)
+    if not words:
+        return []
+    try:
+        conn = connect()
+    except sqlite3.Error:
+        return []
+    try:
+        if _has_fts(conn):
+            # Every word in the name or summary first, then every word anywhere, then any word
+            terms = " ".join(f'"{word}"' for word in words)
+            for match in ("{name summary} : " + terms, terms, " OR ".join(f'"{word}"' for word in words)):
+                rows = conn.execute(
+                    "SELECT p.name, p.section, p.summary FROM pages_fts f JOIN pages p ON p.id = f.rowid"
+                    " WHERE pages_fts MATCH ? ORDER BY bm25(pages_fts, 10.0, 5.0, 1.0) LIMIT ?",
+                    (match, limit)
+                ).fetchall()
+                if rows:
+                    return rows
+            return []
+        pattern = "%" + "%".join(words) + "%"
+        return conn.execute("SELECT name, section, summary FROM pages WHERE summary LIKE ? OR name LIKE ?"
+                            " ORDER BY length(name) LIMIT ?", (pattern, pattern, limit)).fetchall()
+    except sqlite3.Error:
+        return []
+    finally:
+        conn.close()
+
+# Index statistics
+def index_stats():
+    try:
+        conn = connect()
+    except sqlite3.Error:
+        return {}
+    try:
+        counts = dict(conn.execute("SELECT source, COUNT(*) FROM pages GROUP BY source"))
+        items = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        return {"man_pages": counts.get("man", 0), "help_pages": counts.get("help", 0), "items": items,
+                "full_text_search": _has_fts(conn), "file": INDEX_FILE}
+    finally:
+        conn.close()
+
+# Print pages matching a search
+def show_search(query):
+    results = search(query)
+    if not results:
+        print(f"No local manual page matches '{query}'. Run 'cli usage -reindex' if the index is empty.")
+        return
+    print(f"\n[ Manual pages matching '{query}' ]\n")
+    for name, section, summary in results:
+        label = f"{name}({section})" if section else name
+        print(f"{label:<24} {summary[:80]}")
+
+if __name__ == "__main__":
+    indexed, removed = refresh(full="--full" in sys.argv[1:])
+    print(f"Indexed {indexed} manual page(s), removed {removed}.")
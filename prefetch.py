@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import settings_manager, gemini_client, providers, cli_daemon
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PREFETCH_DIR = os.path.join(DATA_DIR, 'spool', 'prefetch')
+
+SLOT_TTL = 300              # seconds a prefetched answer stays usable
+DEFAULT_MAX_PER_DAY = 100   # prefetched failures per user and day
+DEFAULT_CONCURRENCY = 2     # failures prefetched at the same time per user
+DEFAULT_BUDGET = 20         # seconds a prefetch may take before its answers are dropped
+CLI_COMMANDS = ("cli", "cli_manager.py", "cli_client.py")  # reading an answer does not cancel it
+
+
+# Read prefetch settings; prefetching is off unless enabled
+def load_prefetch_settings():
+    settings = settings_manager.snapshot()
+    enabled = str(settings.get("prefetch", False)).lower() not in ("false", "0", "no", "off")
+    try:
+        max_per_day = int(settings.get("prefetch_max_per_day", DEFAULT_MAX_PER_DAY))
+    except (TypeError, ValueError):
+        max_per_day = DEFAULT_MAX_PER_DAY
+    try:
+        concurrency = max(int(settings.get("prefetch_concurrency", DEFAULT_CONCURRENCY)), 1)
+    except (TypeError, ValueError):
+        concurrency = DEFAULT_CONCURRENCY
+    try:
+        budget = float(settings.get("prefetch_budget_seconds", DEFAULT_BUDGET))
+    except (TypeError, ValueError):
+        budget = DEFAULT_BUDGET
+    return enabled, max_per_day, concurrency, budget
+
+def _slot_path(shell_pid):
+    return os.path.join(PREFETCH_DIR, f"{shell_pid}.json")
+
+def _read_slot(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _write_slot(path, slot):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as file:
+        json.dump(slot, file)
+    os.replace(tmp, path)
+
+
+_pool = None
+_running = {}                 # uid -> failures being prefetched
+_lock = threading.Lock()      # guards _pool, _running and slot updates in this process
+
+# Within the user's daily quota? Counts the failure when it is.
+def _take_quota(state, uid, max_per_day):
+    today = time.strftime("%Y-%m-%d")
+    quota = state.get("prefetch")
+    if not quota or quota.get("day") != today:
+        quota = state["prefetch"] = {"day": today, "users": {}}
+    used = quota["users"].get(str(uid), 0)
+    if used >= max_per_day:
+        return False
+    quota["users"][str(uid)] = used + 1
+    return True
+
+# Start fetching answers for a failure in the background: prompts maps a kind ("explain",
+# "fix") to its prompt. state is the spool worker's persistent state, which holds the quota.
+# Returns False when prefetching is off or over budget.
+def schedule(event, error, prompts, state):
+    global _pool
+    enabled, max_per_day, concurrency, budget = load_prefetch_settings()
+    if not enabled or not event["shell_pid"].isdigit():
+        return False
+    uid = event.get("uid", os.getuid())
+    with _lock:
+        # A user whose prefetches are all busy skips this one rather than queueing stale work
+        if _running.get(uid, 0) >= concurrency or not _take_quota(state, uid, max_per_day):
+            return False
+        _running[uid] = _running.get(uid, 0) + 1
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=concurrency * 4, thread_name_prefix="prefetch")
+        os.makedirs(PREFETCH_DIR, exist_ok=True)
+        path = _slot_path(event["shell_pid"])
+        token = f"{time.time():.6f}"
+        _write_slot(path, {"token": token, "time": time.time(), "uid": uid, "command": event["command"], "error": error})
+    _pool.submit(_run, path, token, prompts, uid, budget)
+    return True
+
+def _run(path, token, prompts, uid, budget):
+    started = time.monotonic()
+    try:
+        for kind, prompt in prompts.items():
+            if not _current(path, token):
+                return  # cancelled, or replaced by a newer failure in the same shell
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0:
+                return
+            try:
+                # The budget is the request's deadline: a slow provider is given up on, not waited out
+                answer = providers.get_provider(kind).generate(prompt, deadline=remaining)
+            except gemini_client.GeminiError:
+                continue
+            with _lock:
+                slot = _read_slot(path)
+                if not slot or slot.get("token") != token:
+                    return
+                slot[kind] = answer
+                _write_slot(path, slot)
+    finally:
+        with _lock:
+            _running[uid] -= 1
+
+def _current(path, token):
+    slot = _read_slot(path)
+    return bool(slot) and slot.get("token") == token
+
+# The shell ran a command successfully after a failure: drop what was prefetched for it
+def cancel(shell_pid, command):
+    words = command.split()
+    if words and os.path.basename(words[0]) in CLI_COMMANDS:
+        return
+    with _lock:
+        try:
+            os.unlink(_slot_path(shell_pid))
+        except OSError:
+            pass
+
+# A prefetched answer of kind for text (the failed command, its error or one line of it), or
+# None. Only the calling shell's slot is read, and only when it belongs to the calling user
+# (the daemon's client, not the daemon itself).
+def lookup(kind, text):
+    text = text.strip()
+    shell_pid = cli_daemon.client_env("CLI_MANAGER_SHELL_PID") or ""
+    uid = cli_daemon.client_uid()
+    if not text or not shell_pid.isdigit() or uid is None:
+        return None
+    slot = _read_slot(_slot_path(shell_pid))
+    if not slot or slot.get("uid") != uid or time.time() - slot.get("time", 0) > SLOT_TTL:
+        return None
+    if not slot.get(kind):
+        return None
+    error = slot["error"].strip()
+    if text in (slot["command"], error) or text in (line.strip() for line in error.splitlines()):
+        return slot[kind]
+    return None
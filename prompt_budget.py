@@ -0,0 +1,145 @@
+import re
+from . import settings_manager
+
+# Constants
+DEFAULT_TOKEN_BUDGET = 1500   # estimated tokens of error text sent in one prompt
+MIN_TOKEN_BUDGET = 100
+HEAD_LINES = 15               # the start usually names the command and the first error
+TAIL_LINES = 30               # the end usually holds the final error and the exit status
+KEYWORD_LINES = 20           # first error lines preferred over everything else (and half as many last ones)
+FRAMES_KEPT = 3               # frames shown from each end of a long run of stack frames
+MAX_LINE_CHARS = 400          # longer lines (minified JSON, base64) are cut in the middle
+MAX_SCAN_LINES = 20000        # beyond this only the first and last lines are examined at all
+
+# Stack frames of Java, Python, JavaScript, Go, Rust and gdb traces
+_FRAME = re.compile(
+    r"^\s*(?:at\s+\S+|File \".*\", line \d+|#\d+\s+0x[0-9a-f]+|\d+:\s+0x[0-9a-f]+|"
+    r"\S+\.go:\d+|\.\.\. \d+ more|[\w$.]+\(.*\)\s*$)"
+)
+_KEYWORD = re.compile(
+    r"error|exception|fatal|fail|caused by|panic|traceback|denied|not found|no such|"
+    r"undefined|cannot|can't|unable|refused|timed? ?out|segmentation|abort|killed|invalid",
+    re.IGNORECASE
+)
+_NUMBERS = re.compile(r"0x[0-9a-f]+|\d+", re.IGNORECASE)
+_PIECE = re.compile(r"\w+|[^\w\s]")
+
+
+# Read the prompt budget from settings
+def load_budget_settings():
+    settings = settings_manager.snapshot()
+    try:
+        budget = int(settings.get("prompt_token_budget", DEFAULT_TOKEN_BUDGET))
+    except (TypeError, ValueError):
+        budget = DEFAULT_TOKEN_BUDGET
+    return max(budget, MIN_TOKEN_BUDGET)
+
+# Rough token count: one per word or symbol, plus one per six characters of long words.
+# Close enough to the model's tokenizer to decide what fits, and needs no download.
+def estimate_tokens(text):
+    return sum(1 + len(piece) // 6 for piece in _PIECE.findall(text))
+
+def _cut_line(line):
+    if len(line) <= MAX_LINE_CHARS:
+        return line
+    half = MAX_LINE_CHARS // 2
+    return f"{line[:half]} [... {len(line) - MAX_LINE_CHARS} characters ...] {line[-half:]}"
+
+# Entries (first line, last line, text) covering the input lines in order; runs of
+# repeated lines (equal once numbers are ignored) and the middle of long runs of stack
+# frames become a single note
+def _collapse(lines, report):
+    entries = []
+    position = 0
+    while position < len(lines):
+        number, line = lines[position]
+        shape = _NUMBERS.sub("#", line.strip())
+        end = position + 1
+        while end < len(lines) and _NUMBERS.sub("#", lines[end][1].strip()) == shape:
+            end += 1
+        if end - position > 2:
+            entries.append((number, number, line))
+            entries.append((lines[position + 1][0], lines[end - 1][0], f"[... repeated {end - position - 1} more times ...]"))
+            report["repeated_lines"] += end - position - 1
+            position = end
+            continue
+        if _FRAME.match(line):
+            end = position + 1
+            while end < len(lines) and _FRAME.match(lines[end][1]):
+                end += 1
+            run = end - position
+            if run > FRAMES_KEPT * 2 + 1:
+                entries.extend((n, n, text) for n, text in lines[position:position + FRAMES_KEPT])
+                entries.append((lines[position + FRAMES_KEPT][0], lines[end - FRAMES_KEPT - 1][0],
+                                f"[... {run - FRAMES_KEPT * 2} stack frames ...]"))
+                entries.extend((n, n, text) for n, text in lines[end - FRAMES_KEPT:end])
+                report["frames"] += run - FRAMES_KEPT * 2
+                position = end
+                continue
+        entries.append((number, number, line))
+        position += 1
+    return entries
+
+# Shrink error text to about budget tokens before it goes into a prompt.
+# Returns (text, report); report is None when the text already fitted, otherwise it counts
+# what was dropped. Repeated lines and stack frames go first, then lines are chosen by
+# priority: the first and last lines with error keywords, the tail, the head, then the rest.
+def compact(text, budget=None):
+    budget = budget or load_budget_settings()
+    # Cheap test first: a token is at least one character
+    if len(text) <= budget or (len(text) <= budget * 8 and estimate_tokens(text) <= budget):
+        return text, None
+
+    raw = text.splitlines()
+    report = {"lines": len(raw), "characters": len(text), "kept_lines": 0,
+              "repeated_lines": 0, "frames": 0, "tokens": 0}
+    lines = list(enumerate(raw))
+    if len(lines) > MAX_SCAN_LINES:
+        # Bound the work for huge inputs: the middle of a 100k-line log is never what matters
+        head = MAX_SCAN_LINES // 4
+        lines = lines[:head] + lines[head - MAX_SCAN_LINES:]
+    lines = [(number, _cut_line(line)) for number, line in lines if line.strip()]
+    entries = _collapse(lines, report)
+
+    count = len(entries)
+    keywords = [i for i, (_, _, line) in enumerate(entries) if _KEYWORD.search(line)]
+    order = keywords[:KEYWORD_LINES] + keywords[-KEYWORD_LINES // 2:]
+    order += range(count - 1, max(count - 1 - TAIL_LINES, -1), -1)
+    order += range(min(HEAD_LINES, count))
+    order += keywords
+    order += range(count)
+    chosen = set()
+    spent = 0
+    for index in order:
+        if index in chosen:
+            continue
+        cost = estimate_tokens(entries[index][2]) + 1
+        if spent + cost <= budget:
+            chosen.add(index)
+            spent += cost
+
+    output = []
+    previous = -1
+    for index in sorted(chosen):
+        first, last, line = entries[index]
+        if first - previous > 1:
+            output.append(f"[... {first - previous - 1} lines omitted ...]")
+        output.append(line)
+        previous = last
+    if previous < len(raw) - 1:
+        output.append(f"[... {len(raw) - 1 - previous} lines omitted ...]")
+
+    report["kept_lines"] = len(chosen)
+    report["tokens"] = spent
+    return "\n".join(output), report
+
+# One-line summary of a compact() report for the terminal
+def describe(report):
+    details = []
+    if report["repeated_lines"]:
+        details.append(f"{report['repeated_lines']} repeated")
+    if report["frames"]:
+        details.append(f"{report['frames']} stack frames")
+    extra = f" ({', '.join(details)})" if details else ""
+    return (f"[i] Long error shortened to {report['kept_lines']} of {report['lines']} lines{extra}, "
+            f"about {report['tokens']} tokens.")
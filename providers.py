@@ -0,0 +1,472 @@
+import json
+import os
+import re
+import threading
+import time
+from . import gemini_client, knowledge_base, response_cache, settings_manager, timings
+from .resilience import CircuitBreaker
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+HEALTH_FILE = os.path.join(DATA_DIR, 'provider_health.json')
+LOCAL_BREAKER_FILE = os.path.join(DATA_DIR, 'local_model_health.json')
+
+DEFAULT_LOCAL_URL = "http://127.0.0.1:11434"
+DEFAULT_LOCAL_API = "ollama"      # or "openai" for llama.cpp's server and other OpenAI-compatible ones
+DEFAULT_LOCAL_MODEL = "llama3.2"
+DEFAULT_ROUTE = "gemini,local,offline"
+DEFAULT_SLO = 8.0                 # seconds an answer may usually take before a faster provider is preferred
+LOCAL_CONNECT_TIMEOUT = 1         # the server is on this machine, so it answers at once or not at all
+LOCAL_READ_TIMEOUT = 120          # small machines generate slowly
+HEALTH_TTL = 30                   # seconds a health probe of the local server is trusted
+PROBE_TIMEOUT = 0.5
+LATENCY_WEIGHT = 0.3              # weight of the newest request in the moving average
+CACHED_SECONDS = 0.05             # answers this quick came from the response cache, not the model
+LATENCY_TTL = 600                 # seconds after which a provider slower than its SLO is tried again
+LATENCY_CHANGE = 0.25             # relative change of the moving average worth writing to HEALTH_FILE
+
+# Where the error text sits in the explain and fix prompts. The offline provider matches only
+# that, never the instructions around it, and has no answer for any other kind of prompt.
+OFFLINE_SUBJECTS = (
+    re.compile(r"Explain this Linux terminal error message in simple terms: (.*)\Z", re.S),
+    re.compile(r"The user ran this command or encountered this issue: '(.*)'\. Suggest", re.S),
+)
+
+
+class ProviderError(gemini_client.GeminiError):
+    """Raised when a provider other than Gemini cannot produce an answer"""
+
+
+# Read the local model server settings
+def load_local_settings():
+    settings = settings_manager.snapshot()
+    url = str(settings.get("local_model_url", DEFAULT_LOCAL_URL)).rstrip("/")
+    api = str(settings.get("local_model_api", DEFAULT_LOCAL_API)).lower()
+    model = settings.get("local_model", DEFAULT_LOCAL_MODEL)
+    return url, api, model
+
+# Read the providers of a subcommand's route (in order of preference) and its latency SLO
+def load_route(command="default"):
+    settings = settings_manager.snapshot()
+    route = settings.get(f"route_{command}") or settings.get("route_default", DEFAULT_ROUTE)
+    names = [name.strip() for name in str(route).split(",") if name.strip() in PROVIDERS]
+    try:
+        slo = float(settings.get(f"route_slo_{command}", settings.get("route_slo_default", DEFAULT_SLO)))
+    except (TypeError, ValueError):
+        slo = DEFAULT_SLO
+    return names, slo
+
+
+# Latency and health of each provider, kept in a small file so that every cli process
+# starts from what earlier ones measured
+_stats = None
+_stats_lock = threading.Lock()
+
+def _load_stats():
+    global _stats
+    if _stats is None:
+        try:
+            with open(HEALTH_FILE, 'r') as file:
+                _stats = json.load(file)
+        except (OSError, ValueError):
+            _stats = {}
+    return _stats
+
+def _save_stats():
+    tmp = f"{HEALTH_FILE}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(tmp, 'w') as file:
+            json.dump(_stats, file)
+        os.replace(tmp, HEALTH_FILE)
+    except OSError:
+        pass
+
+# Record the outcome of a request: seconds it took, or None when it failed. HEALTH_FILE is
+# only rewritten when the provider's health flips or its usual answer time moves noticeably.
+def record_result(name, seconds):
+    if seconds is not None and seconds < CACHED_SECONDS:
+        return
+    with _stats_lock:
+        entry = _load_stats().setdefault(name, {})
+        changed = entry.get("healthy") is not (seconds is not None)
+        if seconds is not None:
+            previous = _latency(entry)
+            entry["latency"] = seconds if previous is None else previous + LATENCY_WEIGHT * (seconds - previous)
+            entry["measured"] = time.time()
+            changed = changed or previous is None or abs(entry["latency"] - previous) > LATENCY_CHANGE * previous
+        entry["healthy"], entry["checked"] = seconds is not None, time.time()
+        if changed:
+            _save_stats()
+
+def _latency(entry):
+    if time.time() - entry.get("measured", 0) > LATENCY_TTL:
+        return None
+    return entry.get("latency")
+
+# Moving average of a provider's answer time, or None when it has not answered lately
+def latency(name):
+    with _stats_lock:
+        return _latency(_load_stats().get(name, {}))
+
+def _recent_health(name):
+    with _stats_lock:
+        entry = _load_stats().get(name, {})
+    if time.time() - entry.get("checked", 0) > HEALTH_TTL:
+        return None
+    return entry.get("healthy")
+
+def _record_probe(name, healthy):
+    with _stats_lock:
+        entry = _load_stats().setdefault(name, {})
+        entry["healthy"], entry["checked"] = healthy, time.time()
+        _save_stats()
+
+
+class LocalModelClient:
+    """Client for a model served on this machine: Ollama's /api/generate, or the
+    OpenAI-compatible /v1/chat/completions of llama.cpp's server and similar"""
+
+    name = "local"
+
+    def __init__(self, url, api, model):
+        """Open a keep-alive session to the local server"""
+        with timings.span("import_requests"):
+            import requests
+        self.url = url
+        self.api = api
+        self.model = model
+        self.breaker = CircuitBreaker(gemini_client.BREAKER_THRESHOLD, gemini_client.BREAKER_RESET, LOCAL_BREAKER_FILE)
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def healthy(self):
+        """Whether the server is up (probed at most every HEALTH_TTL seconds)"""
+        if self.breaker.retry_in() > 0:
+            return False
+        healthy = _recent_health(self.name)
+        if healthy is None:
+            import requests
+            path = "/api/tags" if self.api == "ollama" else "/v1/models"
+            try:
+                healthy = self.session.get(self.url + path, timeout=PROBE_TIMEOUT).status_code == 200
+            except requests.RequestException:
+                healthy = False
+            _record_probe(self.name, healthy)
+        return healthy
+
+    def _request(self, prompt, model, stream):
+        if self.api == "ollama":
+            return self.url + "/api/generate", {"model": model, "prompt": prompt, "stream": stream}
+        return self.url + "/v1/chat/completions", {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream
+        }
+
+    def _post(self, prompt, model, stream=False, deadline=None):
+        """POST a prompt and check the status, raising ProviderError on any failure"""
+        import requests
+        if not self.breaker.allow():
+            raise ProviderError("Local model server is unavailable.", transient=True)
+        url, payload = self._request(prompt, model, stream)
+        try:
+            try:
+                with timings.span("http"):
+                    response = self.session.post(url, json=payload, stream=stream,
+                                                 timeout=(LOCAL_CONNECT_TIMEOUT, min(LOCAL_READ_TIMEOUT, deadline or LOCAL_READ_TIMEOUT)))
+            except requests.RequestException as e:
+                self.breaker.record_failure()
+                raise ProviderError(f"Local model request failed: {e}", transient=True)
+            if response.status_code != 200:
+                with response:
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    raise ProviderError(
+                        f"Local model request failed — Status Code {response.status_code}\n{response.text}",
+                        response.status_code
+                    )
+            self.breaker.record_success()
+            return response
+        finally:
+            self.breaker.release()
+
+    def generate(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None, deadline=None):
+        """Return the local model's answer to prompt, served from the response cache when possible"""
+        model = model or self.model
+        cache_model = f"{self.name}/{model}"
+        if use_cache:
+            with timings.span("cache_lookup"):
+                cached = response_cache.get_response(prompt, cache_model, word_limit)
+            if cached is not None:
+                return cached
+
+        response = self._post(prompt, model, deadline=deadline)
+        try:
+            with timings.span("json_decode"):
+                body = response.json()
+                text = body["response"] if self.api == "ollama" else body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise ProviderError("Unexpected local model response format.")
+        if use_cache:
+            with timings.span("cache_store"):
+                response_cache.store_response(prompt, cache_model, text, word_limit)
+        return text
+
+    def stream(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None):
+        """Yield the answer in pieces: JSON lines from Ollama, server-sent events otherwise"""
+        import requests
+        model = model or self.model
+        cache_model = f"{self.name}/{model}"
+        if use_cache:
+            cached = response_cache.get_response(prompt, cache_model, word_limit)
+            if cached is not None:
+                yield cached
+                return
+
+        response = self._post(prompt, model, stream=True)
+        pieces = []
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel is not None and cancel.is_set():
+                        raise ProviderError("Request cancelled.")
+                    if self.api == "ollama":
+                        if not line:
+                            continue
+                        text = json.loads(line).get("response")
+                    else:
+                        if not line or not line.startswith("data:") or line[5:].strip() == "[DONE]":
+                            continue
+                        text = json.loads(line[5:])["choices"][0]["delta"].get("content")
+                    if text:
+                        pieces.append(text)
+                        yield text
+            except requests.RequestException as e:
+                raise ProviderError(f"Local model request failed: {e}", transient=True)
+            except (KeyError, IndexError, TypeError, ValueError):
+                raise ProviderError("Unexpected local model response format.")
+        if not pieces:
+            raise ProviderError("Unexpected local model response format.")
+        if use_cache:
+            response_cache.store_response(prompt, cache_model, "".join(pieces), word_limit)
+
+    async def agenerate(self, prompt, model=None, word_limit=None, use_cache=True):
+        """Async generate() in a worker thread (the local server is the bottleneck, not threads)"""
+        import asyncio
+        return await asyncio.to_thread(self.generate, prompt, model, word_limit, use_cache)
+
+
+class OfflineProvider:
+    """Answers from the built-in knowledge base of common errors; never touches the network"""
+
+    name = "offline"
+    model = "offline"
+
+    def healthy(self):
+        return knowledge_base.offline_enabled()
+
+    def generate(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None, deadline=None):
+        entry = None
+        for pattern in OFFLINE_SUBJECTS:
+            match = pattern.search(prompt)
+            if match:
+                entry = knowledge_base.lookup(match.group(1))
+                break
+        if not entry:
+            raise ProviderError("No offline answer for this request.")
+        return knowledge_base.format_entry(entry)
+
+    def stream(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None):
+        yield self.generate(prompt)
+
+    async def agenerate(self, prompt, model=None, word_limit=None, use_cache=True):
+        return self.generate(prompt)
+
+
+_local_clients = {}
+_local_lock = threading.Lock()
+
+def _local(api_key=None):
+    settings = load_local_settings()
+    with _local_lock:
+        client = _local_clients.get(settings)
+        if client is None:
+            client = _local_clients[settings] = LocalModelClient(*settings)
+        return client
+
+_offline = OfflineProvider()
+
+# name -> factory taking an optional API key; a provider has a name and model, healthy(),
+# generate(), stream() and agenerate() like GeminiClient, and raises GeminiError on failure
+PROVIDERS = {}
+
+# Make a provider available to routes
+def register(name, factory):
+    PROVIDERS[name] = factory
+
+register("gemini", gemini_client.get_client)
+register("local", _local)
+register("offline", lambda api_key=None: _offline)
+
+
+class Router:
+    """Sends each request to the best provider of a route and falls back to the next one.
+
+    Providers whose usual answer time is within the route's SLO are tried first, in the
+    configured order, then slower ones. The first is tried straight away; the health of
+    the others is only checked when the request falls through to them. When none can
+    answer, the error of the first one tried is raised (e.g. a missing API key).
+    The model argument of generate() and stream() only applies to Gemini.
+    """
+
+    def __init__(self, names, slo, api_key=None):
+        self.names = names
+        self.slo = slo
+        self.api_key = api_key
+
+    @property
+    def model(self):
+        """Model of the preferred provider, used to keep cached answers apart"""
+        if not self.names:
+            return gemini_client.load_model_name()
+        return self._provider(self.names[0]).model
+
+    def _provider(self, name):
+        return PROVIDERS[name](self.api_key)
+
+    def candidates(self):
+        """The route's providers in the order they will be tried, without checking health"""
+        fast, slow = [], []
+        for name in self.names:
+            usual = latency(name)
+            (fast if usual is None or usual <= self.slo else slow).append(name)
+        return [self._provider(name) for name in fast + slow]
+
+    def _attempts(self):
+        """candidates() that are worth a request: the first, then the healthy ones"""
+        for index, provider in enumerate(self.candidates()):
+            if index == 0 or provider.healthy():
+                yield provider
+
+    def _unavailable(self, error):
+        if error is not None:
+            return error
+        return ProviderError(
+            f"No model provider is available (route: {', '.join(self.names) or 'empty'}). "
+            "Run the installer to set a Gemini API key, or start the local model server."
+        )
+
+    def _model_for(self, provider, model):
+        return model if provider.name == "gemini" else None
+
+    def generate(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None, deadline=None):
+        error = None
+        ends = None if deadline is None else time.monotonic() + deadline
+        for provider in self._attempts():
+            if cancel is not None and cancel.is_set():
+                raise ProviderError("Request cancelled.")
+            started = time.monotonic()
+            extra = {}
+            if ends is not None:
+                if started >= ends:
+                    error = error or ProviderError("Request deadline exceeded.", transient=True)
+                    break
+                extra["deadline"] = ends - started
+            try:
+                with timings.span(f"provider_{provider.name}"):
+                    text = provider.generate(prompt, model=self._model_for(provider, model),
+                                             word_limit=word_limit, use_cache=use_cache, cancel=cancel, **extra)
+            except gemini_client.GeminiError as e:
+                record_result(provider.name, None)
+                error = error or e
+                continue
+            record_result(provider.name, time.monotonic() - started)
+            return text
+        raise self._unavailable(error)
+
+    def stream(self, prompt, model=None, word_limit=None, use_cache=True, cancel=None):
+        """Stream from the first provider that starts answering; once text has been shown
+        a failure is raised rather than continued elsewhere"""
+        error = None
+        for provider in self._attempts():
+            started = time.monotonic()
+            shown = False
+            try:
+                for chunk in provider.stream(prompt, model=self._model_for(provider, model),
+                                             word_limit=word_limit, use_cache=use_cache, cancel=cancel):
+                    shown = True
+                    yield chunk
+            except gemini_client.GeminiError as e:
+                record_result(provider.name, None)
+                if shown:
+                    raise
+                error = error or e
+                continue
+            record_result(provider.name, time.monotonic() - started)
+            return
+        raise self._unavailable(error)
+
+    async def agenerate(self, prompt, model=None, word_limit=None, use_cache=True):
+        error = None
+        for provider in self._attempts():
+            started = time.monotonic()
+            try:
+                text = await provider.agenerate(prompt, self._model_for(provider, model), word_limit, use_cache)
+            except gemini_client.GeminiError as e:
+                record_result(provider.name, None)
+                error = error or e
+                continue
+            record_result(provider.name, time.monotonic() - started)
+            return text
+        raise self._unavailable(error)
+
+
+# Router for a subcommand ("explain", "fix", "syntax", "usage", or "default"), following
+# its route_<command> and route_slo_<command> settings
+def get_provider(command="default", api_key=None):
+    names, slo = load_route(command)
+    return Router(names, slo, api_key)
+
+# Print the answer to prompt under a header, streaming it when enabled
+def print_answer(prompt, header, command="default", word_limit=None):
+    provider = get_provider(command)
+    pieces = []
+    try:
+        if not gemini_client.streaming_enabled():
+            answer = provider.generate(prompt, word_limit=word_limit)
+            print(f"\n{header}:\n")
+            print(answer)
+            return answer
+
+        for chunk in provider.stream(prompt, word_limit=word_limit):
+            if not pieces:
+                print(f"\n{header}:\n")
+            pieces.append(chunk)
+            print(chunk, end="", flush=True)
+        print()
+        return "".join(pieces)
+    except gemini_client.GeminiError as e:
+        if pieces:
+            print()
+        print(f"Error: {e}")
+        return None
+
+# Show every provider's health and usual answer time, and the route of each subcommand
+def show_providers():
+    print("\n[ Model Providers ]\n")
+    for name in PROVIDERS:
+        try:
+            provider = PROVIDERS[name]()
+            status = "healthy" if provider.healthy() else "unavailable"
+            model = provider.model
+        except Exception as e:
+            status, model = f"error ({e})", "-"
+        usual = latency(name)
+        timing = f"{usual:.2f}s usual" if usual is not None else "no recent answers"
+        print(f"{name:8} {model:24} {status:12} {timing}")
+    print("\n[ Routes ]\n")
+    for command in ("default", "explain", "fix", "syntax", "usage"):
+        names, slo = load_route(command)
+        print(f"{command:8} {' -> '.join(names) or '(none)'}  (SLO {slo:g}s)")
@@ -0,0 +1,200 @@
+import fcntl
+import mmap
+import os
+import struct
+import zlib
+
+# Constants
+MAGIC = b"CLRS"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")     # magic, version, dictionary version
+RECORD = struct.Struct("<II")       # payload length, crc32 of the payload
+FIELD = "BI"                        # codec, length; a payload starts with its field count and all
+                                    # field headers, so one unpack locates every field
+RAW = 0
+DEFLATE = 1
+COMPRESS_MIN = 48                   # shorter values gain nothing from compression
+DICTIONARY_VERSION = 1
+
+# Text that recurs in explanations. zlib primes its window with it (a preset dictionary),
+# so even a short answer compresses well; it is part of the format and never stored.
+# The most common phrases go last, where they are cheapest to refer to.
+DICTIONARY = (
+    "systemctl status journalctl -xe sudo dnf install sudo apt update sudo apt install "
+    "chmod +x chown ls -l export PATH= echo $PATH which command -v ps aux | grep kill "
+    "Address already in use. Connection refused. Operation not permitted. "
+    "No space left on device. command not found. Permission denied. "
+    "No such file or directory. "
+    "**Explanation:** **Fix:** **Solution:** **Example:** ```bash\n```\n"
+    "The service is not running. the package is not installed. "
+    "Check the path, the permissions and whether the service is running, then retry. "
+    "This error means that the command could not find the file or directory. "
+    "Make sure you have the right permissions. Try running the command with sudo. "
+    "You can fix this by running the following command: "
+    "The command failed because the file or resource it needed was not available. "
+    "This error occurs when the "
+).encode("utf-8")
+
+_HEADER_BYTES = HEADER.pack(MAGIC, VERSION, DICTIONARY_VERSION)
+
+
+# Deflate data with the shared dictionary
+def compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=DICTIONARY)
+    return compressor.compress(data) + compressor.flush()
+
+def decompress(data):
+    decompressor = zlib.decompressobj(-15, zdict=DICTIONARY)
+    return decompressor.decompress(data) + decompressor.flush()
+
+# Text for a database column: deflated bytes (stored as a BLOB) when that is smaller,
+# otherwise the text itself
+def pack_text(text):
+    data = text.encode("utf-8")
+    if len(data) < COMPRESS_MIN:
+        return text
+    packed = compress(data)
+    return packed if len(packed) < len(data) else text
+
+# Text from a pack_text() column; plain TEXT written by earlier versions passes through
+def unpack_text(stored):
+    if isinstance(stored, bytes):
+        return decompress(stored).decode("utf-8", "replace")
+    return stored
+
+# Encode one record from a list of byte strings; fields whose position is in deflate are
+# compressed when that makes them smaller
+def pack(fields, deflate=()):
+    headers = []
+    values = []
+    for position, data in enumerate(fields):
+        codec = RAW
+        if position in deflate and len(data) >= COMPRESS_MIN:
+            packed = compress(data)
+            if len(packed) < len(data):
+                codec, data = DEFLATE, packed
+        headers.extend((codec, len(data)))
+        values.append(data)
+    payload = _field_headers(len(fields)).pack(len(fields), *headers) + b"".join(values)
+    return RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+# The bytes of a field read by RecordReader
+def value(field):
+    codec, data = field
+    return decompress(data) if codec == DEFLATE else data
+
+_field_structs = {}
+
+def _field_headers(count):
+    header = _field_structs.get(count)
+    if header is None:
+        header = _field_structs[count] = struct.Struct("<B" + FIELD * count)
+    return header
+
+def _fields(payload):
+    header = _field_headers(payload[0])
+    values = header.unpack_from(payload)
+    fields = []
+    position = header.size
+    for index in range(1, len(values), 2):
+        end = position + values[index + 1]
+        fields.append((values[index], payload[position:end]))
+        position = end
+    return fields
+
+# Append encoded records; returns the file size afterwards. Each call is one write under
+# an exclusive lock, so readers in other processes see whole records or a partial tail.
+def append(path, records):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = b"".join(records)
+    while True:
+        with open(path, 'ab') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                current = os.stat(path).st_ino == os.fstat(file.fileno()).st_ino
+            except OSError:
+                current = False
+            if not current:
+                continue  # compacted or removed while waiting for the lock
+            file.write(data if file.tell() else _HEADER_BYTES + data)
+            return file.tell()
+
+# Keep only the last keep records (rewritten to a new file renamed over the old one)
+def compact(path, keep):
+    while True:
+        with open(path, 'rb+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                current = os.stat(path).st_ino == os.fstat(file.fileno()).st_ino
+            except OSError:
+                current = False
+            if not current:
+                continue  # compacted by another process while waiting for the lock
+            with RecordReader(path) as reader:
+                spans = [(offset, end) for offset, end, _ in reader.records()]
+                kept = spans[-keep:] if keep > 0 else []
+                data = b"".join(reader.raw(offset, end) for offset, end in kept)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as out:
+                out.write(_HEADER_BYTES + data)
+            os.replace(tmp, path)
+            return
+
+
+class RecordReader:
+    """Memory-mapped record file: records are located by their length prefixes and only
+    the fields a caller keeps are copied out; compressed fields stay compressed"""
+
+    def __init__(self, path):
+        self.file = None
+        self.map = None
+        try:
+            self.file = open(path, 'rb')
+            size = os.fstat(self.file.fileno()).st_size
+            if size > HEADER.size:
+                self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+        except OSError:
+            self.close()
+            return
+        if self.map is not None and HEADER.unpack_from(self.map) != (MAGIC, VERSION, DICTIONARY_VERSION):
+            self.close()  # another format or dictionary: treated as empty
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def records(self, offset=0):
+        """Yield (offset, end, fields) for each complete record at or after offset.
+
+        fields is a list of (codec, bytes) pairs; value() decodes one. A record still being
+        written ends the scan; a damaged one is skipped.
+        """
+        if self.map is None:
+            return
+        position = max(offset, HEADER.size)
+        size = len(self.map)
+        while position + RECORD.size <= size:
+            length, checksum = RECORD.unpack_from(self.map, position)
+            start = position + RECORD.size
+            end = start + length
+            if end > size:
+                break
+            payload = self.map[start:end]
+            if zlib.crc32(payload) == checksum:
+                yield position, end, _fields(payload)
+            position = end
+
+    def raw(self, offset, end):
+        """The encoded bytes of the record at offset"""
+        return self.map[offset:end]
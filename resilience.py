@@ -0,0 +1,181 @@
+import email.utils
+import fcntl
+import json
+import os
+import random
+import threading
+import time
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+HEALTH_FILE = os.path.join(DATA_DIR, 'api_health.json')
+
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+MAX_RETRY_AFTER = 120.0  # ignore absurd Retry-After values
+
+
+# Full-jitter exponential backoff: a random delay in [0, min(cap, base * 2^attempt)]
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+# Seconds to wait from a Retry-After header (delta seconds or an HTTP date), or None
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = when.timestamp() - time.time()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when waiting for a slot would run past the caller's deadline"""
+
+
+class TokenBucket:
+    """Client-side rate limiter that slows down on 429s and recovers on success"""
+
+    def __init__(self, per_minute, burst=None):
+        """per_minute <= 0 disables limiting"""
+        self.max_rate = per_minute / 60.0 if per_minute > 0 else 0.0
+        self.rate = self.max_rate
+        self.capacity = float(burst if burst is not None else max(1, min(per_minute / 6, 10)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def set_rate(self, per_minute):
+        """Change the target rate (the adaptive rate restarts from it)"""
+        with self.lock:
+            self.max_rate = per_minute / 60.0 if per_minute > 0 else 0.0
+            self.rate = self.max_rate
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, deadline=None):
+        """Take one token, sleeping until one is available; raises DeadlineExceeded"""
+        wait = self.reserve(deadline)
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self, deadline=None):
+        """Take one token and return the seconds to wait before using it; raises DeadlineExceeded"""
+        if not self.max_rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            # A negative balance is a queue: this caller waits for its share to refill
+            wait = max(-self.tokens / self.rate if self.tokens < 0 else 0.0, self.blocked_until - now)
+            if deadline is not None and now + wait > deadline:
+                self.tokens += 1
+                raise DeadlineExceeded(f"rate limit wait of {wait:.1f}s exceeds the deadline")
+        return wait
+
+    def penalize(self, retry_after=None):
+        """The server said 429: halve the rate and hold everyone back for retry_after seconds"""
+        with self.lock:
+            if self.max_rate:
+                self.rate = max(self.rate / 2, self.max_rate / 32)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def reward(self):
+        """A request succeeded: creep back towards the configured rate"""
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing, then probes it again after a pause.
+
+    The open state is also written to a small shared file so that separate cli
+    processes fail fast while another one has found the API down.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, state_file=HEALTH_FILE):
+        """Open after failure_threshold consecutive failures, for reset_timeout seconds"""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state_file = state_file
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def _shared_open_until(self):
+        if not self.state_file:
+            return 0.0
+        try:
+            with open(self.state_file, 'r') as file:
+                return float(json.load(file).get("open_until", 0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            return 0.0
+
+    def _write_shared(self, open_until):
+        if not self.state_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+            with open(self.state_file, 'a+') as file:
+                fcntl.flock(file, fcntl.LOCK_EX)
+                file.seek(0)
+                file.truncate()
+                json.dump({"open_until": open_until, "updated": time.time()}, file)
+        except OSError:
+            pass
+
+    def retry_in(self):
+        """Seconds until the circuit may be tried again (0 when closed)"""
+        return max(max(self.open_until, self._shared_open_until()) - time.time(), 0.0)
+
+    def allow(self):
+        """Whether a request may be sent now; after the pause one probe is let through"""
+        with self.lock:
+            now = time.time()
+            open_until = max(self.open_until, self._shared_open_until())
+            if now < open_until:
+                return False
+            if open_until and self.failures >= self.failure_threshold:
+                # Half-open: a single probe decides whether to close again
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            was_open = self.open_until or self.probing
+            self.failures = 0
+            self.probing = False
+            self.open_until = 0.0
+        if was_open:
+            self._write_shared(0.0)
+
+    def release(self):
+        """End a half-open probe whatever its outcome; a rate limit or a rejected request says
+        nothing about the upstream's health, and without this the circuit would never close"""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures < self.failure_threshold:
+                return
+            self.open_until = time.time() + self.reset_timeout
+            open_until = self.open_until
+        self._write_shared(open_until)
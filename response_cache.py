@@ -0,0 +1,173 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from . import record_store, settings_manager
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+CACHE_FILE = os.path.join(DATA_DIR, 'response_cache.db')
+
+DEFAULT_TTL_HOURS = 168
+DEFAULT_MAX_ENTRIES = 1000
+
+# Read cache limits from settings, falling back to defaults
+def load_cache_settings():
+    settings = settings_manager.snapshot()
+    enabled = str(settings.get("cache_enabled", True)).lower() not in ("false", "0", "no", "off")
+    try:
+        ttl = float(settings.get("cache_ttl_hours", DEFAULT_TTL_HOURS)) * 3600
+    except (TypeError, ValueError):
+        ttl = DEFAULT_TTL_HOURS * 3600
+    try:
+        max_entries = int(settings.get("cache_max_entries", DEFAULT_MAX_ENTRIES))
+    except (TypeError, ValueError):
+        max_entries = DEFAULT_MAX_ENTRIES
+    return enabled, ttl, max_entries
+
+# Open the shared cache database (WAL mode so several shells can use it at once)
+def connect():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    conn = sqlite3.connect(CACHE_FILE, timeout=5, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " key TEXT PRIMARY KEY,"
+        " model TEXT NOT NULL,"
+        " word_limit INTEGER,"
+        " prompt TEXT NOT NULL,"
+        " response TEXT NOT NULL,"
+        " created REAL NOT NULL,"
+        " accessed REAL NOT NULL,"
+        " hits INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+    return conn
+
+_conn = None
+_conn_lock = threading.Lock()   # one statement at a time on the shared connection
+
+# This process's connection, opened (and the schema created) on first use; callers hold _conn_lock
+def _connection():
+    global _conn
+    if _conn is None:
+        _conn = connect()
+    return _conn
+
+# Collapse whitespace so trivially different prompts share an entry. Case is kept: 'tar -C'
+# and 'tar -c' are different commands.
+def normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt).strip()
+
+# Build the cache key from the normalized prompt, model name and word limit
+def make_key(prompt, model, word_limit=None):
+    raw = f"{model}\x00{word_limit or ''}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# Look up a cached response, returns None on a miss or expired entry.
+# Expired entries are kept until pruned so they can still be served (allow_stale)
+# when Gemini is unreachable.
+def get_response(prompt, model, word_limit=None, allow_stale=False):
+    enabled, ttl, _ = load_cache_settings()
+    if not enabled:
+        return None
+    key = make_key(prompt, model, word_limit)
+    now = time.time()
+    with _conn_lock:
+        try:
+            conn = _connection()
+            with conn:
+                row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                response, created = row
+                if now - created > ttl and not allow_stale:
+                    return None
+                conn.execute("UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            return None
+    return record_store.unpack_text(response)
+
+# Store a response and evict least recently used entries past the size limit
+def store_response(prompt, model, response, word_limit=None):
+    enabled, _, max_entries = load_cache_settings()
+    if not enabled or not response:
+        return
+    key = make_key(prompt, model, word_limit)
+    now = time.time()
+    packed = record_store.pack_text(response)
+    with _conn_lock:
+        try:
+            conn = _connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, word_limit, prompt, response, created, accessed, hits)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+                    (key, model, word_limit, prompt, packed, now, now)
+                )
+                _evict(conn, max_entries)
+        except sqlite3.Error:
+            pass
+
+def _evict(conn, max_entries):
+    conn.execute(
+        "DELETE FROM responses WHERE key IN ("
+        " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+        (max(max_entries, 0),)
+    )
+
+# Remove expired entries and enforce the size limit, returns number removed
+def prune_cache():
+    _, ttl, max_entries = load_cache_settings()
+    conn = connect()
+    try:
+        with conn:
+            before = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            _evict(conn, max_entries)
+            after = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    return before - after
+
+# Remove every cached response
+def clear_cache():
+    conn = connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM responses")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+# Collect cache statistics
+def cache_stats():
+    enabled, ttl, max_entries = load_cache_settings()
+    conn = connect()
+    try:
+        count, hits, oldest, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(hits), 0), MIN(created), COALESCE(SUM(LENGTH(response)), 0) FROM responses"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {
+        "enabled": enabled,
+        "entries": count,
+        "max_entries": max_entries,
+        "ttl_hours": ttl / 3600,
+        "total_hits": hits,
+        "oldest_age_hours": round((time.time() - oldest) / 3600, 1) if oldest else 0,
+        "response_bytes": size,
+        "file": CACHE_FILE
+    }
+
+# Display cache statistics
+def show_cache_stats():
+    print("\n[ Response Cache ]\n")
+    for key, value in cache_stats().items():
+        print(f"{key}: {value}")
@@ -0,0 +1,313 @@
+import array
+import json
+import math
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from . import record_store, settings_manager, timings
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+INDEX_FILE = os.path.join(DATA_DIR, 'semantic_cache.bin')
+LEGACY_FILE = os.path.join(DATA_DIR, 'semantic_cache.jsonl')
+
+DEFAULT_THRESHOLD = 0.88
+DEFAULT_MAX_ENTRIES = 2000
+NUMPY_MIN_ENTRIES = 256   # below this the inverted index is faster than a matrix product
+DENSE_DIMENSIONS = 4096   # hashed features are folded to this width for the NumPy matrix
+CANDIDATES = 8            # NumPy scores are approximate; this many best rows are rescored exactly
+RECORD_BYTES = 2048       # generous size of one stored record, for deciding when to compact
+
+# Commands whose first argument is a bundle of flags even without a dash ("tar xzf")
+BUNDLED_FLAG_COMMANDS = ("tar", "ps", "ar")
+# Kinds whose texts only match when they use the same options ("tar -czf" is not "tar -xzf",
+# however similar the rest)
+EXACT_OPTION_KINDS = ("command", "query")
+
+_TOKEN = re.compile(r"[\w.+/:@-]+")
+_PIECE = re.compile(r"[^\W\d_]{3,}")
+
+
+# Read semantic cache settings
+def load_semantic_settings():
+    settings = settings_manager.snapshot()
+    enabled = str(settings.get("semantic_cache", True)).lower() not in ("false", "0", "no", "off")
+    try:
+        threshold = float(settings.get("semantic_threshold", DEFAULT_THRESHOLD))
+    except (TypeError, ValueError):
+        threshold = DEFAULT_THRESHOLD
+    try:
+        max_entries = int(settings.get("semantic_max_entries", DEFAULT_MAX_ENTRIES))
+    except (TypeError, ValueError):
+        max_entries = DEFAULT_MAX_ENTRIES
+    return enabled, threshold, max_entries
+
+def _expand_flags(tokens):
+    expanded = []
+    for position, token in enumerate(tokens):
+        if re.fullmatch(r"-[A-Za-z]{2,}", token):
+            expanded.extend(f"-{letter}" for letter in token[1:])
+        elif position == 1 and tokens[0].lower() in BUNDLED_FLAG_COMMANDS and re.fullmatch(r"[A-Za-z]{2,}", token):
+            expanded.extend(f"-{letter}" for letter in token)
+        else:
+            expanded.append(token)
+    return expanded
+
+# Tokens of a text, lowercased except options: -R and -r, -C and -c are different options
+def _tokens(kind, text):
+    tokens = _TOKEN.findall(text)
+    if kind == "command":
+        tokens = _expand_flags(tokens)
+    return [token if token.startswith("-") else token.lower() for token in tokens]
+
+# What two texts of a kind must share exactly to be the same question: the command name and
+# set of options for commands, the set of options for free-form questions, nothing otherwise
+def signature(kind, text):
+    if kind not in EXACT_OPTION_KINDS:
+        return None
+    tokens = _tokens(kind, text)
+    options = frozenset(token for token in tokens if len(token) > 1 and token.startswith("-"))
+    if kind == "command":
+        return (tokens[0] if tokens else "", options)
+    return options
+
+# Weighted features of a text. Whole tokens count fully, and the alphabetic pieces of
+# compound tokens too, so 'libssl.so.1.1' and 'libssl.so.3' still share 'libssl'.
+def features(kind, text):
+    tokens = _tokens(kind, text)
+    weights = {}
+    for token in tokens:
+        weights[token] = 1.0
+        if not token.isalpha():
+            for piece in _PIECE.findall(token):
+                weights.setdefault(piece, 1.0)
+    return weights
+
+# Sparse unit vector {hashed feature: weight}; crc32 keeps hashes stable across processes
+def vectorize(kind, text):
+    vector = {}
+    for feature, weight in features(kind, text).items():
+        index = zlib.crc32(feature.encode("utf-8"))
+        vector[index] = vector.get(index, 0.0) + weight
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {i: w / norm for i, w in vector.items()} if norm else {}
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(i, 0.0) for i, w in a.items())
+
+
+class SemanticIndex:
+    """Answered prompts of one kind and model, searchable by cosine similarity"""
+
+    def __init__(self):
+        self.entries = []     # (text, answer, vector); answer is still compressed
+        self.postings = {}    # feature -> entry positions, for the pure-Python search
+        self.matrix = None    # dense NumPy matrix, rebuilt lazily after additions
+
+    def add(self, text, answer, vector):
+        position = len(self.entries)
+        self.entries.append((text, answer, vector))
+        for index in vector:
+            self.postings.setdefault(index, []).append(position)
+        self.matrix = None
+
+    def search(self, vector, threshold, accept=None):
+        """Best (similarity, text, stored answer) at or above threshold, or None; accept(text)
+        can rule out entries whatever their score"""
+        if not vector or not self.entries:
+            return None
+        numpy = _numpy() if len(self.entries) >= NUMPY_MIN_ENTRIES else None
+        if numpy is not None:
+            candidates = self._dense_candidates(numpy, vector)
+        else:
+            candidates = self._prefix_candidates(vector, threshold)
+        best = None
+        for position in candidates:
+            text, answer, stored = self.entries[position]
+            score = cosine(vector, stored)
+            # Later entries win ties: they are the most recent answers
+            if score >= threshold and (best is None or score >= best[0]) and (accept is None or accept(text)):
+                best = (score, text, answer)
+        return best
+
+    def _prefix_candidates(self, vector, threshold):
+        # Any entry with cosine >= threshold shares at least one of the query's rarest
+        # features (prefix filtering), so only their posting lists need scoring
+        ranked = sorted(vector, key=lambda i: len(self.postings.get(i, ())))
+        prefix = len(ranked) - int(threshold * threshold * len(ranked)) + 1
+        candidates = set()
+        for index in ranked[:max(prefix, 1)]:
+            candidates.update(self.postings.get(index, ()))
+        return candidates
+
+    def _dense_candidates(self, numpy, vector):
+        if self.matrix is None:
+            matrix = numpy.zeros((len(self.entries), DENSE_DIMENSIONS), dtype=numpy.float32)
+            for row, (_, _, stored) in enumerate(self.entries):
+                for index, weight in stored.items():
+                    matrix[row, index % DENSE_DIMENSIONS] += weight
+            self.matrix = matrix
+        query = numpy.zeros(DENSE_DIMENSIONS, dtype=numpy.float32)
+        for index, weight in vector.items():
+            query[index % DENSE_DIMENSIONS] += weight
+        scores = self.matrix @ query
+        count = min(CANDIDATES, len(self.entries))
+        return numpy.argpartition(scores, -count)[-count:].tolist()
+
+
+_numpy_module = False
+
+def _numpy():
+    # NumPy is optional and only imported once an index is large enough to need it
+    global _numpy_module
+    if _numpy_module is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_module = numpy
+    return _numpy_module
+
+
+_indexes = {}
+_offset = 0
+_file_id = None
+_lock = threading.Lock()
+
+# One stored answer: kind, model, text, vector (feature ids then weights), answer
+# (compressed) and time. Loading the index never decompresses the answers.
+def _pack(kind, model, text, answer, vector):
+    fields = [
+        kind.encode("utf-8"),
+        model.encode("utf-8"),
+        text.encode("utf-8"),
+        array.array("I", vector.keys()).tobytes() + array.array("f", vector.values()).tobytes(),
+        answer.encode("utf-8"),
+        struct.pack("<d", time.time())
+    ]
+    return record_store.pack(fields, deflate=(4,))
+
+def _unpack_vector(data):
+    count = len(data) // 8
+    indexes = array.array("I", data[:count * 4])
+    weights = array.array("f", data[count * 4:count * 8])
+    return dict(zip(indexes, weights))
+
+def _load_new_records():
+    # Read only what was appended since the last call (the file is append-only between compactions)
+    global _indexes, _offset, _file_id
+    if os.path.exists(LEGACY_FILE):
+        _migrate_jsonl()
+    try:
+        stat = os.stat(INDEX_FILE)
+    except OSError:
+        _indexes, _offset, _file_id = {}, 0, None
+        return
+    file_id = (stat.st_ino, stat.st_dev)
+    if file_id != _file_id or stat.st_size < _offset:
+        _indexes, _offset, _file_id = {}, 0, file_id
+    if stat.st_size == _offset:
+        return
+    indexes = {}  # (kind, model) as stored -> index, to decode each pair once
+    with record_store.RecordReader(INDEX_FILE) as reader:
+        for _, end, fields in reader.records(_offset):
+            _offset = end
+            if len(fields) < 5:
+                continue
+            key = (fields[0][1], fields[1][1])
+            index = indexes.get(key)
+            if index is None:
+                name = (key[0].decode("utf-8", "replace"), key[1].decode("utf-8", "replace"))
+                index = indexes[key] = _indexes.setdefault(name, SemanticIndex())
+            text = record_store.value(fields[2]).decode("utf-8", "replace")
+            index.add(text, fields[4], _unpack_vector(record_store.value(fields[3])))
+
+# Convert the JSON lines index of earlier versions once, then move it out of the way
+def _migrate_jsonl():
+    records = []
+    try:
+        with open(LEGACY_FILE, 'rb') as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return
+    for line in lines:
+        try:
+            record = json.loads(line)
+            vector = {int(i): w for i, w in record["vector"]}
+            records.append(_pack(record["kind"], record["model"], record["text"], record["answer"], vector))
+        except (ValueError, KeyError, TypeError):
+            continue
+    try:
+        if records:
+            record_store.append(INDEX_FILE, records)
+        os.replace(LEGACY_FILE, LEGACY_FILE + ".migrated")
+    except OSError:
+        pass
+
+# Find a stored answer to a similar prompt: returns (answer, similarity, original text) or None
+def lookup(kind, text, model):
+    enabled, threshold, _ = load_semantic_settings()
+    if not enabled or not text:
+        return None
+    with timings.span("semantic_lookup"):
+        vector = vectorize(kind, text)
+        required = signature(kind, text)
+        accept = (lambda stored: signature(kind, stored) == required) if required is not None else None
+        with _lock:
+            _load_new_records()
+            index = _indexes.get((kind, model))
+            match = index.search(vector, threshold, accept) if index else None
+    if match is None:
+        return None
+    score, original, answer = match
+    return record_store.value(answer).decode("utf-8", "replace"), score, original
+
+# Remember an answer; appended to the index file so other processes see it on their next lookup
+def remember(kind, text, answer, model):
+    enabled, _, max_entries = load_semantic_settings()
+    if not enabled or not text or not answer or answer.startswith("Error:"):
+        return
+    vector = vectorize(kind, text)
+    if not vector:
+        return
+    try:
+        size = record_store.append(INDEX_FILE, [_pack(kind, model, text, answer, vector)])
+        # Compact once the file is well past the limit
+        if size > max_entries * RECORD_BYTES:
+            record_store.compact(INDEX_FILE, max_entries)
+    except OSError:
+        pass
+
+# Remove every remembered answer
+def clear_cache():
+    try:
+        os.unlink(INDEX_FILE)
+    except FileNotFoundError:
+        pass
+
+# Collect index statistics
+def cache_stats():
+    enabled, threshold, max_entries = load_semantic_settings()
+    with _lock:
+        _load_new_records()
+        entries = sum(len(index.entries) for index in _indexes.values())
+    return {
+        "enabled": enabled,
+        "entries": entries,
+        "max_entries": max_entries,
+        "threshold": threshold,
+        "numpy": _numpy() is not None,
+        "file": INDEX_FILE
+    }
+
+# Display index statistics
+def show_cache_stats():
+    print("\n[ Semantic Cache ]\n")
+    for key, value in cache_stats().items():
+        print(f"{key}: {value}")
@@ -1,27 +1,135 @@
+import fcntl
 import json
 import os
+import stat
+import threading
+import types
 
 # Constants
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+LOCK_FILE = SETTINGS_FILE + '.lock'
+
+DEFAULT_SETTINGS = {
+    "cli_name": "CLI_MANAGER",
+    "text_color": "default",
+    "font_style": "normal",
+    "text_size": "medium",
+    "cache_enabled": True,
+    "cache_ttl_hours": 168,
+    "cache_max_entries": 1000,
+    "stream_output": True,
+    "offline_kb": True,
+    "history_retention_days": 90,
+    "history_max_records": 200000,
+    "trap_display": "prompt",
+    "trap_debounce_seconds": 300,
+    "trap_max_per_minute": 6,
+    "trap_capture_stderr": False,
+    "metrics_file": "",
+    "metrics_format": "prometheus",
+    "api_deadline_seconds": 60,
+    "api_max_retries": 3,
+    "api_rate_per_minute": 60,
+    "semantic_cache": True,
+    "semantic_threshold": 0.88,
+    "semantic_max_entries": 2000,
+    "syntax_precheck": True,
+    "help_probe": True,
+    "local_manual": True,
+    "prefetch": False,
+    "prefetch_max_per_day": 100,
+    "prefetch_concurrency": 2,
+    "prefetch_budget_seconds": 20,
+    "prompt_token_budget": 1500,
+    "local_model_url": "http://127.0.0.1:11434",
+    "local_model_api": "ollama",
+    "local_model": "llama3.2",
+    "route_default": "gemini,local,offline",
+    "route_syntax": "local,gemini,offline",
+    "route_fix": "gemini,local,offline",
+    "route_slo_default": 8,
+    "route_slo_syntax": 2
+}
+
+# Parsed settings and the file version they came from. The file is only ever replaced by
+# rename, so a version (inode, mtime, size) always matches one complete file and readers
+# need no lock: one stat tells whether the cached parse is still current.
+_snapshot = (None, None)
+_snapshot_lock = threading.Lock()
+
+def _version():
+    try:
+        info = os.stat(SETTINGS_FILE)
+    except OSError:
+        return None
+    return (info.st_ino, info.st_mtime_ns, info.st_size)
+
+def _read_file():
+    try:
+        with open(SETTINGS_FILE, 'r') as file:
+            settings = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return settings if isinstance(settings, dict) else None
+
+# Current settings as a read-only mapping, parsed at most once per change of the file.
+# An empty mapping when the file is missing or unreadable; callers apply their own defaults.
+def snapshot():
+    global _snapshot
+    version = _version()
+    cached_version, settings = _snapshot
+    if settings is not None and version == cached_version:
+        return settings
+    with _snapshot_lock:
+        if _snapshot[1] is not None and _snapshot[0] == version:
+            return _snapshot[1]
+        settings = types.MappingProxyType(_read_file() or {}) if version else types.MappingProxyType({})
+        _snapshot = (version, settings)
+        return settings
+
+# Version of the settings currently on disk, for callers that cache values derived from them
+def generation():
+    return _version()
 
 # Load settings
 def load_settings():
-    if not os.path.exists(SETTINGS_FILE):
-        return {
-            "cli_name": "CLI_MANAGER",
-            "text_color": "default",
-            "font_style": "normal",
-            "text_size": "medium"
-        }
-    with open(SETTINGS_FILE, 'r') as file:
-        return json.load(file)
-
-# Save settings
-def save_settings(settings):
-    with open(SETTINGS_FILE, 'w') as file:
+    if _version() is None:
+        return dict(DEFAULT_SETTINGS)
+    return dict(snapshot())
+
+def _write(settings):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    tmp = f"{SETTINGS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as file:
         json.dump(settings, file, indent=4)
+        file.flush()
+        os.fsync(file.fileno())
+    try:
+        os.chmod(tmp, stat.S_IMODE(os.stat(SETTINGS_FILE).st_mode))
+    except OSError:
+        pass
+    os.replace(tmp, SETTINGS_FILE)
+
+class _WriteLock:
+    """Serializes writers across processes; readers never wait for it"""
+
+    def __enter__(self):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        self.file = open(LOCK_FILE, 'a')
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+        return False
+
+# Save settings (written to a temporary file and renamed over the old one, so a reader or a
+# crash never sees a half-written file)
+def save_settings(settings):
+    with _WriteLock():
+        _write(settings)
 
 # List current settings
 def list_settings():
@@ -32,10 +140,12 @@ def list_settings():
 
 # Update a specific setting
 def update_setting(key, value):
-    settings = load_settings()
-    if key not in settings:
-        print(f"Invalid setting: {key}")
-        return
-    settings[key] = value
-    save_settings(settings)
+    # Read and write under the lock, so concurrent updates from other shells are not lost
+    with _WriteLock():
+        settings = _read_file() if _version() else dict(DEFAULT_SETTINGS)
+        if settings is None or key not in settings:
+            print(f"Invalid setting: {key}")
+            return
+        settings[key] = value
+        _write(settings)
     print(f"{key} updated to {value}.")
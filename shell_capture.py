@@ -0,0 +1,94 @@
+import fcntl
+import mmap
+import os
+import struct
+import time
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+RING_FILE = os.path.join(DATA_DIR, 'error_ring.bin')
+
+MAGIC = b"CLIR"
+VERSION = 1
+SLOTS = 64
+SLOT_SIZE = 4096
+HEADER = struct.Struct("<4sHHIQ")          # magic, version, slots, slot size, last sequence
+RECORD = struct.Struct("<QdiIHH")          # sequence, timestamp, exit code, duration ms, command len, stderr len
+HEADER_SIZE = 32
+MAX_COMMAND = 1024
+MAX_STDERR = SLOT_SIZE - RECORD.size - MAX_COMMAND
+FILE_SIZE = HEADER_SIZE + SLOTS * SLOT_SIZE
+
+
+# Create the ring file with an empty header if it does not exist yet
+def _ensure_ring():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    fd = os.open(RING_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        if os.fstat(fd).st_size != FILE_SIZE:
+            os.ftruncate(fd, FILE_SIZE)
+            os.pwrite(fd, HEADER.pack(MAGIC, VERSION, SLOTS, SLOT_SIZE, 0), 0)
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+# Append one failed command to the ring, overwriting the oldest slot
+def record_error(command, exit_code, duration_ms=0, stderr=b""):
+    _ensure_ring()
+    if isinstance(stderr, str):
+        stderr = stderr.encode("utf-8", "replace")
+    command_bytes = command.strip().encode("utf-8", "replace")[:MAX_COMMAND]
+    stderr = stderr[-MAX_STDERR:]
+
+    with open(RING_FILE, 'r+b') as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        with mmap.mmap(file.fileno(), FILE_SIZE) as ring:
+            _, _, slots, slot_size, last_seq = HEADER.unpack_from(ring, 0)
+            seq = last_seq + 1
+            offset = HEADER_SIZE + ((seq - 1) % slots) * slot_size
+            RECORD.pack_into(ring, offset, seq, time.time(), int(exit_code), max(int(duration_ms), 0),
+                             len(command_bytes), len(stderr))
+            body = offset + RECORD.size
+            ring[body:body + len(command_bytes)] = command_bytes
+            ring[body + len(command_bytes):body + len(command_bytes) + len(stderr)] = stderr
+            # Publish the slot only once it is fully written
+            HEADER.pack_into(ring, 0, MAGIC, VERSION, slots, slot_size, seq)
+    return seq
+
+def _read_slot(ring, seq, slots, slot_size):
+    offset = HEADER_SIZE + ((seq - 1) % slots) * slot_size
+    slot_seq, timestamp, exit_code, duration_ms, command_len, stderr_len = RECORD.unpack_from(ring, offset)
+    if slot_seq != seq:
+        return None
+    body = offset + RECORD.size
+    return {
+        "seq": seq,
+        "timestamp": timestamp,
+        "command": ring[body:body + command_len].decode("utf-8", "replace"),
+        "exit_code": exit_code,
+        "duration_ms": duration_ms,
+        "stderr": ring[body + command_len:body + command_len + stderr_len].decode("utf-8", "replace").strip()
+    }
+
+# Return up to count most recent records, newest first
+def read_recent(count=1):
+    if not os.path.exists(RING_FILE) or os.path.getsize(RING_FILE) != FILE_SIZE:
+        return []
+    with open(RING_FILE, 'rb') as file:
+        with mmap.mmap(file.fileno(), FILE_SIZE, access=mmap.ACCESS_READ) as ring:
+            magic, _, slots, slot_size, last_seq = HEADER.unpack_from(ring, 0)
+            if magic != MAGIC:
+                return []
+            records = []
+            for seq in range(last_seq, max(last_seq - min(count, slots), 0), -1):
+                record = _read_slot(ring, seq, slots, slot_size)
+                if record is not None:
+                    records.append(record)
+            return records
+
+# Most recent failed command, or None
+def read_latest_error():
+    records = read_recent(1)
+    return records[0] if records else None
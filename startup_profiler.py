@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+import time
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI_MANAGER_SCRIPT = os.path.join(BASE_DIR, 'cli_manager.py')
+
+TOP_IMPORTS = 15
+
+
+# Parse the stderr of `python -X importtime` into (name, depth, self_us, cumulative_us) rows
+def parse_importtime(stderr_text):
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|", 2)
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0])
+            cumulative_us = int(parts[1])
+        except ValueError:
+            continue  # column header
+        name = parts[2][1:]
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((name.strip(), depth, self_us, cumulative_us))
+    return rows
+
+# Run cli_manager.py with the given arguments in a fresh interpreter and time its imports
+def profile_startup(argv, script=CLI_MANAGER_SCRIPT):
+    env = dict(os.environ, CLI_MANAGER_NO_DAEMON="1")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", script] + list(argv),
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        env=env, text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    rows = parse_importtime(result.stderr)
+    top_level = [row for row in rows if row[1] == 0]
+    return {
+        "argv": list(argv),
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(row[3] for row in top_level) / 1000, 1),
+        "modules_imported": len(rows),
+        "loaded_modules": [row[0] for row in rows],
+        "imports": sorted(top_level, key=lambda row: row[3], reverse=True)
+    }
+
+# Display a startup report: total time, then the most expensive top-level imports
+def show_startup_profile(argv, top=TOP_IMPORTS):
+    report = profile_startup(argv)
+    label = " ".join(argv) if argv else "(usage screen)"
+    print(f"\n[Startup profile: cli {label}]\n")
+    print(f"Wall time:        {report['wall_ms']:.1f} ms")
+    print(f"Import time:      {report['import_ms']:.1f} ms ({report['modules_imported']} modules)")
+    print(f"\n{'cumulative':>12} {'self':>10}  module")
+    for name, _, self_us, cumulative_us in report["imports"][:top]:
+        print(f"{cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms  {name}")
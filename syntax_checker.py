@@ -0,0 +1,486 @@
+import difflib
+import json
+import os
+import re
+import threading
+from . import settings_manager, timings, man_index
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+PATH_INDEX_FILE = os.path.join(DATA_DIR, 'path_index.json')
+OPTION_TABLE_FILE = os.path.join(DATA_DIR, 'option_table.json')
+OPTION_TABLE_VERSION = 3    # bumped when entries gain fields, so older ones are rebuilt
+
+SEPARATORS = ("|", "|&", "||", "&&", ";", "&")
+REDIRECTIONS = (">", ">>", "<", "<<", "<<<", ">&", "<&", "&>", "&>>", ">|", "<>")
+
+# Words that start shell syntax this checker does not follow (loops, conditionals, functions)
+SHELL_KEYWORDS = {"if", "then", "elif", "else", "fi", "case", "esac", "for", "select", "while",
+                  "until", "do", "done", "function", "{", "}", "[[", "]]", "!", "coproc"}
+SHELL_BUILTINS = {":", ".", "[", "alias", "bg", "bind", "break", "builtin", "caller", "cd", "command",
+                  "compgen", "complete", "continue", "declare", "dirs", "disown", "echo", "enable",
+                  "eval", "exec", "exit", "export", "false", "fc", "fg", "getopts", "hash", "help",
+                  "history", "jobs", "kill", "let", "local", "logout", "mapfile", "popd", "printf",
+                  "pushd", "pwd", "read", "readonly", "return", "set", "shift", "shopt", "source",
+                  "suspend", "test", "times", "trap", "true", "type", "typeset", "ulimit", "umask",
+                  "unalias", "unset", "wait"}
+
+# Prefixes that run the next word as the command ("sudo apt install x")
+WRAPPERS = {"sudo", "time", "nohup", "nice", "env", "command", "exec", "builtin"}
+
+_OPTION = re.compile(r"(?<![\w-])(--?[A-Za-z0-9?][\w.+-]*)(\[=|\[(?=[A-Za-z<])|=|[ \t](?=<|[A-Z][A-Z_-]*\b))?")
+_MAN_OPTION = re.compile(r"(?<![\w-])(--?[A-Za-z0-9?][\w.+-]*)(\[=|\[(?=[A-Za-z<])|=| (?=<?[A-Za-z]))?")
+_BUNDLE = re.compile(r"\[-([A-Za-z0-9]{2,})\]")         # "[-46AaCf]" in a usage synopsis
+_WITH_ARG = re.compile(r"\[-([A-Za-z0-9]) [^\]\s-][^\]]*\]")  # "[-p port]"
+_SUBCOMMAND = re.compile(r"^ {2,8}([a-z][a-z0-9-]*)(?=\s{2,}|\s+[\[<A-Z]|\s+-\s|\s*$)")
+_USAGE_COMMAND = re.compile(r"<command>|\bCOMMAND\b|\[options\] command\b")
+_SUBCOMMAND_WORD = re.compile(r"[a-z][\w-]*")
+# Options every man page lists; a page with nothing else does not document the program's options
+GENERIC_OPTIONS = {"--help", "--version"}
+_ASSIGNMENT = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+_SHELL_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<operator>\$\(\(|\$\(|<\(|>\(|&>>|&>|\|&|\|\||&&|;;|<<<|<<|>>|>&|<&|>\||<>|[|&;<>()])
+  | (?P<word>(?:[^\s|&;<>()'"\\$]|\\.|'[^']*'|"(?:[^"\\]|\\.)*"|\$(?!\())+)
+""", re.VERBOSE | re.DOTALL)
+_QUOTED = re.compile(r"'([^']*)'|\"((?:[^\"\\]|\\.)*)\"|\\(.)", re.DOTALL)
+_ESCAPE = re.compile(r"\\([\\\"$`])")
+
+
+# Read syntax pre-check settings
+def load_syntax_settings():
+    settings = settings_manager.snapshot()
+    enabled = str(settings.get("syntax_precheck", True)).lower() not in ("false", "0", "no", "off")
+    probe_help = str(settings.get("help_probe", True)).lower() not in ("false", "0", "no", "off")
+    return enabled, probe_help
+
+
+class CheckResult:
+    """Outcome of a local check: 'valid', 'invalid' (with problems) or 'unknown'"""
+
+    def __init__(self):
+        self.problems = []    # definite mistakes, passed on to the model as hints
+        self.unchecked = []   # parts the checker could not verify
+
+    @property
+    def verdict(self):
+        if self.problems:
+            return "invalid"
+        return "unknown" if self.unchecked else "valid"
+
+    def __repr__(self):
+        return f"CheckResult({self.verdict}, problems={self.problems}, unchecked={self.unchecked})"
+
+
+# ---- tokenizing ----
+
+# Split a command line into (text, is_operator) tokens. Quotes and backslashes are
+# resolved in words, so a quoted ';' or '|' stays an ordinary argument.
+def tokenize(command_text):
+    tokens = []
+    position = 0
+    while position < len(command_text):
+        match = _SHELL_TOKEN.match(command_text, position)
+        if not match:
+            quote = command_text[position]
+            raise ValueError(f"no closing quotation ({quote})" if quote in "'\"" else "trailing backslash")
+        position = match.end()
+        if match.lastgroup == "operator":
+            tokens.append((match.group(), True))
+        elif match.lastgroup == "word":
+            tokens.append((_unquote(match.group()), False))
+    return tokens
+
+def _unquote_part(match):
+    single, double, escaped = match.groups()
+    if single is not None:
+        return single
+    if double is not None:
+        return _ESCAPE.sub(r"\1", double)
+    return escaped
+
+def _unquote(word):
+    return _QUOTED.sub(_unquote_part, word)
+
+# Group tokens into simple commands: each is a list of words, redirections removed.
+# Subshells and $(...) substitutions become commands of their own.
+def split_commands(tokens, result):
+    commands = []
+    stack = []
+    current = []
+    previous = None
+    arithmetic = 0  # open parentheses of a $(( ... )) expression, which is skipped
+    for token, is_operator in tokens:
+        if arithmetic:
+            if is_operator and "(" in token:
+                arithmetic += token.count("(")
+            elif token == ")":
+                arithmetic -= 1
+            previous = token
+            continue
+        if previous in REDIRECTIONS:
+            if not is_operator:
+                previous = token
+                continue
+            if token not in ("$(", "$(("):
+                result.problems.append(f"missing target after '{previous}'")
+        if not is_operator:
+            current.append(token)
+        elif token == "$((":
+            current.append("$((...))")
+            arithmetic = 2
+        elif token in ("$(", "<(", ">("):
+            # The outer command gets a placeholder argument; the inner one is checked on its own
+            current.append(token + "...)")
+            stack.append(current)
+            current = []
+        elif token == "(":
+            if current:
+                result.problems.append(f"unexpected '(' after '{current[-1]}'")
+            stack.append(None)
+        elif token == ")":
+            if current:
+                commands.append(current)
+            elif previous in SEPARATORS and previous not in (";", "&"):
+                result.problems.append(f"missing command after '{previous}'")
+            if stack:
+                outer = stack.pop()
+                current = outer if outer is not None else []
+            else:
+                result.problems.append("unmatched ')'")
+                current = []
+        elif token in SEPARATORS:
+            if current:
+                commands.append(current)
+                current = []
+            elif previous != ")" and (token not in (";", "&") or previous is None or previous in SEPARATORS):
+                result.problems.append(f"missing command before '{token}'")
+        elif token in REDIRECTIONS:
+            if current and current[-1].isdigit():
+                current.pop()  # file descriptor number, as in 2>&1
+        else:
+            result.unchecked.append(f"'{token}'")  # ';;' outside a case statement
+        previous = token
+
+    if current:
+        commands.append(current)
+    if previous in REDIRECTIONS:
+        result.problems.append(f"missing target after '{previous}'")
+    if stack or arithmetic:
+        result.problems.append("unmatched '('")
+    if previous in ("|", "|&", "||", "&&"):
+        result.problems.append(f"command ends with '{previous}'")
+    return commands
+
+
+# ---- PATH index ----
+
+_path_index = None
+_path_lock = threading.Lock()
+
+def _path_dirs():
+    seen = []
+    for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        directory = directory or "."
+        if directory not in seen:
+            seen.append(directory)
+    return seen
+
+def _dir_mtimes(directories):
+    mtimes = {}
+    for directory in directories:
+        try:
+            mtimes[directory] = os.stat(directory).st_mtime
+        except OSError:
+            mtimes[directory] = None
+    return mtimes
+
+def _scan_path(directories):
+    commands = {}
+    for directory in directories:
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name in commands:
+                continue  # the first directory on PATH wins, as in the shell
+            try:
+                if entry.is_file() and os.access(entry.path, os.X_OK):
+                    commands[entry.name] = entry.path
+            except OSError:
+                pass
+    return commands
+
+# Executables on PATH by name. Kept in memory and in data/path_index.json, and rebuilt
+# when PATH changes or a PATH directory's mtime shows a program was added or removed.
+def path_index():
+    global _path_index
+    directories = _path_dirs()
+    mtimes = _dir_mtimes(directories)
+    with _path_lock:
+        if _path_index and _path_index["mtimes"] == mtimes:
+            return _path_index["commands"]
+        try:
+            with open(PATH_INDEX_FILE, 'r') as file:
+                stored = json.load(file)
+            if stored.get("mtimes") == mtimes:
+                _path_index = stored
+                return stored["commands"]
+        except (OSError, ValueError, AttributeError):
+            pass
+        _path_index = {"mtimes": mtimes, "commands": _scan_path(directories)}
+        _write_json(PATH_INDEX_FILE, _path_index)
+        return _path_index["commands"]
+
+def _write_json(path, data):
+    try:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as file:
+            json.dump(data, file)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+# ---- option tables ----
+
+# Options documented in a help or man text: option lines are those starting with '-'
+def parse_options(text, pattern=_OPTION):
+    short, long, words, takes_arg, optional_arg = set(), set(), set(), set(), set()
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped.startswith("-"):
+            continue
+        found = pattern.findall(stripped.split("  ")[0] if "   " in stripped else stripped)
+        line_takes_arg = any(arg and arg not in ("[=", "[") for option, arg in found if option.startswith("--"))
+        for option, arg in found:
+            if option.startswith("--"):
+                long.add(option)
+            elif len(option) == 2:
+                short.add(option[1])
+            else:
+                words.add(option)
+            if arg == "[" and len(option) == 2:
+                optional_arg.add(option)   # "-i[SUFFIX]": a value only when attached
+            elif (arg and arg not in ("[=", "[")) or (len(option) == 2 and line_takes_arg):
+                takes_arg.add(option)
+    for letters in _BUNDLE.findall(text):
+        short.update(letters)
+    for letter in _WITH_ARG.findall(text):
+        short.add(letter)
+        takes_arg.add(f"-{letter}")
+    return {"short": "".join(sorted(short)), "long": sorted(long), "words": sorted(words),
+            "takes_arg": sorted(takes_arg - optional_arg), "optional_arg": sorted(optional_arg)}
+
+# Subcommands listed in help output when the usage line shows a COMMAND placeholder
+def parse_subcommands(text):
+    head = "\n".join(text.strip().splitlines()[:8])
+    if not _USAGE_COMMAND.search(head):
+        return None
+    names = set()
+    for line in text.splitlines():
+        match = _SUBCOMMAND.match(line)
+        if match:
+            names.add(match.group(1))
+    return sorted(names)
+
+def build_option_entry(name, path, probe_help=True):
+    tags = man_index.option_tags(name)
+    # --help only when there is no man page, and never for the user's own scripts
+    helped = man_index.help_text(name, path) if probe_help and man_index.may_probe_help(name, path) else ""
+    entry = parse_options(helped)
+    from_man = parse_options("\n".join(tags or []), _MAN_OPTION)
+    for key in ("long", "words", "takes_arg", "optional_arg"):
+        entry[key] = sorted(set(entry[key]) | set(from_man[key]))
+    entry["short"] = "".join(sorted(set(entry["short"]) | set(from_man["short"])))
+    entry["subcommands"] = parse_subcommands(helped) if helped else None
+    # A man page whose synopsis takes a command ("git [-C <path>] <command> [<args>]"): the
+    # options after it belong to the subcommand
+    manual = man_index.page(name) if tags is not None else None
+    entry["takes_command"] = bool(manual and _USAGE_COMMAND.search(manual["synopsis"]))
+    # A page listing nothing but --help and --version does not say which options exist
+    documented_options = set().union(*(man_index.tag_options(tag) for tag in tags or [])) - GENERIC_OPTIONS
+    entry["documented"] = bool(documented_options) or bool(helped)
+    return entry
+
+_option_table = None
+_option_lock = threading.Lock()
+
+# Option table entry for an executable, parsed on first use and cached in data/option_table.json
+# until the executable changes (its size and mtime move on a package upgrade)
+def option_entry(name, path, probe_help=True):
+    global _option_table
+    try:
+        stat = os.stat(path)
+        stamp = [path, stat.st_size, int(stat.st_mtime), OPTION_TABLE_VERSION, man_index.INDEX_VERSION]
+    except OSError:
+        return None
+    with _option_lock:
+        if _option_table is None:
+            try:
+                with open(OPTION_TABLE_FILE, 'r') as file:
+                    _option_table = json.load(file)
+            except (OSError, ValueError):
+                _option_table = {}
+        entry = _option_table.get(name)
+        if entry and entry.get("stamp") == stamp:
+            return entry
+    entry = build_option_entry(name, path, probe_help)
+    entry["stamp"] = stamp
+    with _option_lock:
+        _option_table[name] = entry
+        _write_json(OPTION_TABLE_FILE, _option_table)
+    return entry
+
+
+# ---- checking ----
+
+# Options after a subcommand are checked against its own man page ("git-commit" for
+# "git commit"), and left unchecked when it has none
+def _check_subcommand(name, subcommand, words, path, result):
+    if not any(w.startswith("-") and w != "-" for w in words):
+        return
+    entry = None
+    if _SUBCOMMAND_WORD.fullmatch(subcommand) and man_index.man_page_path(f"{name}-{subcommand}"):
+        entry = option_entry(f"{name}-{subcommand}", path, probe_help=False)
+    if not entry or not entry.get("documented"):
+        result.unchecked.append(f"options of '{name} {subcommand}'")
+        return
+    _check_flags(f"{name} {subcommand}", words, entry, result, path)
+
+def _check_flags(name, words, entry, result, path):
+    short = set(entry["short"])
+    long = set(entry["long"])
+    single_dash_words = set(entry["words"])
+    takes_arg = set(entry["takes_arg"])
+    optional_arg = set(entry.get("optional_arg", ()))
+    subcommands = entry.get("subcommands")
+    skip_next = False
+    positional = None
+    for index, word in enumerate(words):
+        if skip_next:
+            skip_next = False
+            continue
+        if word == "--":
+            break
+        if word == "-" or not word.startswith("-"):
+            if positional is None:
+                positional = word
+                if subcommands is not None:
+                    if word not in subcommands:
+                        result.unchecked.append(f"'{name} {word}'")
+                    else:
+                        # Options after a subcommand belong to the subcommand
+                        if any(w.startswith("-") and w != "-" for w in words[index + 1:]):
+                            result.unchecked.append(f"options of '{name} {word}'")
+                    return
+                if entry.get("takes_command"):
+                    _check_subcommand(name, word, words[index + 1:], path, result)
+                    return
+            continue
+        if word.startswith("--"):
+            option, has_value = word.split("=", 1)[0], "=" in word
+            if option not in long:
+                matches = [o for o in long if o.startswith(option)]
+                if len(matches) == 1:
+                    option = matches[0]  # unambiguous abbreviation, as getopt_long allows
+                else:
+                    close = difflib.get_close_matches(option, long, n=1, cutoff=0.7)
+                    hint = f" (did you mean '{close[0]}'?)" if close else ""
+                    result.problems.append(f"'{name}' has no option '{option}'{hint}")
+                    continue
+            skip_next = option in takes_arg and not has_value
+            continue
+        if word.split("=", 1)[0] in single_dash_words:
+            skip_next = word in takes_arg
+            continue
+        if word[1:].isdigit():
+            result.unchecked.append(f"'{name} {word}'")
+            continue
+        for position, letter in enumerate(word[1:], start=1):
+            if letter not in short:
+                result.problems.append(f"'{name}' has no option '-{letter}'")
+                break
+            if f"-{letter}" in optional_arg:
+                break  # the rest of the bundle is its value
+            if f"-{letter}" in takes_arg:
+                # The rest of the bundle is the argument, or else the next word is
+                skip_next = position == len(word) - 1
+                break
+
+# The program a simple command runs and its arguments, past variable assignments and
+# wrappers such as sudo. Returns (None, wrapper) when wrapper options hide the program.
+def command_name(words):
+    i = 0
+    while i < len(words) and _ASSIGNMENT.match(words[i]):
+        i += 1
+    while i < len(words) and words[i] in WRAPPERS:
+        wrapper = words[i]
+        i += 1
+        if i < len(words) and words[i].startswith("-"):
+            # Wrapper options may take values, so the wrapped command cannot be located
+            return None, wrapper
+        while wrapper == "env" and i < len(words) and _ASSIGNMENT.match(words[i]):
+            i += 1
+    if i >= len(words):
+        return None, None
+    return words[i], words[i + 1:]
+
+def _check_command(words, result, probe_help):
+    name, args = command_name(words)
+    if name is None:
+        if args:
+            result.unchecked.append(f"'{args}' options")
+        return
+
+    if name in SHELL_KEYWORDS:
+        result.unchecked.append(f"shell syntax '{name}'")
+        return
+    if name in SHELL_BUILTINS:
+        return
+    if any(c in name for c in "$`*?[{~"):
+        result.unchecked.append(f"'{name}'")
+        return
+    if "/" in name:
+        if not (os.path.isfile(name) and os.access(name, os.X_OK)):
+            result.problems.append(f"'{name}' is not an executable file")
+            return
+        path = name
+        name = os.path.basename(name)
+    else:
+        commands = path_index()
+        path = commands.get(name)
+        if path is None:
+            close = difflib.get_close_matches(name, commands.keys(), n=3, cutoff=0.75)
+            hint = f" (did you mean {', '.join(repr(c) for c in close)}?)" if close else ""
+            result.problems.append(f"'{name}' is not an installed command{hint}")
+            return
+
+    if not args:
+        return
+    entry = option_entry(name, path, probe_help)
+    if not entry or not entry.get("documented"):
+        if any(a.startswith("-") and a != "-" for a in args):
+            result.unchecked.append(f"options of '{name}'")
+        return
+    _check_flags(name, args, entry, result, path)
+
+# Check a command line locally: tokens, executables on PATH and documented options
+def check(command_text):
+    _, probe_help = load_syntax_settings()
+    result = CheckResult()
+    with timings.span("syntax_check"):
+        try:
+            tokens = tokenize(command_text)
+        except ValueError as e:
+            result.problems.append(str(e).lower())
+            return result
+        if not tokens:
+            result.problems.append("empty command")
+            return result
+        for words in split_commands(tokens, result):
+            _check_command(words, result, probe_help)
+    return result
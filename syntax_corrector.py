@@ -1,55 +1,35 @@
-import json
-import os
-import requests
+from . import providers, syntax_checker
 
 # Constants
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-API_KEY_FILE = os.path.join(DATA_DIR, 'api_key.json')
-
-# Load Gemini API key
-def load_api_key():
-    with open(API_KEY_FILE, 'r') as file:
-        keys = json.load(file)
-    return keys.get("gemini_api_key")
-
-API_KEY = load_api_key()
+VALID_REPLY = "Command looks correct."
+
+# Build the Gemini prompt; problems found by the local check are passed on as hints
+def build_prompt(command_text, problems=None):
+    prompt = f"As a Linux terminal expert, check the following command for syntax errors: '{command_text}'. If it's valid, reply '{VALID_REPLY}'. If not, reply with the corrected command syntax only."
+    if problems:
+        prompt += f" A local check found: {'; '.join(problems)}."
+    return prompt
+
+# Check a command locally; returns VALID_REPLY when it is clearly valid, else the problems found
+def precheck(command_text):
+    enabled, _ = syntax_checker.load_syntax_settings()
+    if not enabled:
+        return None, None
+    result = syntax_checker.check(command_text)
+    if result.verdict == "valid":
+        return VALID_REPLY, None
+    return None, result.problems
 
 # Command syntax correction function
 def correct_command(command_text):
     print("[+] Checking command syntax...")
 
-    if not API_KEY:
-        print("Error: Gemini API key not found. Run installer first.")
+    # Commands that tokenize cleanly, resolve on PATH and use documented options are answered locally
+    answer, problems = precheck(command_text)
+    if answer:
+        print("\nSyntax Check Result (local check):\n")
+        print(answer)
         return
 
-    # Gemini API call setup
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": f"As a Linux terminal expert, check the following command for syntax errors: '{command_text}'. If it's valid, reply 'Command looks correct.'. If not, reply with the corrected command syntax only."
-                    }
-                ]
-            }
-        ]
-    }
-
-    response = requests.post(f"{url}?key={API_KEY}", headers=headers, json=payload)
-
-    if response.status_code == 200:
-        result = response.json()
-        try:
-            correction = result['candidates'][0]['content']['parts'][0]['text']
-            print("\nSyntax Check Result:\n")
-            print(correction)
-        except (KeyError, IndexError):
-            print("Error: Unexpected API response format.")
-    else:
-        print(f"Error: API request failed — Status Code {response.status_code}")
-        print(response.text)
+    prompt = build_prompt(command_text, problems)
+    providers.print_answer(prompt, "Syntax Check Result", "syntax")
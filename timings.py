@@ -0,0 +1,199 @@
+import fcntl
+import os
+import re
+import sys
+import threading
+import time
+from . import settings_manager
+
+# Constants
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+METRIC = "cli_manager_stage_duration_seconds"
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_SAMPLE = re.compile(
+    r'^' + METRIC + r'_(bucket|sum|count)\{command="([^"]*)",stage="([^"]*)"(?:,le="([^"]+)")?\} (\S+)$'
+)
+
+# Number of threads currently collecting spans. While it is zero, span() is a single
+# global check returning a shared no-op object, so instrumentation costs next to nothing.
+_active = 0
+_active_lock = threading.Lock()
+_local = threading.local()
+
+
+class _NullSpan:
+    """Span used while timing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Times one stage and records it in the calling thread's span list"""
+
+    def __init__(self, name, spans):
+        self.name = name
+        self.spans = spans
+
+    def __enter__(self):
+        self.depth = _local.depth
+        _local.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _local.depth -= 1
+        self.spans.append((self.name, self.depth, self.start, elapsed))
+        return False
+
+
+# Time a stage: `with timings.span("http"): ...`
+def span(name):
+    if not _active:
+        return _NULL_SPAN
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return _NULL_SPAN
+    return _Span(name, spans)
+
+# Whether the current thread is collecting spans
+def enabled():
+    return bool(_active) and getattr(_local, "spans", None) is not None
+
+# Record a stage measured elsewhere (e.g. server time reported by the HTTP library)
+def record(name, seconds):
+    if not _active:
+        return
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append((name, _local.depth, time.perf_counter() - seconds, seconds))
+
+# Seconds since this process was started, from /proc (None where unavailable)
+def process_age():
+    try:
+        with open("/proc/self/stat", 'r') as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", 'r') as file:
+            uptime = float(file.read().split()[0])
+        return max(uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"), 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Start collecting spans for the current thread; startup is the time spent before this call
+def start(include_startup=True):
+    global _active
+    with _active_lock:
+        _active += 1
+    _local.spans = []
+    _local.depth = 0
+    _local.started = time.perf_counter()
+    if include_startup:
+        age = process_age()
+        if age is not None:
+            _local.spans.append(("startup", 0, _local.started - age, age))
+
+# Stop collecting and return the recorded spans in start order plus the total duration
+def stop():
+    global _active
+    spans = getattr(_local, "spans", None)
+    if spans is None:
+        return [], 0.0
+    _local.spans = None
+    with _active_lock:
+        _active -= 1
+    spans.sort(key=lambda item: item[2])
+    first = min([item[2] for item in spans] + [_local.started])
+    return spans, time.perf_counter() - first
+
+# Print a per-stage breakdown of a command
+def print_breakdown(spans, total, out=None):
+    out = out or sys.stdout
+    print("\n[Timings]\n", file=out)
+    print(f"{'stage':<28}{'ms':>10}{'%':>8}", file=out)
+    for name, depth, _, elapsed in spans:
+        share = elapsed / total * 100 if total else 0
+        print(f"{'  ' * depth + name:<28}{elapsed * 1000:>10.1f}{share:>7.1f}%", file=out)
+    print(f"{'total':<28}{total * 1000:>10.1f}", file=out)
+
+# Read the metrics export settings (file path and format)
+def load_metrics_settings():
+    settings = settings_manager.snapshot()
+    path = settings.get("metrics_file") or None
+    fmt = settings.get("metrics_format", "prometheus")
+    return (os.path.expanduser(path) if path else None), fmt
+
+def _read_histograms(path):
+    histograms = {}
+    try:
+        with open(path, 'r') as file:
+            lines = file.readlines()
+    except OSError:
+        return histograms
+    for line in lines:
+        match = _SAMPLE.match(line.strip())
+        if not match:
+            continue
+        kind, command, stage, le, value = match.groups()
+        entry = histograms.setdefault((command, stage), {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        if kind == "sum":
+            entry["sum"] = float(value)
+        elif kind == "count":
+            entry["count"] = int(float(value))
+        elif le != "+Inf":
+            try:
+                entry["buckets"][BUCKETS.index(float(le))] = int(float(value))
+            except ValueError:
+                pass
+    return histograms
+
+def _format_histograms(histograms, fmt):
+    lines = [
+        f"# HELP {METRIC} Time spent in each stage of a cli-manager command.",
+        f"# TYPE {METRIC} histogram"
+    ]
+    if fmt == "openmetrics":
+        lines.append(f"# UNIT {METRIC} seconds")
+    for (command, stage), entry in sorted(histograms.items()):
+        labels = f'command="{command}",stage="{stage}"'
+        for bound, count in zip(BUCKETS, entry["buckets"]):
+            lines.append(f'{METRIC}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{METRIC}_bucket{{{labels},le="+Inf"}} {entry["count"]}')
+        lines.append(f'{METRIC}_sum{{{labels}}} {entry["sum"]:.6f}')
+        lines.append(f'{METRIC}_count{{{labels}}} {entry["count"]}')
+    if fmt == "openmetrics":
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+# Merge one command's spans into the cumulative histograms in a node exporter textfile.
+# The file is shared by every user on the machine, so updates are locked and atomic.
+def export_metrics(command, spans, total, path, fmt="prometheus"):
+    stages = [(name, elapsed) for name, _, _, elapsed in spans] + [("total", total)]
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path + ".lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            histograms = _read_histograms(path)
+            for stage, elapsed in stages:
+                entry = histograms.setdefault((command, stage), {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+                for i, bound in enumerate(BUCKETS):
+                    if elapsed <= bound:
+                        entry["buckets"][i] += 1
+                entry["sum"] += elapsed
+                entry["count"] += 1
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as file:
+                file.write(_format_histograms(histograms, fmt))
+            os.chmod(tmp, 0o664)
+            os.replace(tmp, path)
+    except OSError:
+        # Metrics must never break the command itself
+        return False
+    return True